@@ -0,0 +1,8 @@
+"""
+Runs the command line converter when the directory is run as a script: python htmltables2excel <inputs>. See cli.py.
+"""
+import sys
+
+from cli import main
+
+sys.exit(main(sys.argv[1:]))
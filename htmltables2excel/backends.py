@@ -0,0 +1,333 @@
+"""
+HTML parser backends. Every backend reduces the page to the raw tables described in cells.py, so the choice of parser
+changes how fast a page is parsed but not the parsed cells.
+
+    'html.parser': BeautifulSoup with python's html.parser. The slowest, but has no extra dependencies.
+    'lxml': lxml.html, a C parser. Requires lxml.
+    'selectolax': selectolax with the lexbor engine, a C HTML5 parser. Requires selectolax.
+    'stream': stream_parser, rows are parsed as they are used so the page is never held as a tree.
+
+Every backend reads malformed tables the way browsers do, so they give the same raw tables for them too:
+
+    an unclosed td, th or tr ends at the next cell or row
+    text in a row but outside its cells is not part of any cell
+    the text of script and style tags and of CDATA sections is not part of a cell or caption
+    when a tag repeats an attribute the first value is kept
+
+A page of bytes is decoded with the encoding it declares, see table_index.page_encoding().
+
+The stream parser cannot look ahead, so a caption that comes after the first body row is only known once the body
+rows have been read, like the footers. The tree backends know it from the start. A table dict made from a stream
+(cells.parse_raw_table()) has no caption in that case.
+
+Only top level tables are returned. Rows are the tr tags that belong to the table, in thead, tbody, tfoot or directly
+in the table, and cells are the th and td tags of each row.
+"""
+from collections import deque
+
+import six
+
+from cells import clean_text, parse_raw_table
+from sources import is_file_source, open_page, read_page
+from stream_parser import iter_raw_tables as stream_raw_tables
+from table_index import TableSelector, iter_fragments, page_encoding, select_tables
+
+DEFAULT_PARSER = 'html.parser'
+
+
+class RawTable(object):
+    """A raw table whose rows have all been read from a parsed tree. Body rows are released as they are read."""
+
+    def __init__(self, attrs, caption, headers, body, footers):
+        self.attrs = attrs
+        self.caption = caption
+        self.headers = headers
+        self.body = deque(body)
+        self.footers = footers
+
+    def rows(self):
+        while self.body:
+            yield self.body.popleft()
+
+    def drain(self):
+        pass
+
+
+def make_raw_table(attrs, caption, rows):
+    """
+    :param attrs: the table attributes
+    :param caption: the caption text or None
+    :param rows: a list of (section, row) tuples in document order
+    :return: a RawTable
+    """
+    sections = {'thead': [], 'tbody': [], 'tfoot': []}
+    for section, row in rows:
+        sections.get(section, sections['tbody']).append(row)
+    return RawTable(attrs, caption, sections['thead'], sections['tbody'], sections['tfoot'])
+
+
+def split_class(attrs):
+    if 'class' in attrs and not isinstance(attrs['class'], list):
+        attrs['class'] = attrs['class'].split()
+    return attrs
+
+
+# BeautifulSoup ----------------------------------------------------------------------------------------------------
+SECTIONS = ('thead', 'tbody', 'tfoot')
+
+
+def _soup_strings(node, strings, Tag, text_types):
+    """Appends the text nodes inside node, skipping comments, CDATA sections, scripts and styles."""
+    for child in node.children:
+        if isinstance(child, Tag):
+            if child.name not in ('script', 'style'):
+                _soup_strings(child, strings, Tag, text_types)
+        elif type(child) in text_types:
+            strings.append(child)
+    return strings
+
+
+def _soup_row(tr, Tag, text_types):
+    """
+    Reads the cells of a row. html.parser does not close a cell or a row at the next one, so an unclosed cell holds the
+    cells after it and an unclosed row the rows after it. Each nested cell is made a cell of its own, and nested rows
+    are left to be read as rows. Text outside the cells, including the text of a cell after a nested cell, which a
+    browser moves out of the table, is skipped.
+
+    :return: a list of (tag, attrs, text)
+    """
+    cells = []
+
+    def walk(node, strings):
+        """
+        :param strings: where the text of node goes, None to skip it
+        :return: True if a cell started inside node, which closes the cell node is in
+        """
+        started = False
+        for child in node.children:
+            if isinstance(child, Tag):
+                name = child.name
+                if name in ('td', 'th'):
+                    cells.append((name, dict(child.attrs), []))
+                    walk(child, cells[-1][2])
+                    started = True
+                    strings = None
+                elif name == 'table':
+                    # The text of a nested table is part of the cell
+                    if strings is not None:
+                        _soup_strings(child, strings, Tag, text_types)
+                elif name not in ('tr', 'script', 'style'):
+                    if walk(child, strings):
+                        started = True
+                        strings = None
+            elif strings is not None and type(child) in text_types:
+                strings.append(child)
+        return started
+
+    walk(tr, None)
+    return [(tag, attrs, clean_text(strings)) for tag, attrs, strings in cells]
+
+
+def _soup_section(tr):
+    parent = tr.parent
+    while parent is not None and parent.name not in SECTIONS and parent.name != 'table':
+        parent = parent.parent
+    return parent.name if parent is not None else 'tbody'
+
+
+def soup_raw_tables(html, features):
+    from bs4 import BeautifulSoup, NavigableString, Tag
+
+    # Only plain text, not comments, CDATA sections or the text of scripts and styles
+    text_types = (NavigableString,)
+    soup = BeautifulSoup(html, features, on_duplicate_attribute='ignore')
+    for table in soup.find_all('table'):
+        if table.find_parent('table') is not None:
+            continue
+
+        caption = None
+        for child in table.children:
+            if isinstance(child, Tag) and child.name == 'caption':
+                caption = u''.join(_soup_strings(child, [], Tag, text_types))
+                break
+
+        rows = []
+        for tr in table.find_all('tr'):
+            if tr.find_parent('table') is not table:
+                continue
+            rows.append((_soup_section(tr), _soup_row(tr, Tag, text_types)))
+
+        yield make_raw_table(dict(table.attrs), caption, rows)
+
+
+def html_parser_raw_tables(html):
+    return soup_raw_tables(html, 'html.parser')
+
+
+# lxml -------------------------------------------------------------------------------------------------------------
+def _lxml_strings(element, strings):
+    """Appends the text nodes inside element, skipping comments, scripts and styles."""
+    if element.text and isinstance(element.tag, six.string_types):
+        strings.append(element.text)
+    for child in element:
+        if isinstance(child.tag, six.string_types) and child.tag not in ('script', 'style'):
+            _lxml_strings(child, strings)
+        if child.tail:
+            strings.append(child.tail)
+    return strings
+
+
+def _lxml_owner(element):
+    for ancestor in element.iterancestors('table'):
+        return ancestor
+    return None
+
+
+def lxml_raw_tables(html):
+    import lxml.html
+
+    root = lxml.html.document_fromstring(html)
+    for table in root.iter('table'):
+        if _lxml_owner(table) is not None:
+            continue
+
+        caption = None
+        for child in table:
+            if child.tag == 'caption':
+                caption = u''.join(_lxml_strings(child, []))
+                break
+
+        rows = []
+        for tr in table.iter('tr'):
+            if _lxml_owner(tr) is not table:
+                continue
+            row = []
+            for cell in tr:
+                if cell.tag in ('td', 'th'):
+                    row.append((cell.tag, split_class(dict(cell.attrib)), clean_text(_lxml_strings(cell, []))))
+            rows.append((tr.getparent().tag, row))
+
+        yield make_raw_table(split_class(dict(table.attrib)), caption, rows)
+
+
+# selectolax -------------------------------------------------------------------------------------------------------
+def _selectolax_owner(node):
+    parent = node.parent
+    while parent is not None:
+        if parent.tag == 'table':
+            return parent.mem_id
+        parent = parent.parent
+    return None
+
+
+def _selectolax_attrs(node):
+    attrs = {}
+    for key, value in node.attributes.items():
+        attrs[key] = value if value is not None else u''
+    return split_class(attrs)
+
+
+def selectolax_raw_tables(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    # lexbor decodes bytes as utf-8 whatever the page declares
+    encoding = page_encoding(html)
+    if encoding is not None:
+        html = html.decode(encoding, 'replace')
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(['script', 'style'])
+    for table in tree.css('table'):
+        if _selectolax_owner(table) is not None:
+            continue
+
+        caption = None
+        for child in table.iter():
+            if child.tag == 'caption':
+                caption = child.text(deep=True, separator=u'')
+                break
+
+        rows = []
+        for tr in table.css('tr'):
+            if _selectolax_owner(tr) != table.mem_id:
+                continue
+            row = []
+            for cell in tr.iter():
+                if cell.tag in ('td', 'th'):
+                    row.append((cell.tag, _selectolax_attrs(cell), cell.text(deep=True, separator=u'', strip=True)))
+            rows.append((tr.parent.tag, row))
+
+        yield make_raw_table(_selectolax_attrs(table), caption, rows)
+
+
+BACKENDS = {
+    'html.parser': html_parser_raw_tables,
+    'lxml': lxml_raw_tables,
+    'selectolax': selectolax_raw_tables,
+    'stream': stream_raw_tables,
+}
+# Backends that read a file in chunks, see sources.py. The others are given the whole page.
+STREAMING_BACKENDS = {'stream'}
+
+
+def register_backend(name, func, streaming=False):
+    """
+    :param name: the name used to select the backend
+    :param func: func(html) -> iterable of raw tables, see cells.py
+    :param streaming: func also takes a file, see sources.py
+    """
+    BACKENDS[name] = func
+    if streaming:
+        STREAMING_BACKENDS.add(name)
+    else:
+        STREAMING_BACKENDS.discard(name)
+
+
+def iter_raw_tables(html, excluded_tables=None, parser=None, include_tables=None):
+    """
+    When tables are selected or excluded, the page is indexed first (see table_index.py) and only the html of the
+    selected tables is handed to the backend.
+
+    :param html: the page: text, bytes or a file (a path, a binary file object or an mmap, see sources.py)
+    :param excluded_tables: a list of tables to skip: ids or the selectors of table_index.py
+    :param parser: the name of the backend, defaults to html.parser
+    :param include_tables: None for every table, or a list of the tables to read, see table_index.py
+    :return: a generator of raw tables
+    """
+    parser = parser or DEFAULT_PARSER
+    try:
+        backend = BACKENDS[parser]
+    except KeyError:
+        raise ValueError('Unknown parser: {}. Choose from: {}'.format(parser, ', '.join(sorted(BACKENDS))))
+
+    selector = TableSelector(include_tables, excluded_tables)
+    if selector.selects_all:
+        if is_file_source(html) and parser not in STREAMING_BACKENDS:
+            html = read_page(html)
+        for table in backend(html):
+            yield table
+    elif isinstance(html, (six.text_type, six.binary_type)) or is_file_source(html):
+        with open_page(html) as page:
+            for fragment in iter_fragments(page, select_tables(page, include_tables, excluded_tables)):
+                for table in backend(fragment):
+                    yield table
+    else:
+        for position, table in enumerate(backend(html)):
+            if selector.matches(position, table.attrs):
+                yield table
+            else:
+                table.drain()
+
+
+def parse_tables(html, excluded_tables=None, parser=None, infer_types=False, include_tables=None):
+    """
+    :param infer_types: parse the body rows by inferred column type, see type_inference.py
+    :return: a generator of table dicts ready for PageToExcel, see cells.parse_raw_table()
+    """
+    if infer_types:
+        from type_inference import parse_raw_table_typed
+
+    for table in iter_raw_tables(html, excluded_tables, parser, include_tables):
+        if infer_types:
+            yield parse_raw_table_typed(table)
+        else:
+            yield parse_raw_table(table)
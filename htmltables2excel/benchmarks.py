@@ -0,0 +1,312 @@
+"""
+Benchmarks for the parse and write phases, on synthetic pages.
+
+make_page() generates tables of any size with a chosen mix of money, percent, number and text cells, colspans,
+data-excel formulas and inline styles. run_benchmarks() times each phase and measures its peak memory with tracemalloc
+(in a separate run, since tracing slows the code down) and the results are saved as JSON to compare between runs:
+
+    python benchmarks.py --rows 20000 --cols 12 --tables 2 --out after.json --compare before.json
+
+import_times() times importing each module in a new interpreter, against IMPORT_BUDGETS, and lists the heavy modules
+(HEAVY_MODULES) it imported. The exit status is 1 when a module is over its budget or imports a heavy module:
+
+    python benchmarks.py --imports-only
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import backends
+from cells import read_table
+from convert_tables import PageToExcel, parse_row
+from formulas import compile_formula, make_formula
+from page_to_csv import stream_csv
+
+DEFAULT_CONFIG = {
+    'rows': 5000,
+    'cols': 10,
+    'tables': 2,
+    # The mix of cell values, by weight
+    'money': 3,
+    'percent': 1,
+    'number': 2,
+    'text': 2,
+    # The share of body cells with colspan 2, a data-excel formula or an inline style
+    'colspan_density': 0.02,
+    'formula_density': 0.05,
+    'style_density': 0.1,
+    'parsers': ['html.parser', 'stream'],
+    'formula_calls': 100000,
+    'repeat': 3,
+    'seed': 1,
+}
+
+# The most seconds importing each module may take in a new interpreter. Import times vary a lot from run to run, so
+# the budgets are about twice the usual best time; HEAVY_MODULES is what keeps the lazy imports lazy.
+IMPORT_BUDGETS = {
+    'convert_tables': 0.12,
+    'page_to_csv': 0.08,
+    'stream_parser': 0.06,
+    'formulas': 0.04,
+    'exporters': 0.15,
+    'columnar': 0.1,
+}
+# Modules that importing the modules in IMPORT_BUDGETS should not import. They are imported when first used.
+HEAVY_MODULES = ('bs4', 'xlsxwriter', 'lxml', 'selectolax', 'django', 'unittest', 'concurrent.futures.process',
+                 'pyarrow', 'pandas', 'logging')
+
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(seconds)
+print(' '.join(x for x in {heavy!r} if x in sys.modules))
+'''
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'Total', 'North', 'South', 'Labor', 'Revenue', 'misc']
+STYLES = ['text-align: right', 'font-weight: bold', 'color: #336699', 'background-color: #eeeeee']
+FORMULAS = ['SUM ROW A-C', 'SUM ROW A,C', 'FORMULA RELATIVE IF(colm001rowp000 > 0, colm001rowp000/colm002rowp000, 0)']
+
+
+def make_value(rnd, config):
+    kinds = ['money', 'percent', 'number', 'text']
+    kind = rnd.choices(kinds, [config[x] for x in kinds])[0]
+    if kind == 'money':
+        return '${:,.2f}'.format(rnd.uniform(0, 100000))
+    elif kind == 'percent':
+        return '{:.2f}%'.format(rnd.uniform(0, 100))
+    elif kind == 'number':
+        return '{:,}'.format(rnd.randint(0, 10 ** 6))
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3)))
+
+
+def make_row(rnd, config):
+    cells = []
+    col = 0
+    while col < config['cols']:
+        attrs = ''
+        if col + 1 < config['cols'] and rnd.random() < config['colspan_density']:
+            attrs += ' colspan="2"'
+            col += 1
+        if col > 2 and rnd.random() < config['formula_density']:
+            attrs += ' data-excel="{}"'.format(rnd.choice(FORMULAS))
+        if rnd.random() < config['style_density']:
+            attrs += ' style="{}"'.format(rnd.choice(STYLES))
+        cells.append('<td{}>{}</td>'.format(attrs, make_value(rnd, config)))
+        col += 1
+    return '<tr>{}</tr>'.format(''.join(cells))
+
+
+def make_table(rnd, config, table_id):
+    """
+    :return: the html of a table with a caption, a header row, config['rows'] body rows and a footer row of SUM COL
+        formulas
+    """
+    parts = ['<table id="{}" class="table"><caption>Table {}</caption><thead><tr>'.format(table_id, table_id)]
+    parts.extend('<th>Col {}</th>'.format(i) for i in range(config['cols']))
+    parts.append('</tr></thead>\n<tbody>\n')
+    for _ in range(config['rows']):
+        parts.append(make_row(rnd, config))
+        parts.append('\n')
+    parts.append('</tbody><tfoot><tr>')
+    parts.extend('<td data-excel="SUM COL">0</td>' for _ in range(config['cols']))
+    parts.append('</tr></tfoot></table>\n')
+    return ''.join(parts)
+
+
+def make_page(config=None):
+    """
+    :param config: changes to DEFAULT_CONFIG
+    :return: the html of a page with config['tables'] tables
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    rnd = random.Random(config['seed'])
+    tables = [make_table(rnd, config, 't{}'.format(i + 1)) for i in range(config['tables'])]
+    return '<html><body>\n{}</body></html>'.format(''.join(tables))
+
+
+def measure(func, repeat=1):
+    """
+    :param func: the code to measure, called with no args
+    :param repeat: how many timed runs. The best time is kept.
+    :return: {'seconds': best time, 'peak_bytes': peak memory allocated while running func}
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'peak_bytes': peak}
+
+
+def import_time(module, repeat=5):
+    """
+    :param module: the name of a module of this package
+    :param repeat: how many new interpreters to import it in. The best time is kept.
+    :return: {'seconds': best time, 'heavy': the HEAVY_MODULES it imported}
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    heavy = []
+    script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=here, universal_newlines=True)
+        lines = output.split('\n')
+        times.append(float(lines[0]))
+        heavy = lines[1].split()
+    return {'seconds': min(times), 'heavy': heavy}
+
+
+def import_times(budgets=None, repeat=5):
+    """
+    :param budgets: {module: seconds}, defaults to IMPORT_BUDGETS
+    :param repeat: see import_time()
+    :return: {module: {'seconds': ..., 'heavy': [...], 'budget': seconds, 'ok': within budget and no heavy modules}}
+    """
+    results = {}
+    for module, budget in sorted((budgets or IMPORT_BUDGETS).items()):
+        result = import_time(module, repeat)
+        result['budget'] = budget
+        result['ok'] = result['seconds'] <= budget and not result['heavy']
+        results[module] = result
+    return results
+
+
+def run_benchmarks(config=None):
+    """
+    :param config: changes to DEFAULT_CONFIG
+    :return: a dict that can be saved as JSON: {'config': ..., 'python': ..., 'results': {name: measure()}}
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    html = make_page(config)
+    repeat = config['repeat']
+    results = {}
+
+    for parser in config['parsers']:
+        def parse():
+            return [read_table(x) for x in backends.parse_tables(html, parser=parser)]
+        results['parse_tables[{}]'.format(parser)] = measure(parse, repeat)
+
+    soup_rows = BeautifulSoup(html, 'html.parser').find_all('tr')
+
+    def parse_rows():
+        for row in soup_rows:
+            parse_row(row)
+    results['parse_row'] = measure(parse_rows, repeat)
+
+    def make_formulas():
+        compile_formula.cache_clear()
+        for i in range(config['formula_calls']):
+            make_formula(FORMULAS[i % len(FORMULAS)], i % 1000 + 1, 5)
+    results['make_formula'] = measure(make_formulas, repeat)
+
+    tables = [read_table(x) for x in backends.parse_tables(html, parser='stream')]
+    for constant_memory in (False, True):
+        def write():
+            # The rows are lists, so the same parsed tables can be written every time
+            PageToExcel(io.BytesIO(), tables, constant_memory=constant_memory)
+        results['write_page[constant_memory={}]'.format(constant_memory)] = measure(write, repeat)
+
+    for parser in config['parsers']:
+        def to_csv():
+            stream_csv(io.StringIO(), html, parser=parser)
+        results['page_to_csv[{}]'.format(parser)] = measure(to_csv, repeat)
+
+    return {
+        'config': config,
+        'html_bytes': len(html),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'imports': import_times(repeat=repeat),
+    }
+
+
+def compare(old, new):
+    """
+    :param old: the results of an earlier run
+    :param new: the results of this run
+    :return: lines of text with the change in time and peak memory of each benchmark
+    """
+    lines = []
+    for name, result in sorted(new['results'].items()):
+        before = old['results'].get(name)
+        if before is None:
+            lines.append('{:40} new'.format(name))
+            continue
+        lines.append('{:40} time {:+7.1%}  peak memory {:+7.1%}'.format(
+            name, result['seconds'] / max(before['seconds'], 1e-9) - 1,
+            result['peak_bytes'] / float(max(before['peak_bytes'], 1)) - 1))
+
+    for module, result in sorted(new.get('imports', {}).items()):
+        before = old.get('imports', {}).get(module)
+        if before is not None:
+            lines.append('{:40} time {:+7.1%}'.format(
+                'import ' + module, result['seconds'] / max(before['seconds'], 1e-9) - 1))
+    return lines
+
+
+def print_imports(imports):
+    """
+    :return: True if every module is within its budget and imports no heavy modules
+    """
+    for module, result in sorted(imports.items()):
+        print('{:40} {:9.3f} s  budget {:.3f} s{}{}'.format(
+            'import ' + module, result['seconds'], result['budget'], '' if result['ok'] else '  FAILED',
+            '  imports ' + ', '.join(result['heavy']) if result['heavy'] else ''))
+    return all(x['ok'] for x in imports.values())
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Benchmarks the parse and write phases on synthetic tables.')
+    for name in ('rows', 'cols', 'tables', 'formula_calls', 'repeat', 'seed'):
+        arg_parser.add_argument('--' + name, type=int, default=DEFAULT_CONFIG[name])
+    for name in ('colspan_density', 'formula_density', 'style_density'):
+        arg_parser.add_argument('--' + name, type=float, default=DEFAULT_CONFIG[name])
+    arg_parser.add_argument('--parsers', nargs='+', default=DEFAULT_CONFIG['parsers'],
+                            choices=sorted(backends.BACKENDS))
+    arg_parser.add_argument('--out', help='save the results to this JSON file')
+    arg_parser.add_argument('--compare', help='the JSON file of an earlier run to compare with')
+    arg_parser.add_argument('--imports-only', action='store_true', help='only check the import times')
+    args = arg_parser.parse_args(argv)
+
+    if args.imports_only:
+        return 0 if print_imports(import_times(repeat=args.repeat)) else 1
+
+    config = {k: v for k, v in vars(args).items() if k in DEFAULT_CONFIG}
+    results = run_benchmarks(config)
+    for name, result in sorted(results['results'].items()):
+        print('{:40} {:9.3f} s {:9.1f} MB'.format(name, result['seconds'], result['peak_bytes'] / 2.0 ** 20))
+    imports_ok = print_imports(results['imports'])
+
+    if args.compare:
+        with open(args.compare) as fp:
+            old = json.load(fp)
+        print('\nCompared with {}:'.format(args.compare))
+        print('\n'.join(compare(old, results)))
+
+    if args.out:
+        with open(args.out, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    return 0 if imports_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
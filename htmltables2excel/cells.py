@@ -0,0 +1,329 @@
+"""
+The cell model shared by the table parsers. Every parser backend reduces a page to raw tables:
+
+    attrs: the table tag attributes
+    caption: the caption text or None
+    headers: a list of the thead rows
+    rows(): a generator of the body rows
+    footers: a list of the tfoot rows, complete once rows() has been read
+    drain(): reads to the end of the table
+
+Each raw row is a list of (tag, attrs, text) tuples. The attrs match BeautifulSoup: the class is a list and valueless
+attributes are empty strings. The text is the cell strings joined by clean_text().
+
+parse_cell() turns a raw cell into the Cell the excel writer consumes. Cells are kept small so that big tables are
+cheap to hold: only the attributes the writer uses are copied, identical attribute sets are shared between cells and
+nothing refers back to the parsed HTML tree.
+"""
+import re
+
+import six
+
+# The cell attributes used when writing a cell
+KEPT_ATTRS = ('class', 'colspan', 'data-excel', 'style')
+MAX_INTERNED = 10000
+# Text values up to this length are interned, repeated text in a column is then stored once. Like attributes and
+# styles they are kept in a dict of at most MAX_INTERNED entries rather than with sys.intern(), which never frees them.
+MAX_INTERNED_TEXT = 64
+TAGS = {'td': 'td', 'th': 'th'}
+# A property name and its value, which can have quoted parts
+STYLE_RE = re.compile(r'([^:;]+):((?:[^;"\']|"[^"]*"|\'[^\']*\')*)')
+
+_interned_attrs = {}
+_interned_styles = {}
+_interned_text = {}
+
+
+def style_to_dict(style):
+    """Parses an HTML tag style attribute. Property names are lower case. Quoted values can contain ; and :
+    e.g. mso-number-format:"0.00;[Red]-0.00".
+    :param style:
+    """
+    if isinstance(style, dict):
+        return style
+
+    d = {}
+    for match in STYLE_RE.finditer(style):
+        key = match.group(1).strip().lower()
+        if key:
+            d[key] = match.group(2).strip()
+    return d
+
+
+class Style(dict):
+    """
+    A parsed style attribute, shared by every cell with the same style text, so it must not be changed. key is the same
+    for equal styles and can be used to cache what is worked out from the style.
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, *args, **kwargs):
+        super(Style, self).__init__(*args, **kwargs)
+        self.key = tuple(sorted(six.iteritems(self)))
+
+
+def intern_style(style):
+    """
+    Parses a style attribute once for each distinct style text.
+
+    :param style: the style attribute text, or a dict
+    :return: a Style
+    """
+    if isinstance(style, Style):
+        return style
+    if isinstance(style, dict):
+        return Style(style)
+
+    try:
+        return _interned_styles[style]
+    except KeyError:
+        pass
+
+    if len(_interned_styles) >= MAX_INTERNED:
+        _interned_styles.clear()
+    parsed = _interned_styles[style] = Style(style_to_dict(style))
+    return parsed
+
+
+def style_key(style):
+    """
+    :param style: None, a Style or a dict
+    :return: a hashable key for the style, None when there is no style
+    """
+    if not style:
+        return None
+    try:
+        return style.key
+    except AttributeError:
+        return tuple(sorted(six.iteritems(style)))
+
+
+def clean_text(strings):
+    """
+    Joins the text nodes of a cell the same way BeautifulSoup's stripped_strings does: each string is stripped and
+    empty strings are dropped.
+
+    :param strings: an iterable of the text nodes inside the cell
+    :return: a string
+    """
+    return u''.join([s.strip() for s in strings if s.strip()])
+
+
+def intern_attrs(attrs):
+    """
+    Copies the attributes in KEPT_ATTRS, with the style converted to a Style and empty classes removed. Cells with the
+    same attributes share the same dict, so it must not be changed.
+
+    :param attrs: the cell tag attributes
+    :return: a dict
+    """
+    key = []
+    for name in KEPT_ATTRS:
+        if name in attrs:
+            value = attrs[name]
+            if name == 'class':
+                value = tuple([x for x in value if x != ''])
+            elif isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, dict):
+                value = tuple(sorted(value.items()))
+            key.append((name, value))
+    key = tuple(key)
+
+    try:
+        return _interned_attrs[key]
+    except KeyError:
+        pass
+
+    d = {}
+    for name, value in key:
+        if name == 'class':
+            d[name] = list(value)
+        elif name == 'style':
+            d[name] = intern_style(attrs[name])
+        else:
+            d[name] = value
+
+    if len(_interned_attrs) >= MAX_INTERNED:
+        _interned_attrs.clear()
+    _interned_attrs[key] = d
+    return d
+
+
+def intern_text(s):
+    if len(s) > MAX_INTERNED_TEXT:
+        return s
+    try:
+        return _interned_text[s]
+    except KeyError:
+        pass
+
+    if len(_interned_text) >= MAX_INTERNED:
+        _interned_text.clear()
+    _interned_text[s] = s
+    return s
+
+
+class Cell(object):
+    """
+    A parsed cell. kind is 'money', 'percent', 'date' or None. text is the text of the cell when value was parsed from
+    it, e.g. u'$1,000' for 1000.0, and None when value is the text.
+
+    For compatibility with code written for the dicts cells used to be, a cell can also be read like the dict:
+    {'value': value, 'attrs': attrs, 'tag': tag, 'is_money': False}, with 'is_percent' or 'is_date' set for those kinds.
+    """
+    __slots__ = ('value', 'attrs', 'tag', 'kind', 'text')
+
+    def __init__(self, value, attrs, tag, kind=None, text=None):
+        self.value = value
+        self.attrs = attrs
+        self.tag = tag
+        self.kind = kind
+        self.text = text
+
+    @property
+    def is_money(self):
+        return self.kind == 'money'
+
+    @property
+    def is_percent(self):
+        return self.kind == 'percent'
+
+    @property
+    def is_date(self):
+        return self.kind == 'date'
+
+    def as_dict(self):
+        d = {'value': self.value, 'attrs': self.attrs, 'tag': self.tag}
+        if self.kind == 'percent':
+            d['is_percent'] = True
+        else:
+            d['is_money'] = self.kind == 'money'
+        if self.kind == 'date':
+            d['is_date'] = True
+        return d
+
+    def __getitem__(self, key):
+        if key in ('value', 'attrs', 'tag', 'is_money', 'is_percent', 'is_date'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if isinstance(other, Cell):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Cell({!r})'.format(self.as_dict())
+
+
+def make_cell(value, attrs, tag, kind=None, text=None):
+    """
+    :param value: the parsed value
+    :param attrs: the raw cell attributes, see intern_attrs()
+    :param tag: the cell tag name
+    :param kind: 'money', 'percent', 'date' or None
+    :param text: the text value was parsed from, when value is not the text
+    :return: a Cell
+    """
+    if isinstance(value, six.text_type):
+        value = intern_text(value)
+    return Cell(value, intern_attrs(attrs), TAGS.get(tag, tag), kind, text)
+
+
+def parse_cell(text, attrs, tag):
+    """
+    Converts the text of a cell to a number where possible.
+
+    :param text: the cleaned text of the cell
+    :param attrs: the cell attributes, see intern_attrs()
+    :param tag: the cell tag name (th or td)
+    :return: a Cell
+    """
+    s = six.text_type(text)
+    if s and s[0] == u'$':
+        value = s[1:].replace(u',', u'')
+        try:
+            return make_cell(float(value), attrs, tag, 'money', s)
+        except ValueError:
+            return make_cell(value, attrs, tag)
+
+    elif s and s[-1] == u'%':
+        try:
+            number = float(s[0: -1]) / 100.0
+        except ValueError:
+            number = None
+
+        if number is not None:
+            return make_cell(number, attrs, tag, 'percent', s)
+        else:
+            return make_cell(s, attrs, tag)
+
+    if s.isnumeric():
+        value = int(s)
+    else:
+        # http://stackoverflow.com/questions/736043/checking-if-a-string-can-be-converted-to-float-in-python
+        try:
+            value = float(s.replace(',', ''))
+        except ValueError:
+            return make_cell(s, attrs, tag)
+    return make_cell(value, attrs, tag, text=s)
+
+
+def parse_raw_row(row):
+    return [parse_cell(text, attrs, tag) for tag, attrs, text in row]
+
+
+def _parsed_rows(table):
+    for row in table.rows():
+        yield parse_raw_row(row)
+
+
+def _parsed_footers(table):
+    table.drain()
+    for row in table.footers:
+        yield parse_raw_row(row)
+
+
+class TableInfo(object):
+    """What is kept of the table tag once the table is parsed."""
+    __slots__ = ('attrs',)
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+
+
+def parse_raw_table(table):
+    """
+    The raw table counterpart of convert_tables.parse_table(). The result can be passed to PageToExcel.
+
+    :param table: a raw table
+    :return: a table dict. 'headers' is a list, 'rows' and 'footers' are generators that must be read in that order.
+    """
+    data = {'table': TableInfo(dict(table.attrs))}
+    if table.caption is not None:
+        data['caption'] = table.caption
+    data['headers'] = [parse_raw_row(row) for row in table.headers]
+    data['rows'] = _parsed_rows(table)
+    data['footers'] = _parsed_footers(table)
+    return data
+
+
+def read_table(data):
+    """
+    Reads the rows and footers of a table dict into lists, so the table can be used more than once.
+    """
+    data['rows'] = list(data['rows'])
+    data['footers'] = list(data['footers'])
+    return data
@@ -0,0 +1,305 @@
+"""
+Converts html files to xlsx and csv from the command line, e.g. to regenerate an archive of reports:
+
+    python htmltables2excel reports/2020-*.html --out-dir xlsx/ --exclude-table filters --workers 8
+    python htmltables2excel reports/ --table '#labor' --table .summary --format csv
+    python htmltables2excel reports/ --format xlsx csv --sheet-name Labor --sheet-name Revenue
+    curl -s https://example.com/report | python htmltables2excel - --format csv > report.csv
+
+An input is a file, a directory (its .html and .htm files) or a glob. With no inputs, or '-', the page is read from
+stdin and written to --output or to stdout. The files are converted in a process pool, one file per worker, and a line
+with the time and throughput of each file is printed to stderr.
+"""
+import argparse
+import glob
+import io
+import os
+import pathlib
+import sys
+import time
+
+import six
+
+import backends
+import metrics
+
+FORMATS = ('xlsx', 'csv')
+# The same as convert_tables.MAX_ROWS, which is not imported until a file is converted
+MAX_ROWS = 1048576
+HTML_EXTENSIONS = ('.html', '.htm')
+
+
+class _CountsObserver(metrics.Observer):
+    def __init__(self):
+        self.counts = {}
+
+    def observe(self, metrics):
+        self.counts = metrics['counts']
+
+
+def find_inputs(inputs):
+    """
+    :param inputs: files, directories and globs
+    :return: the html files, in order and without repeats
+    """
+    paths = []
+    for name in inputs:
+        if os.path.isdir(name):
+            found = sorted(os.path.join(name, x) for x in os.listdir(name) if x.lower().endswith(HTML_EXTENSIONS))
+        elif os.path.exists(name):
+            found = [name]
+        else:
+            found = sorted(glob.glob(name))
+            if not found:
+                raise ValueError('No such file: {}'.format(name))
+        for path in found:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def output_paths(path, formats, out_dir=None):
+    """
+    :param path: the html file
+    :param formats: the output formats
+    :param out_dir: the directory of the outputs, defaults to the directory of the html file
+    :return: {format: output path}
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    directory = out_dir if out_dir is not None else os.path.dirname(path)
+    return {fmt: os.path.join(directory, '{}.{}'.format(base, fmt)) for fmt in formats}
+
+
+def convert(html, outputs, options):
+    """
+    Writes a page to each output.
+
+    :param html: the page: text, bytes or a file, see sources.py
+    :param outputs: {format: a path or a file-like object}. csv takes a text stream and xlsx a binary one.
+    :param options: a dict of excluded_tables, include_tables, work_sheet_names, parser, infer_types,
+        constant_memory, spill_rows and inline_styles
+    :return: a dict: {'tables': number of tables, 'rows': number of rows}
+    """
+    kwargs = {'parser': options.get('parser'), 'excluded_tables': options.get('excluded_tables') or [],
+              'include_tables': options.get('include_tables')}
+    excel_kwargs = {'work_sheet_names': options.get('work_sheet_names'),
+                    'constant_memory': options.get('constant_memory', False),
+                    'spill_rows': options.get('spill_rows', MAX_ROWS),
+                    'inline_styles': options.get('inline_styles', True)}
+
+    if len(outputs) > 1:
+        # One parse for all the formats
+        from exporters import CsvSink, ExcelSink, export
+
+        sinks = []
+        if 'xlsx' in outputs:
+            sinks.append(ExcelSink(outputs['xlsx'], **excel_kwargs))
+        if 'csv' in outputs:
+            sinks.append(CsvSink(outputs['csv']))
+        return export(html, sinks, infer_types=options.get('infer_types', False), **kwargs)
+
+    if 'csv' in outputs:
+        from page_to_csv import page_to_csv, stream_csv
+
+        if isinstance(outputs['csv'], six.string_types):
+            return page_to_csv(outputs['csv'], html, **kwargs)
+        return stream_csv(outputs['csv'], html, **kwargs)
+
+    from convert_tables import full_page_to_excel
+
+    observer = _CountsObserver()
+    full_page_to_excel(outputs['xlsx'], html, infer_types=options.get('infer_types', False), observer=observer,
+                       **dict(kwargs, **excel_kwargs))
+    return {'tables': observer.counts.get('tables', 0), 'rows': observer.counts.get('rows', 0)}
+
+
+def convert_file(path, outputs, options):
+    """
+    Converts an html file, in a worker.
+
+    :return: a dict: {'path', 'outputs', 'bytes': size of the html, 'seconds', 'tables', 'rows'}, with 'error' instead
+        of the counts if it failed
+    """
+    start = time.perf_counter()
+    result = {'path': path, 'outputs': outputs, 'bytes': 0}
+    try:
+        result['bytes'] = os.path.getsize(path)
+        # The parser reads the file, see sources.py
+        result.update(convert(pathlib.Path(path), outputs, options))
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def throughput(result):
+    """
+    :return: a line of text with the time and throughput of a converted file
+    """
+    if 'error' in result:
+        return '{}: FAILED {}'.format(result['path'], result['error'])
+
+    seconds = max(result['seconds'], 1e-9)
+    return '{} -> {}: {} tables, {} rows, {:.1f} KB in {:.3f} s ({:.2f} MB/s, {:.0f} rows/s)'.format(
+        result['path'], ', '.join(sorted(result['outputs'].values())), result['tables'], result['rows'],
+        result['bytes'] / 1024.0, result['seconds'], result['bytes'] / seconds / 2 ** 20, result['rows'] / seconds)
+
+
+def check_outputs(jobs):
+    """
+    :param jobs: a list of (path, {format: output path}, options)
+    :raises ValueError: if two files have the same output path, as the workers would overwrite each other's files
+    """
+    seen = {}
+    for path, outputs, options in jobs:
+        for output in outputs.values():
+            key = os.path.normcase(os.path.abspath(output))
+            if key in seen:
+                raise ValueError('{} and {} would both be written to {}'.format(seen[key], path, output))
+            seen[key] = path
+
+
+def convert_files(paths, formats, options, out_dir=None, workers=None, report=None):
+    """
+    Converts html files in a process pool.
+
+    :param paths: the html files
+    :param formats: the output formats
+    :param options: see convert()
+    :param out_dir: see output_paths()
+    :param workers: the size of the pool, defaults to the number of CPUs. With 1 the files are converted here.
+    :param report: None or report(result), called with the result of each file as it is done, see convert_file()
+    :return: the results, in the order of paths
+    :raises ValueError: if two files would be written to the same output, e.g. a/report.html and b/report.html with
+        out_dir. Nothing is converted.
+    """
+    jobs = [(path, output_paths(path, formats, out_dir), options) for path in paths]
+    check_outputs(jobs)
+    results = {}
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            results[job[0]] = convert_file(*job)
+            if report is not None:
+                report(results[job[0]])
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(convert_file, *job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['path']] = result
+                if report is not None:
+                    report(result)
+    return [results[path] for path in paths]
+
+
+def convert_stdin(stdin, stdout, formats, options, output=None):
+    """
+    Converts a page read from stdin to output, or to stdout.
+
+    :return: see convert_file()
+    """
+    start = time.perf_counter()
+    html = stdin.buffer.read() if hasattr(stdin, 'buffer') else stdin.read()
+    result = {'path': '<stdin>', 'outputs': {formats[0]: output or '<stdout>'}, 'bytes': len(html)}
+    if output is not None:
+        result.update(convert(html, {formats[0]: output}, options))
+    elif formats[0] == 'csv':
+        result.update(convert(html, {'csv': stdout}, options))
+    else:
+        # A zip file can not be written to a pipe, so the workbook is made in a buffer first
+        buf = io.BytesIO()
+        result.update(convert(html, {'xlsx': buf}, options))
+        out = stdout.buffer if hasattr(stdout, 'buffer') else stdout
+        out.write(buf.getvalue())
+        out.flush()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def selector(text):
+    """
+    :return: a table selector, see table_index.py. Numbers are positions.
+    """
+    return int(text) if text.isdigit() else text
+
+
+def make_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='htmltables2excel',
+                                         description='Converts the tables of html pages to xlsx or csv.')
+    arg_parser.add_argument('inputs', nargs='*',
+                            help="html files, directories or globs. With none, or '-', the page is read from stdin.")
+    arg_parser.add_argument('--format', nargs='+', choices=FORMATS, default=['xlsx'], dest='formats',
+                            help='the output formats, default xlsx. Several formats are written from one parse.')
+    arg_parser.add_argument('--out-dir', help='where to write the outputs, default next to each input')
+    arg_parser.add_argument('-o', '--output', help='the output file for a page read from stdin, default stdout')
+    arg_parser.add_argument('--table', action='append', dest='include_tables', type=selector, metavar='SELECTOR',
+                            help='a table to convert: #id, .class or its position from 0. Can be repeated. '
+                                 'Default all the tables.')
+    arg_parser.add_argument('--exclude-table', action='append', default=[], dest='excluded_tables', type=selector,
+                            metavar='SELECTOR', help='a table to skip: id, #id, .class or its position from 0. '
+                                                     'Can be repeated.')
+    arg_parser.add_argument('--sheet-name', action='append', dest='work_sheet_names', metavar='NAME',
+                            help='the name of the next worksheet. Can be repeated, one for each table. '
+                                 'Tables past the last name are named sheet_<n>.')
+    arg_parser.add_argument('--parser', choices=sorted(backends.BACKENDS), default=backends.DEFAULT_PARSER,
+                            help='the html parser, see backends.py')
+    arg_parser.add_argument('--infer-types', action='store_true', help='parse the cells by inferred column type')
+    arg_parser.add_argument('--constant-memory', action='store_true', help="use xlsxwriter's constant_memory mode")
+    arg_parser.add_argument('--spill-rows', type=int, nargs='?', const=MAX_ROWS, default=MAX_ROWS, metavar='N',
+                            help='continue tables with more than N rows on more worksheets (default the most Excel '
+                                 'allows)')
+    arg_parser.add_argument('--no-spill', action='store_const', const=None, dest='spill_rows',
+                            help='fail on a table with more rows than a worksheet can hold instead of continuing it '
+                                 'on more worksheets')
+    arg_parser.add_argument('--no-inline-styles', action='store_false', dest='inline_styles',
+                            help='ignore the style attribute of cells')
+    arg_parser.add_argument('--workers', type=int, help='the number of worker processes, default the number of CPUs')
+    return arg_parser
+
+
+def main(argv=None, stdin=None, stdout=None, stderr=None):
+    """
+    :return: the exit status: 0, or 1 if any file failed
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    arg_parser = make_arg_parser()
+    args = arg_parser.parse_args(argv)
+    options = {k: getattr(args, k) for k in ('excluded_tables', 'include_tables', 'work_sheet_names', 'parser',
+                                             'infer_types', 'constant_memory', 'spill_rows', 'inline_styles')}
+
+    def report(result):
+        stderr.write(throughput(result) + '\n')
+
+    if not args.inputs or args.inputs == ['-']:
+        if len(args.formats) > 1:
+            arg_parser.error('a page read from stdin is written in one --format')
+        report(convert_stdin(stdin, stdout, args.formats, options, args.output))
+        return 0
+
+    try:
+        paths = find_inputs(args.inputs)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    if args.out_dir and not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+
+    start = time.perf_counter()
+    try:
+        results = convert_files(paths, args.formats, options, args.out_dir, args.workers, report)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    seconds = time.perf_counter() - start
+    n_bytes = sum(x['bytes'] for x in results)
+    failed = [x for x in results if 'error' in x]
+    stderr.write('{} files, {} failed, {:.1f} MB in {:.3f} s ({:.2f} MB/s)\n'.format(
+        len(results), len(failed), n_bytes / 2.0 ** 20, seconds, n_bytes / max(seconds, 1e-9) / 2 ** 20))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
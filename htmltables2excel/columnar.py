@@ -0,0 +1,295 @@
+"""
+Column-oriented export of parsed tables, for data pipelines that would otherwise read the xlsx back.
+
+read_columns() reads the body rows of a parsed table (see cells.py) into one list per column. Each column then gets a
+single type from the values parse_cell() or type_inference.py gave its cells:
+
+    integer: every value is an int
+    float: every value is a number, e.g. money and percents
+    date: every value is a datetime (type_inference.py converts date columns)
+    text: anything else. Numbers in a text column are written as the text of their cell, e.g. $1,000 not 1000.0.
+
+Empty cells are nulls. An integer or float column with money or percent cells keeps that as its kind, in the field
+metadata of Arrow and Parquet. The names come from the last header row; a header with a colspan names each of its
+columns.
+
+to_arrow() makes a pyarrow Table, write_parquet() a Parquet file and to_pandas() a DataFrame with nullable dtypes.
+pyarrow and pandas are only imported by the functions that need them. ParquetSink writes each table to Parquet from the
+single parse of exporters.export().
+"""
+import datetime
+
+import six
+
+from backends import parse_tables
+from type_inference import DATE, FLOAT, INTEGER, MONEY, PERCENT, TEXT
+
+PANDAS_DTYPES = {INTEGER: 'Int64', FLOAT: 'Float64', DATE: 'datetime64[ns]', TEXT: 'string'}
+
+
+def column_names(headers):
+    """
+    :param headers: the parsed header rows of a table
+    :return: a name for each column of the last header row, unique and never empty
+    """
+    names = []
+    for cell in headers[-1] if headers else []:
+        text = six.text_type(cell['value']).strip() if cell['value'] is not None else u''
+        colspan = int(cell['attrs'].get('colspan', u'1'))
+        names.append(text)
+        names.extend(u'{}_{}'.format(text, i + 2) if text else u'' for i in range(colspan - 1))
+    return unique_names(names)
+
+
+def unique_names(names):
+    result = []
+    seen = set()
+    for i, name in enumerate(names):
+        name = name or u'col_{}'.format(i + 1)
+        candidate = name
+        n = 2
+        while candidate in seen:
+            candidate = u'{}_{}'.format(name, n)
+            n += 1
+        seen.add(candidate)
+        result.append(candidate)
+    return result
+
+
+class TableColumns(object):
+    def __init__(self, names, caption=None, attrs=None):
+        """
+        :param names: the column names, see column_names(). Columns are added for rows that are wider.
+        :param caption: the table caption
+        :param attrs: the table tag attributes
+        """
+        self.names = list(names)
+        self.caption = caption
+        self.attrs = attrs or {}
+        self.columns = [[] for _ in self.names]
+        # The cell text of each value parsed from text, None where the value is the text, for text columns
+        self.texts = [[] for _ in self.names]
+        self.kinds = [None] * len(self.names)
+        self.n_rows = 0
+
+    def append(self, row):
+        """
+        :param row: a list of parsed cells. A cell with a colspan fills its first column, the others are null.
+        """
+        values = []
+        texts = []
+        kinds = []
+        for cell in row:
+            value = cell['value']
+            if cell.get('is_money'):
+                kinds.append((len(values), MONEY))
+            elif cell.get('is_percent'):
+                kinds.append((len(values), PERCENT))
+            values.append(None if value == u'' else value)
+            texts.append(getattr(cell, 'text', None))
+            colspan = int(cell['attrs'].get('colspan', u'1'))
+            if colspan > 1:
+                values.extend([None] * (colspan - 1))
+                texts.extend([None] * (colspan - 1))
+
+        while len(values) > len(self.columns):
+            self.names = unique_names(self.names + [u''])
+            self.columns.append([None] * self.n_rows)
+            self.texts.append([None] * self.n_rows)
+            self.kinds.append(None)
+        for i, kind in kinds:
+            self.kinds[i] = kind
+
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        for column, text in zip(self.texts, texts):
+            column.append(text)
+        for i in range(len(values), len(self.columns)):
+            self.columns[i].append(None)
+            self.texts[i].append(None)
+        self.n_rows += 1
+
+    def column_type(self, i):
+        """
+        :return: integer, float, date or text, see the module docstring
+        """
+        found = set()
+        for value in self.columns[i]:
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (six.integer_types, float, datetime.datetime)):
+                return TEXT
+            found.add(DATE if isinstance(value, datetime.datetime) else
+                      INTEGER if isinstance(value, six.integer_types) else FLOAT)
+        if not found:
+            return TEXT
+        if len(found) == 1:
+            return found.pop()
+        return FLOAT if DATE not in found else TEXT
+
+    def column_kind(self, i, column_type):
+        """
+        :param column_type: from column_type()
+        :return: money, percent or None. Only number columns have a kind.
+        """
+        return self.kinds[i] if column_type in (INTEGER, FLOAT) else None
+
+    def typed_column(self, i):
+        """
+        :return: (the column type, the values converted to it)
+        """
+        column_type = self.column_type(i)
+        values = self.columns[i]
+        if column_type == FLOAT:
+            values = [float(x) if x is not None else None for x in values]
+        elif column_type == TEXT:
+            values = [text if text is not None else six.text_type(x) if x is not None else None
+                      for x, text in zip(values, self.texts[i])]
+        return column_type, values
+
+    def metadata(self):
+        return {k: v for k, v in (('caption', self.caption), ('id', self.attrs.get('id'))) if v is not None}
+
+
+def read_columns(data):
+    """
+    :param data: a parsed table dict. Its rows are read, the footers are not.
+    :return: a TableColumns
+    """
+    columns = TableColumns(column_names(data['headers']), data.get('caption'), data['table'].attrs)
+    for row in data['rows']:
+        columns.append(row)
+    return columns
+
+
+def to_arrow(columns):
+    """
+    :param columns: a TableColumns, or a parsed table dict
+    :return: a pyarrow.Table
+    """
+    import pyarrow as pa
+
+    if not isinstance(columns, TableColumns):
+        columns = read_columns(columns)
+
+    types = {INTEGER: pa.int64(), FLOAT: pa.float64(), DATE: pa.timestamp('us'), TEXT: pa.string()}
+    arrays = []
+    fields = []
+    for i, name in enumerate(columns.names):
+        column_type, values = columns.typed_column(i)
+        arrays.append(pa.array(values, type=types[column_type]))
+        kind = columns.column_kind(i, column_type)
+        metadata = {'kind': kind} if kind else None
+        fields.append(pa.field(name, types[column_type], metadata=metadata))
+    schema = pa.schema(fields, metadata=columns.metadata() or None)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(path, columns, **kwargs):
+    """
+    :param path: a path or a binary file object
+    :param columns: a TableColumns, or a parsed table dict
+    :param kwargs: for pyarrow.parquet.write_table(), e.g. compression
+    """
+    import pyarrow.parquet as pq
+
+    pq.write_table(to_arrow(columns), path, **kwargs)
+
+
+def to_pandas(columns):
+    """
+    :param columns: a TableColumns, or a parsed table dict
+    :return: a pandas.DataFrame with nullable dtypes. The caption and id are in its attrs.
+    """
+    import pandas as pd
+
+    if not isinstance(columns, TableColumns):
+        columns = read_columns(columns)
+
+    series = {}
+    for i, name in enumerate(columns.names):
+        column_type, values = columns.typed_column(i)
+        series[name] = pd.Series(values, dtype=PANDAS_DTYPES[column_type])
+    df = pd.DataFrame(series, columns=columns.names)
+    df.attrs.update(columns.metadata())
+    return df
+
+
+def iter_columns(html, excluded_tables=None, parser=None, include_tables=None, infer_types=True):
+    """
+    :param html: the page: text, bytes or a file, see sources.py
+    :param infer_types: parse the body rows by inferred column type, which also converts date columns
+    :return: a generator of the TableColumns of each table
+    """
+    for data in parse_tables(html, excluded_tables, parser, infer_types, include_tables):
+        yield read_columns(data)
+
+
+def page_to_arrow(html, **kwargs):
+    """
+    :param kwargs: see iter_columns()
+    :return: a list of pyarrow Tables, one for each table of the page
+    """
+    return [to_arrow(x) for x in iter_columns(html, **kwargs)]
+
+
+def page_to_pandas(html, **kwargs):
+    """
+    :param kwargs: see iter_columns()
+    :return: a list of DataFrames, one for each table of the page
+    """
+    return [to_pandas(x) for x in iter_columns(html, **kwargs)]
+
+
+def parquet_path(template, n, attrs):
+    """
+    :param template: a str.format() template of the file path, with {n} (the table number from 1) and {id} (the
+        table id, or table_<n>)
+    """
+    return template.format(n=n, id=attrs.get('id') or 'table_{}'.format(n))
+
+
+def page_to_parquet(template, html, parquet_kwargs=None, **kwargs):
+    """
+    Writes each table of a page to its own Parquet file.
+
+    :param template: see parquet_path(), e.g. 'out/report_{id}.parquet'
+    :param parquet_kwargs: for pyarrow.parquet.write_table()
+    :param kwargs: see iter_columns()
+    :return: the paths written
+    """
+    paths = []
+    for n, columns in enumerate(iter_columns(html, **kwargs), 1):
+        path = parquet_path(template, n, columns.attrs)
+        write_parquet(path, columns, **(parquet_kwargs or {}))
+        paths.append(path)
+    return paths
+
+
+class ParquetSink(object):
+    def __init__(self, template, **kwargs):
+        """
+        A sink for exporters.export() that writes each table to its own Parquet file.
+
+        :param template: see parquet_path()
+        :param kwargs: for pyarrow.parquet.write_table()
+        """
+        self.template = template
+        self.kwargs = kwargs
+        self.columns = None
+        self.paths = []
+
+    def start_table(self, data, table):
+        self.columns = TableColumns(column_names(data['headers']), data.get('caption'), table.attrs)
+
+    def write_row(self, raw_row, cells):
+        self.columns.append(cells)
+
+    def end_table(self, raw_footers, footers):
+        path = parquet_path(self.template, len(self.paths) + 1, self.columns.attrs)
+        write_parquet(path, self.columns, **self.kwargs)
+        self.paths.append(path)
+        self.columns = None
+
+    def close(self):
+        pass
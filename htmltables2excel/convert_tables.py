@@ -1,37 +1,35 @@
-import unittest
+"""
+Writes html tables to excel.
+
+Importing this module only imports six, the modules of this package and light parts of the standard library. bs4,
+xlsxwriter, tempfile, the process pool, logging and the modules for type inference and the structured payload are
+imported when they are first used, so short-lived workers do not pay for the ones they never use. See
+benchmarks.import_times().
+"""
 import os
-import json
-import datetime
-import traceback
-from operator import methodcaller
-import re
+import functools
+import time
+from collections import deque
 import six
 
-from bs4 import NavigableString, BeautifulSoup
+import backends
+# style_to_dict, locate_cells and make_formula used to be defined here and are still imported from here
+from cells import style_to_dict, parse_cell, read_table, TableInfo
+from formats import FormatRegistry
+from formulas import FormulaError, compile_formula, evaluate, is_number, locate_cells, make_formula, xl_col_to_name
+import metrics
+from metrics import as_metrics
 
-import xlsxwriter
-from xlsxwriter.utility import xl_rowcol_to_cell, xl_col_to_name
+# How many rows back formula results can refer to, see PageToExcel precompute_formulas
+FORMULA_WINDOW = 32
 
-from page_to_csv import parse_tables
+# The most rows a worksheet can have
+MAX_ROWS = 1048576
+# Worksheet names are at most this long
+MAX_SHEET_NAME = 31
 
-
-def style_to_dict(style):
-    """Parses an HTML tag style attribute.
-    :param style:
-    """
-    if isinstance(style, dict):
-        return style
-
-    d = {}
-    styles = style.split(';')
-    for s in styles:
-        # noinspection PyBroadException
-        try:
-            key, value = s.split(':')
-            d[key.strip()] = value.strip()
-        except:
-            pass
-    return d
+# Workbooks written to a buffer are kept in memory up to this size, then spill to a temp file.
+SPOOL_SIZE = 16 * 2 ** 20
 
 
 def clean_cell(cell):
@@ -46,115 +44,6 @@ def clean_cell(cell):
         return s
 
 
-def locate_cells(formula, current_row, current_col):
-    """
-    Converts all cell location codes to an excel locations relative to the current cell. Cell location codes are
-    in the following format.
-
-    Cols: colmddd - the string col then either an m or a p then a 3 digit offset. m means the offset should be
-        subtracted from the current col. p means the offset should be added to the current col
-
-    Rows: rowpddd - similar to cols
-
-    :param formula: the formula string
-    :param current_row: zero based value of the current row
-    :param current_col: zero based value of the current col
-    :return: the formula with the row and column references in excel format (eg. B10).
-    """
-
-    def locate_col(match):
-        sign = match.group('sign')
-        offset = match.group('offset')
-        try:
-            offset = int(offset)
-        except ValueError:
-            return ''
-
-        if sign == 'm':
-            return xl_col_to_name(current_col - offset)
-        elif sign == 'p':
-            return xl_col_to_name(current_col + offset)
-        return ''
-
-    def locate_row(match):
-        sign = match.group('sign')
-        offset = match.group('offset')
-        try:
-            offset = int(offset)
-        except ValueError:
-            return ''
-
-        if sign == 'm':
-            return str(current_row - offset + 1)
-        elif sign == 'p':
-            return str(current_row + offset + 1)
-        return ''
-
-    col_re = re.compile('col(?P<sign>[m,p])(?P<offset>\d\d\d)')
-    new_formula = col_re.sub(locate_col, formula)
-    row_re = re.compile('row(?P<sign>[m,p])(?P<offset>\d\d\d)')
-    new_formula = row_re.sub(locate_row, new_formula)
-    return new_formula
-
-
-# noinspection PyUnusedLocal
-def make_formula(formula_str, row, col, first_data_row=None):
-    # noinspection SpellCheckingInspection
-    """
-        A cell will be written as a formula if the HTML tag has the attribute "data-excel" set.
-
-        Note that this function is called when the spreadsheet is being created. The cell it applies to knows where it
-        is and what the first data row is.
-
-        Allowed formula strings:
-
-            "SUM ROW A-C": sum the current row from A-C
-
-            "SUM ROW A,C": sum cells A and C in the current row
-
-            "SUM COL": sums current col from first_row to row - 1
-
-            "FORMULA RAW IF(F13 > 0, (F13-E13)/F13, '')": uses formula as is
-
-            "FORMULA RELATIVE IF(colm001rowp000 > 0, (colm001rowp0-colm002rowp000)/colm001rowp001, '')": creates the
-                formula relative to the current location. colm002 means two cols to the left of the current cell.
-                rowp000 means the current row plus 0 (e.g. the current row)
-
-        :param formula_str: the value of the "data-excel" tag containing params for generating the formula
-        :param row: cell row
-        :param col: cell column
-        :param first_data_row: for column formulas
-        :return: a string
-        """
-    parts = formula_str.split(' ')
-    func = parts[0]
-    args = parts[-1]
-
-    formula = ''
-    if func == 'SUM':
-        func_modifier = parts[1]
-        if func_modifier == 'ROW':
-            if '-' in args:
-                cols = args.split('-')
-                formula = '=SUM({}{}:{}{})'.format(cols[0], row + 1, cols[1], row + 1)
-            elif ',' in args:
-                cols = map(methodcaller('strip'), args.split(','))
-
-                # Put the row number after each col letter and then add them together
-                cols = '+'.join(map(lambda x: x + str(row + 1), cols))
-                formula = '=SUM({})'.format(cols)
-        elif func_modifier == 'COL':
-            formula = '=SUM({}:{})'.format(xl_rowcol_to_cell(first_data_row, col), xl_rowcol_to_cell(row - 1, col))
-    elif func == 'FORMULA':
-        func_modifier = parts[1]
-        formula_str = ' '.join(parts[2:])
-        if func_modifier == 'RAW':
-            formula = '=' + formula_str
-        elif func_modifier == 'RELATIVE':
-            formula = '=' + locate_cells(formula_str, row, col)
-    return formula
-
-
 def configure_worksheet(worksheet, table, first_data_row):
     """
     Currently just for freezing. Set the attribute "data-excel" of HTML table tag to:
@@ -163,7 +52,7 @@ def configure_worksheet(worksheet, table, first_data_row):
 
     :param first_data_row:
     :param worksheet:
-    :param table: a beautiful soup parsed table tag
+    :param table: the parsed table tag, anything with the tag attributes in .attrs
     :return:
     """
     data_excel = table.attrs.get('data-excel')
@@ -181,50 +70,14 @@ def parse_row(row):
     """
 
     :param row: a beautiful soup table row.
-    :return: a list of parsed cells, each item is a dict:
-            {'value': value, 'attrs': cell.attrs, 'tag': cell.name, 'is_money': False}
+    :return: a list of parsed cells, see cells.Cell
     """
+    from bs4 import NavigableString
+
     result = []
     for cell in row.children:
         if not isinstance(cell, NavigableString):
-            if 'style' in cell.attrs:
-                cell.attrs['style'] = style_to_dict(cell.attrs['style'])
-
-            if 'class' in cell.attrs:
-                cell.attrs['class'] = filter(lambda x: x != '', cell.attrs['class'])
-
-            s = six.text_type(clean_cell(cell))
-            if s and s[0] == u'$':
-                value = s[1:].replace(u',', u'')
-                is_money = True
-                try:
-                    value = float(value)
-                except ValueError:
-                    is_money = False
-                contents = {'value': value,
-                            'attrs': cell.attrs, 'tag': cell.name, 'is_money': is_money}
-
-            elif s and s[-1] == u'%':
-                try:
-                    number = float(s[0: -1]) / 100.0
-                except ValueError:
-                    number = None
-
-                if number:
-                    contents = {'value': number, 'attrs': cell.attrs, 'tag': cell.name, 'is_percent': True}
-                else:
-                    contents = contents = {'value': s, 'attrs': cell.attrs, 'tag': cell.name, 'is_money': False}
-            else:
-                if s.isnumeric():
-                    value = int(s)
-                else:
-                    # http://stackoverflow.com/questions/736043/checking-if-a-string-can-be-converted-to-float-in-python
-                    try:
-                        value = float(s.replace(',', ''))
-                    except ValueError:
-                        value = s
-                contents = {'value': value, 'attrs': cell.attrs, 'tag': cell.name, 'is_money': False}
-            result.append(contents)
+            result.append(parse_cell(clean_cell(cell), cell.attrs, cell.name))
     return result
 
 
@@ -232,7 +85,7 @@ def parse_table(table):
     if table.name == u'[document]':
         table = table.table
 
-    data = {'table': table}  # we may need some attributes or classes
+    data = {'table': TableInfo(dict(table.attrs))}  # we may need some attributes or classes
     if table.caption:
         title = table.caption.string
         data['caption'] = six.text_type(title)
@@ -254,43 +107,222 @@ def parse_table(table):
     return data
 
 
-def parse_tables_from_table_list(table_list):
+def parse_tables(html, excluded_tables, parse_table_func):
     """
-    :param table_list: a list of table html
-    :return:
+    Reads every table of the page with BeautifulSoup, e.g. parse_tables(html, [], parse_table). backends.parse_tables()
+    reads the same tables with any of the parsers.
+
+    :param html:
+    :param excluded_tables: a list of table ids to skip
+    :param parse_table_func: called with each BeautifulSoup table tag
+    :return: a list of the results of parse_table_func
     """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    tables = soup.find_all('table')
+
     parsed_tables = []
-    for table in table_list:
-        soup = BeautifulSoup(table, 'html.parser')
-        parsed_tables.append(parse_table(soup))
+    for table in tables:
+        table_id = table.attrs.get(u'id')
+        if table_id not in excluded_tables:
+            parsed_tables.append(parse_table_func(table))
     return parsed_tables
 
 
+def parse_table_html(table, parser=None, infer_types=False):
+    """
+    Parses the html of a single table. The result can be pickled, so this can run in another process.
+
+    :param table: the table html, or a table dict from the structured payload (see table_json.py), which is used as
+        is without any HTML parsing
+    :return: a table dict with the rows and footers read into lists, or None if there is no table
+    """
+    if isinstance(table, dict):
+        from table_json import parse_table_json
+
+        return read_table(parse_table_json(table, infer_types=infer_types))
+    for data in backends.parse_tables(table, parser=parser, infer_types=infer_types):
+        return read_table(data)
+    return None
+
+
+def parse_tables_from_table_list(table_list, parser=None, infer_types=False, executor=None, workers=None):
+    """
+    :param table_list: a list of table html or structured table dicts, see parse_table_html()
+    :param parser: the parser backend, see backends.py. Defaults to html.parser.
+    :param infer_types: parse the body rows by inferred column type, see type_inference.py
+    :param executor: a concurrent.futures executor. The tables are parsed in parallel on it, which with a process pool
+        makes parsing a dozen large tables take about as long as the largest one.
+    :param workers: when there is no executor, parse in a process pool with this many workers
+    :return: the parsed tables in the same order as table_list
+    """
+    func = functools.partial(parse_table_html, parser=parser, infer_types=infer_types)
+    if executor is not None:
+        parsed_tables = list(executor.map(func, table_list))
+    elif workers and len(table_list) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed_tables = list(pool.map(func, table_list))
+    else:
+        parsed_tables = [func(x) for x in table_list]
+    return [x for x in parsed_tables if x is not None]
+
+
+def table_list_to_excel(file_full_path, table_list, parser=None, to_excel_kwargs=None, executor=None, observer=None):
+    """
+    Parses a list of table html and writes it to excel. Used to run the conversion as a background job.
+
+    :param file_full_path: a path or a file-like object
+    :param table_list: a list of table html
+    :param parser: the parser backend, see backends.py
+    :param to_excel_kwargs: params for PageToExcel
+    :param executor: see parse_tables_from_table_list()
+    :param observer: None or a metrics.Observer
+    :return: file_full_path
+    """
+    export_metrics = as_metrics(observer)
+    with metrics.exporting(export_metrics):
+        with metrics.timed(export_metrics, 'parse'):
+            parsed_tables = parse_tables_from_table_list(table_list, parser=parser, executor=executor)
+        PageToExcel(file_full_path, parsed_tables, observer=export_metrics, **(to_excel_kwargs or {}))
+    return file_full_path
+
+
+def write_to_buffer(build, spool_size=SPOOL_SIZE):
+    """
+    :param build: build(file) writes the workbook to a file-like object
+    :param spool_size: the workbook is kept in memory up to this many bytes, then moved to a temp file
+    :return: a SpooledTemporaryFile holding the workbook, at position 0. The caller closes it.
+    """
+    import tempfile
+
+    buf = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        build(buf)
+    except:
+        buf.close()
+        raise
+    buf.seek(0)
+    return buf
+
+
+def table_list_to_buffer(table_list, parser=None, to_excel_kwargs=None, executor=None, spool_size=SPOOL_SIZE):
+    """
+    Parses a list of table html and writes it to excel in a buffer rather than a named file, e.g. to send it as the
+    response to a request.
+
+    :param table_list: a list of table html
+    :param parser: the parser backend, see backends.py
+    :param to_excel_kwargs: params for PageToExcel
+    :param executor: see parse_tables_from_table_list()
+    :param spool_size: see write_to_buffer()
+    :return: a SpooledTemporaryFile holding the workbook, at position 0. The caller closes it.
+    """
+    return write_to_buffer(functools.partial(table_list_to_excel, table_list=table_list, parser=parser,
+                                             to_excel_kwargs=to_excel_kwargs, executor=executor), spool_size)
+
+
 def full_page_to_excel(file_full_path, html, **kwargs):
     """Converts a full HTML page to excel.
-    :param kwargs:
-    :param html:
+    :param kwargs: excluded_tables and include_tables (ids, classes or positions of the tables to skip or to write, see
+        table_index.py), parser (the parser backend, see backends.py), infer_types (see type_inference.py) and the
+        params of PageToExcel, including observer (see metrics.py). Tables that are not written are never parsed.
+    :param html: the page: text, bytes or a file (a path, a binary file object or an mmap, see sources.py). Use
+        parser='stream' to read a big file in chunks.
     :param file_full_path:
     """
     excluded_tables = kwargs.pop('excluded_tables', [])
-    tables = parse_tables(html, excluded_tables, parse_table)
+    include_tables = kwargs.pop('include_tables', None)
+    parser = kwargs.pop('parser', None)
+    infer_types = kwargs.pop('infer_types', False)
+    tables = backends.parse_tables(html, excluded_tables, parser, infer_types, include_tables)
+    # The tables are parsed as they are written, PageToExcel times both
     PageToExcel(file_full_path, tables, **kwargs)
 
 
+class Page(object):
+    """
+    A worksheet being written: the next row to write and the first data row, for column formulas.
+
+    A table that does not fit on one worksheet continues on more worksheets, see PageToExcel spill_rows. name and
+    spill_args are what the worksheet was started with and sheets has (sheet name, first data row, row after the last
+    row) for each full worksheet of the table before the current one.
+
+    When formula results are worked out, it also keeps the values written to the current row (by column), the values
+    of the last FORMULA_WINDOW rows and the running total of each column from the first data row. A value of None
+    means the value is not known, e.g. a formula without a result.
+    """
+    __slots__ = ('worksheet', 'row', 'first_data_row', 'col', 'name', 'spill_args', 'sheets', 'values', 'window',
+                 'totals')
+
+    def __init__(self, worksheet, row, first_data_row, keep_values=False):
+        self.worksheet = worksheet
+        self.row = row
+        self.first_data_row = first_data_row
+        self.col = 0
+        self.name = None
+        self.spill_args = None
+        self.sheets = []
+        if keep_values:
+            self.values = {}
+            self.window = deque(maxlen=FORMULA_WINDOW)
+            self.totals = {}
+        else:
+            self.values = None
+
+    def lookup(self, row, col):
+        """
+        :return: the value written to a cell, u'' if the cell is empty or None if it is not known
+        """
+        if row == self.row:
+            return self.values.get(col, u'') if col < self.col else None
+
+        back = self.row - row
+        if 0 < back <= len(self.window):
+            window_row, values = self.window[-back]
+            if window_row == row:
+                return values.get(col, u'')
+        return None
+
+    def column_total(self, col):
+        return self.totals.get(col, 0)
+
+    def end_row(self):
+        if self.values is not None:
+            if self.row >= self.first_data_row:
+                totals = self.totals
+                for col, value in six.iteritems(self.values):
+                    if value is None:
+                        totals[col] = None
+                    elif is_number(value) and (col not in totals or totals[col] is not None):
+                        totals[col] = totals.get(col, 0) + value
+            self.window.append((self.row, self.values))
+            self.values = {}
+        self.row += 1
+        self.col = 0
+
+
 class PageToExcel(object):
     def __init__(self, file_full_path, tables, work_sheet_names=None, extra_headers=None, col_widths=None,
-                 custom_formats=None, show_table_captions=None, external_workbook=None, include_formulas=True):
+                 custom_formats=None, show_table_captions=None, external_workbook=None, include_formulas=True,
+                 constant_memory=False, observer=None, precompute_formulas=False, spill_rows=MAX_ROWS,
+                 inline_styles=True):
         """
         Writes tables to excel. NOTE: there can be more than one table. Each table is a separate worksheet.
 
         You can write a cell as a formula by setting the HTML tag attribute "data-excel". For details see the
-        function make_formula().
+        function formulas.compile_formula().
 
-        To apply one of the formats in self.format, put the name of the format in the cell CSS class.
+        To apply one of the formats in self.formats, put the name of the format in the cell CSS class. A cell can have
+        several format classes, they are merged into one format. The style attribute of a cell is applied over its
+        classes. See formats.py.
 
-        :param file_full_path:
+        :param file_full_path: a path, or a file-like object such as io.BytesIO or a tempfile.SpooledTemporaryFile
         :param tables: a list of html for each table.
-        :param work_sheet_names: either None or a list with length = number of tables
+        :param work_sheet_names: either None or a list with length = number of tables. Tables past the end of the list
+            are named sheet_<n>.
         :param extra_headers: None or headers for each worksheet. E.g.
             [[worksheet 1 header1, worksheet 1 header2, ...], [worksheet 2 header1, worksheet 2 header2, ...]].
             Each header is a merged row, the width of the worksheet.
@@ -302,111 +334,228 @@ class PageToExcel(object):
         :param show_table_captions: a list of booleans, one for each table. If none, then all captions are shown
         :param external_workbook: for adding to an existing workbook
         :param include_formulas: when false, cell values are not replaced by formulas.
+        :param constant_memory: use xlsxwriter's constant_memory mode. Each row is flushed to a temp file as soon as
+            the next row is started, so memory stays flat however long the tables are. Rows are always written in
+            order, so this works with any tables, including row generators from the streaming parser. Ignored when
+            there is an external_workbook.
+        :param observer: None or a metrics.Observer, which gets the phase timings and counts of the export
+        :param precompute_formulas: store the result of each formula with it, so the workbook shows the results
+            without recalculating. Results are worked out from the values already written: SUM COL from running
+            column totals, SUM ROW and arithmetic formulas from the last FORMULA_WINDOW rows. Other formulas, and
+            formulas that refer to cells not written yet, are stored without a result. See formulas.evaluate().
+            When every formula has a result the workbook is not recalculated when it is opened. A formula without a
+            result turns full recalculation on load back on.
+        :param spill_rows: the most rows of a worksheet, at most MAX_ROWS (the default, the most Excel allows). A table
+            with more rows continues on the worksheets "name (2)", "name (3)"... Each one repeats the page headers, the
+            caption, the table headers, the column widths and the freeze panes, and SUM COL formulas also sum the rows
+            of the earlier worksheets. Other formulas are written as they are on every worksheet. None to never spill:
+            a table with more than MAX_ROWS rows then raises ValueError instead of losing rows.
+        :param inline_styles: apply the style attribute of cells (colors, fonts, alignment, borders and
+            mso-number-format), see formats.css_to_props()
         :return: None
         """
+        if spill_rows is not None and not 0 < spill_rows <= MAX_ROWS:
+            raise ValueError('spill_rows must be between 1 and {}'.format(MAX_ROWS))
+
         self.file_full_path = file_full_path
-        workbook = external_workbook or xlsxwriter.Workbook(file_full_path)
+        if external_workbook is None:
+            import xlsxwriter
+
+            workbook = xlsxwriter.Workbook(file_full_path, {'constant_memory': constant_memory})
+        else:
+            workbook = external_workbook
         self.workbook = workbook
         self.include_formulas = include_formulas
+        self.precompute_formulas = precompute_formulas
+        if precompute_formulas:
+            workbook.calc_on_load = False
+        self.spill_rows = spill_rows
+        self.row_limit = spill_rows if spill_rows is not None else MAX_ROWS
+        self.work_sheet_names = work_sheet_names
+        self.extra_headers = extra_headers
+        self.col_widths = col_widths
+        self.show_table_captions = show_table_captions
+
+        self.formats = FormatRegistry(workbook, custom_formats, inline_styles)
+
+        self.n_rows = 0
+        self.n_cells = 0
+        self.n_merges = 0
+        self.n_formulas = 0
+        self.metrics = as_metrics(observer)
+        if self.metrics is None:
+            for i, table in enumerate(tables):
+                name, eh, cw, show_table_caption = self.page_params(i)
+                self.write_page(name, table, eh, cw, show_table_caption)
+
+            if not external_workbook:
+                self.workbook.close()
+        else:
+            with self.metrics.export():
+                self.write_observed(tables, external_workbook)
 
-        self.formats = {
-            'money': workbook.add_format({'num_format': '$#,##0.00', 'align': 'right'}),
-            'dollars': workbook.add_format({'num_format': '$#,##0', 'align': 'right'}),
-            'hours': workbook.add_format({'num_format': '#,##0.0', 'align': 'right'}),
-            'percent': workbook.add_format({'num_format': '0.00%', 'align': 'right'}),
-            'integer': workbook.add_format({'num_format': '#,##0', 'align': 'right'}),
-
-            'header': workbook.add_format(
-                {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1}),
-
-            'centered_header': workbook.add_format(
-                {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1, 'align': 'center_across'}),
-
-            'right_header': workbook.add_format(
-                {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1, 'align': 'right'}),
-
-            'upper_header': workbook.add_format({'bold': True, 'bg_color': '#CCCCCC'}),
-
-            'bold': workbook.add_format({'bold': True}),
-            'underline': workbook.add_format({'underline': 1}),
-            'title': workbook.add_format({'bold': True, 'font_size': 13}),
-            'url': workbook.add_format({'font_color': 'blue', 'underline': 1}),
-            'right_align': workbook.add_format({'align': 'right'}),
-            'row_date': workbook.add_format({'num_format': 'D-MMM'}),
-
-            # HTML-like formatting
-            'th': workbook.add_format({'bold': True}),
-            'td': None
-        }
-
-        if custom_formats:
-            for format_name, format_dict in six.iteritems(custom_formats):
-                self.formats[format_name] = workbook.add_format(format_dict)
-
-        cw = []
-        eh = []
-        for i, table in enumerate(tables):
-            if col_widths:
-                cw = col_widths[i]
-
-            if extra_headers:
-                eh = extra_headers[i]
-
-            if work_sheet_names:
-                name = work_sheet_names[i]
-            else:
-                name = 'sheet_{}'.format(i + 1)
-
-            if show_table_captions:
-                show_table_caption = show_table_captions[i]
-            else:
-                show_table_caption = True
-
-            self.write_page(name, table, eh, cw, show_table_caption)
+    def write_observed(self, tables, external_workbook):
+        """
+        Writes the tables like __init__(), timing the reading and the writing of each row.
+        """
+        metrics = self.metrics
+        tables = iter(tables)
+        i = 0
+        while True:
+            with metrics.timed('parse'):
+                table = next(tables, None)
+            if table is None:
+                break
+
+            name, eh, cw, show_table_caption = self.page_params(i)
+            with metrics.timed('write'):
+                page = self.start_page(name, table, eh, cw, show_table_caption)
+            self.write_rows_observed(page, table['rows'])
+            self.write_rows_observed(page, table['footers'])
+            i += 1
 
         if not external_workbook:
-            self.workbook.close()
+            with metrics.timed('close'):
+                self.workbook.close()
+            if isinstance(self.file_full_path, six.string_types):
+                metrics.set('bytes_written', os.path.getsize(self.file_full_path))
+            elif hasattr(self.file_full_path, 'tell'):
+                metrics.set('bytes_written', self.file_full_path.tell())
+
+        metrics.add('tables', i)
+        metrics.add('rows', self.n_rows)
+        metrics.add('cells', self.n_cells)
+        metrics.add('merges', self.n_merges)
+        metrics.add('formulas', self.n_formulas)
+
+    def write_rows_observed(self, page, rows):
+        clock = time.perf_counter
+        parse_seconds = 0.0
+        write_seconds = 0.0
+        rows = iter(rows)
+        while True:
+            start = clock()
+            table_row = next(rows, None)
+            written = clock()
+            parse_seconds += written - start
+            if table_row is None:
+                break
+            self.write_row(page, table_row)
+            write_seconds += clock() - written
+        self.metrics.add_time('parse', parse_seconds)
+        self.metrics.add_time('write', write_seconds)
+
+    def page_params(self, i):
+        """
+        :param i: the index of the table
+        :return: the name, extra headers, column widths and show_table_caption for the worksheet of the table
+        """
+        cw = self.col_widths[i] if self.col_widths else []
+        eh = self.extra_headers[i] if self.extra_headers else []
+        if self.work_sheet_names and i < len(self.work_sheet_names):
+            name = self.work_sheet_names[i]
+        else:
+            name = 'sheet_{}'.format(i + 1)
+        show_table_caption = self.show_table_captions[i] if self.show_table_captions else True
+        return name, eh, cw, show_table_caption
 
     def get_fmt(self, cell, default=None):
-        if 'class' in cell['attrs']:
-            for the_class in cell['attrs']['class']:
-                if the_class in self.formats:
-                    return self.formats[the_class]
-
-        if cell.get('is_money'):
-            return self.formats['money']
-        elif cell.get('is_percent'):
-            return self.formats['percent']
-        else:
-            return default
+        """
+        :param cell: a parsed cell
+        :param default: the name of the format to start from
+        :return: the Format composed from the default, the cell's money/percent/date value and all of its classes
+        """
+        return self.formats.cell_format(cell, default)
 
-    def write_cell(self, worksheet, row, col, cell, cell_format=None, first_data_row=None):
+    def write_cell(self, worksheet, row, col, cell, cell_format=None, first_data_row=None, page=None):
         colspan = int(cell['attrs'].get('colspan', u'1'))
+        values = page.values if page is not None else None
 
         # Write formula if there is one
+        result = None
         formula_str = cell['attrs'].get('data-excel')
-        if formula_str and self.include_formulas:
-            value = make_formula(formula_str, row, col, first_data_row=first_data_row)
+        is_formula = bool(formula_str and self.include_formulas)
+        if is_formula:
+            try:
+                template = compile_formula(formula_str)
+                value = template.render(row, col, first_data_row, page.sheets if page is not None else ())
+            except FormulaError as e:
+                # Keep going with the value of the cell, one bad attribute should not lose the whole workbook
+                import logging
+
+                logging.getLogger('htmltables2excel').warning(
+                    'Writing the value of cell %s%s instead of its formula: %s', xl_col_to_name(col), row + 1, e)
+                is_formula = False
+        if is_formula:
+            self.n_formulas += 1
+            if values is not None:
+                result = evaluate(template, value, row, col, page.lookup, page.column_total)
+                values[col] = result
+                if result is None:
+                    self.workbook.calc_on_load = True
         else:
             value = cell['value']
+            if values is not None:
+                values[col] = value
 
         if colspan > 1:
             the_format = self.get_fmt(cell, default=cell_format)
-            worksheet.merge_range(row, col, row, col + colspan - 1, value, the_format)
+            if is_formula:
+                # As the xlsxwriter docs recommend: merge the range empty, then write the formula once
+                worksheet.merge_range(row, col, row, col + colspan - 1, u'', the_format)
+                worksheet.write_formula(row, col, value, the_format, result if result is not None else 0)
+            else:
+                worksheet.merge_range(row, col, row, col + colspan - 1, value, the_format)
+            self.n_merges += 1
             next_col = col + colspan
         else:
-            worksheet.write(row, col, value, self.get_fmt(cell, default=cell_format))
+            if result is not None:
+                worksheet.write_formula(row, col, value, self.get_fmt(cell, default=cell_format), result)
+            else:
+                worksheet.write(row, col, value, self.get_fmt(cell, default=cell_format))
             next_col = col + 1
         return next_col
 
-    def write_page(self, name, data, extra_headers, col_widths, show_table_caption):
+    def start_page(self, name, data, extra_headers, col_widths, show_table_caption):
         """
+        Adds the worksheet for a table and writes everything above the body rows: the page headers, the caption and
+        the table headers.
+
         :param name:
+        :param data: the table dict. Only the headers, caption and table info are used.
         :param extra_headers:
-        :param show_table_caption:
-        :param data:
         :param col_widths: a list, each element ['B:F', 12]. Widths are in chars of default font size. Set to 0 to hide.
-        :return:
+        :param show_table_caption:
+        :return: a Page, for write_row()
+        """
+        worksheet, row, first_data_row = self.add_sheet(name, data, extra_headers, col_widths, show_table_caption)
+        page = Page(worksheet, row, first_data_row, self.precompute_formulas)
+        page.name = name
+        page.spill_args = (data, extra_headers, col_widths, show_table_caption)
+        return page
+
+    def spill(self, page):
+        """
+        Continues the table of a full page on a new worksheet.
+
+        :param page: the Page, which moves to the new worksheet
+        """
+        page.sheets.append((page.worksheet.name, page.first_data_row, page.row))
+        suffix = ' ({})'.format(len(page.sheets) + 1)
+        name = page.worksheet.name if page.name is None else page.name
+        page.worksheet, page.row, page.first_data_row = self.add_sheet(name[:MAX_SHEET_NAME - len(suffix)] + suffix,
+                                                                       *page.spill_args)
+        if page.row >= self.spill_rows:
+            raise ValueError('spill_rows {} leaves no room for the rows of a table'.format(self.spill_rows))
+        page.col = 0
+        if page.values is not None:
+            page.window.clear()
+
+    def add_sheet(self, name, data, extra_headers, col_widths, show_table_caption):
+        """
+        Adds a worksheet and writes the rows above the body rows, see start_page().
+
+        :return: (the worksheet, the next row, the first data row)
         """
         worksheet = self.workbook.add_worksheet(name)
 
@@ -431,6 +580,13 @@ class PageToExcel(object):
         if data.get('caption') and show_table_caption:
             headers.append(data['caption'])
 
+        # Freeze. This and the column widths are set before any cell is written, so that every row, including the
+        # merged header rows and colspans, is written in order as constant_memory mode requires.
+        first_data_row = len(data['headers'])
+        if headers:
+            first_data_row += len(headers) + 1
+        configure_worksheet(worksheet, data['table'], first_data_row)
+
         row = 0
         if headers:
             for i, h in enumerate(headers):
@@ -447,67 +603,45 @@ class PageToExcel(object):
         for table_row in data['headers']:
             col = 0
             for cell in table_row:
-                col = self.write_cell(worksheet, row, col, cell, self.formats['header'])
+                col = self.write_cell(worksheet, row, col, cell, 'header')
             row += 1
 
-        # Freeze
-        configure_worksheet(worksheet, data['table'], row)
+        return worksheet, row, first_data_row
+
+    def write_row(self, page, table_row):
+        """
+        Writes a body or footer row at the next row of the page.
+
+        :param page: from start_page()
+        :param table_row: a list of parsed cells
+        """
+        if page.row >= self.row_limit:
+            if self.spill_rows is None:
+                raise ValueError('Worksheet {} is full: a worksheet has at most {} rows. Use spill_rows to continue '
+                                 'the table on more worksheets.'.format(page.worksheet.name, MAX_ROWS))
+            self.spill(page)
+        for cell in table_row:
+            page.col = self.write_cell(page.worksheet, page.row, page.col, cell, first_data_row=page.first_data_row,
+                                       page=page)
+        page.end_row()
+        self.n_rows += 1
+        self.n_cells += len(table_row)
+
+    def write_page(self, name, data, extra_headers, col_widths, show_table_caption):
+        """
+        :param name:
+        :param extra_headers:
+        :param show_table_caption:
+        :param data:
+        :param col_widths: a list, each element ['B:F', 12]. Widths are in chars of default font size. Set to 0 to hide.
+        :return:
+        """
+        page = self.start_page(name, data, extra_headers, col_widths, show_table_caption)
 
-        first_data_row = row
         # Write data ---------------------------------------------------------------------------------------
         for table_row in data['rows']:
-            col = 0
-            for cell in table_row:
-                col = self.write_cell(worksheet, row, col, cell, first_data_row=first_data_row)
-            row += 1
+            self.write_row(page, table_row)
 
         # Write data footers ---------------------------------------------------------------------------------------
         for table_row in data['footers']:
-            col = 0
-            for cell in table_row:
-                col = self.write_cell(worksheet, row, col, cell, first_data_row=first_data_row)
-            row += 1
-
-
-# ------------------------------------------------------------------------------------------------------------------
-class TestPageExcel(unittest.TestCase):
-    def test_make_formula(self):
-        formula = make_formula('SUM ROW A-C', 1, 2)
-        self.assertEqual(formula, '=SUM(A2:C2)')
-
-        formula = make_formula('SUM ROW A,C', 1, 2)
-        self.assertEqual(formula, '=SUM(A2+C2)')
-
-        formula = make_formula('SUM COL', 3, 2, first_data_row=1)
-        self.assertEqual(formula, '=SUM(C2:C3)')
-
-    def test_to_excel(self):
-        fp = open(os.path.join(settings.SITE_PATH, 'utils/table_to_csv_test_data.html'), 'rb')
-        self.html = fp.read()
-        fp.close()
-
-        full_page_to_excel(
-            'test_page_to_excel.xlsx',
-            self.html,
-            work_sheet_names=['Labor', 'Revenue'],
-            extra_headers=[['Header 1', 'Subheader 1'], ['Header 2']],
-            col_widths=[[('A:A', 20)], [['B:B', 30]]]
-        )
-
-    def test_formulas(self):
-        fp = open(os.path.join(settings.SITE_PATH, 'utils/simple_table_for_testing.html'), 'rb')
-        self.html = fp.read()
-        fp.close()
-
-        full_page_to_excel(
-            'test_page_to_excel.xlsx',
-            self.html,
-            work_sheet_names=['S1'],
-        )
-
-    def test_locate_cell(self):
-        current_row = 13
-        current_column = 5
-        # noinspection SpellCheckingInspection
-        x = locate_cells('colm001rowp000 + colm002rowp001', current_row, current_column)
-        self.assertEqual(x, 'E14 + D15')
+            self.write_row(page, table_row)
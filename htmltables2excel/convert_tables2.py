@@ -32,8 +32,8 @@ def parse_table(table):
     return parsed_rows
 
 
-def parse(html):
-    soup = BeautifulSoup(html, 'html.parser')
+def parse(html, parser='html.parser'):
+    soup = BeautifulSoup(html, parser)
     tables = soup.find_all('table')
 
     results = []
@@ -1,13 +1,20 @@
 import datetime
+import functools
 import json
 import os
 import traceback
 
-from django.conf import settings
-import django.core.mail
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
 
-from convert_tables import parse_tables_from_table_list, PageToExcel
+from convert_tables import table_list_to_excel, write_to_buffer
+from export_cache import make_key
+import jobs
+import metrics
+from metrics import as_metrics
+from table_json import decompress
+import uploads
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
 
 # noinspection PyMethodMayBeStatic
@@ -21,11 +28,29 @@ class PageToExcelViewMixin(object):
         <button onclick="page_to_excel();" class="btn btn-default btn-xs">Download Report</button>
 
     Add this to the js section of your page: {% include 'page_to_excel_js_include.html' %}
+
+    Set excel_async = True to convert in the background: the POST returns a job id at once and page_to_excel.js polls
+    for the status until the file is ready. The job queue is get_to_excel_job_queue().
+
+    When page_to_excel.js is made with direct_download, the POST response is the file itself: nothing is written to
+    MEDIA_ROOT (unless there is a cache) and there is no second request for the file. Background jobs are not used.
+
+    page_to_excel.js can post the table html, or the structured rows of the tables (optionally gzipped) so the server
+    does no HTML parsing. See get_posted_tables(). Big tables can be uploaded in chunks, see to_excel_upload().
+
+    Override get_to_excel_cache() to reuse the file when the same tables are exported again with the same params.
     """
+    excel_async = False
 
-    def get_excel_file_name(self, request):
+    def get_excel_base_name(self, request):
         assert hasattr(self, 'excel_base_name'), 'PageToExcelViewMixin Config Error: Add var excel_base_name to class'
-        base_name = request.POST.get('base_name', self.excel_base_name)
+        return request.POST.get('base_name', self.excel_base_name)
+
+    def get_excel_file_name(self, request):
+        # Imported here, so importing the mixin does not load the settings
+        from django.conf import settings
+
+        base_name = self.get_excel_base_name(request)
         csv_name = '%s_%s.xlsx' % (base_name, datetime.datetime.now().strftime('%Y_%m_%d_%H_%M'))
         url = settings.MEDIA_URL + csv_name
         full_path = os.path.join(settings.MEDIA_ROOT, csv_name)
@@ -39,27 +64,204 @@ class PageToExcelViewMixin(object):
         kwargs = {}
         return kwargs
 
+    def get_to_excel_parser(self):
+        """
+        The parser backend used to read the posted tables, see backends.py. lxml or selectolax are much faster when
+        installed.
+        """
+        return 'html.parser'
+
+    def get_to_excel_executor(self):
+        """
+        A concurrent.futures executor to parse the posted tables in parallel, or None to parse them one after the
+        other. Return a pool that lives as long as the process, e.g. a module level ProcessPoolExecutor, rather than
+        making one for each request.
+        """
+        return None
+
     def get_to_excel_excludes(self):
         """
         A list of table IDs to exclude. You probably will want to over-ride this.
         """
         return []
 
+    def get_to_excel_job_queue(self):
+        """
+        The queue for background conversions, see jobs.py. The default runs jobs on a thread pool shared by the
+        process. Every worker process has its own queue, so with more than one process use a queue backed by shared
+        storage instead.
+        """
+        return jobs.default_queue()
+
+    def get_to_excel_upload_store(self):
+        """
+        Where chunked uploads are kept, see uploads.py. The default is a directory in the system temp dir, so every
+        process on the host can take any chunk.
+        """
+        return uploads.default_store()
+
+    def get_to_excel_observer(self):
+        """
+        None, or a metrics.Observer that gets the phase timings and counts of each export, e.g. a module level
+        metrics.LoggingObserver() or metrics.PrometheusCollector().
+        """
+        return None
+
+    def get_to_excel_cache(self):
+        """
+        An export_cache.ExportCache, or None to write a new file for every export. Return a cache that lives as long
+        as the process, e.g.:
+
+            EXCEL_CACHE = ExportCache(os.path.join(settings.MEDIA_ROOT, 'excel_cache'),
+                                      settings.MEDIA_URL + 'excel_cache/', max_bytes=500 * 2 ** 20, max_age=24 * 3600)
+        """
+        return None
+
+    def mail_to_excel_error(self, request, error):
+        txt = '\n'.join(['Got error while rendering page to excel: ' + request.path,
+                         'User: ' + request.user.email,
+                         error])
+        from django.core.mail import mail_admins
+        mail_admins('HTS: Got error while rendering page to excel', txt)
+
+    def get_posted_tables(self, request):
+        """
+        :return: the list of tables posted by page_to_excel.js: table html, or table dicts for the structured payload
+            (see table_json.py). A gzipped payload is posted as the file tables_gz.
+        """
+        if 'tables_gz' in request.FILES:
+            return json.loads(decompress(request.FILES['tables_gz'].read()).decode('utf-8'))
+        return json.loads(request.POST['tables'])
+
+    def get_to_excel_build(self, request, to_excel_kwargs, parser, executor=None, observer=None):
+        """
+        :param executor: see get_to_excel_executor(). Leave it out for background jobs.
+        :param observer: None, a metrics.Observer or the Metrics of the request
+        :return: (key parts, build). build(file) writes the workbook to a path or file-like object. The key parts
+            identify the export for the cache, see export_cache.make_key().
+        """
+        if 'upload_id' in request.POST:
+            store = self.get_to_excel_upload_store()
+            upload_id = request.POST['upload_id']
+            n_chunks = int(request.POST['n_chunks'])
+            build = functools.partial(uploads.upload_to_excel, store=store, upload_id=upload_id, n_chunks=n_chunks,
+                                      to_excel_kwargs=to_excel_kwargs, observer=observer)
+            return (store.digest(upload_id, n_chunks), to_excel_kwargs), build
+
+        html_tables = self.get_posted_tables(request)
+        build = functools.partial(table_list_to_excel, table_list=html_tables, parser=parser,
+                                  to_excel_kwargs=to_excel_kwargs, executor=executor, observer=observer)
+        return (html_tables, to_excel_kwargs, parser), build
+
+    def discard_to_excel_upload(self, request):
+        """
+        Removes a chunked upload once the export is in the cache. build removes it when it runs, but on a cache hit it
+        does not run.
+        """
+        if 'upload_id' in request.POST:
+            self.get_to_excel_upload_store().discard(request.POST['upload_id'])
+
+    def to_excel_response(self, request, key_parts, build, cache):
+        """
+        :return: a FileResponse with the workbook as an attachment
+        """
+        if cache is not None:
+            base_name = self.get_excel_base_name(request)
+            file_full_path, file_url = cache.get_or_create(base_name, make_key(*key_parts), build)
+            self.discard_to_excel_upload(request)
+            buf = open(file_full_path, 'rb')
+        else:
+            file_full_path, file_url = self.get_excel_file_name(request)
+            buf = write_to_buffer(build)
+
+        # FileResponse sends the file in chunks and closes it when done
+        response = FileResponse(buf, content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(file_full_path)
+        return response
+
+    def to_excel_upload(self, request):
+        """
+        Starts a chunked upload, or stores a chunk of one. See uploads.py.
+        """
+        store = self.get_to_excel_upload_store()
+        if request.POST['to_excel_upload'] == 'start':
+            return JsonResponse({'success': True, 'upload_id': store.start()})
+
+        store.append(request.POST['upload_id'], request.POST['seq'], request.POST['chunk'])
+        return JsonResponse({'success': True})
+
+    def to_excel(self, request):
+        """
+        Writes the posted tables to excel, or starts a background job to write them.
+        """
+        to_excel_kwargs = self.get_to_excel_params()
+        parser = self.get_to_excel_parser()
+        cache = self.get_to_excel_cache()
+        direct = 'direct_download' in request.POST
+        background = self.excel_async and not direct
+
+        # A background job reports its own metrics when it ends
+        observer = self.get_to_excel_observer()
+        export_metrics = None if background else as_metrics(observer)
+        with metrics.exporting(export_metrics), metrics.timed(export_metrics, 'request'):
+            key_parts, build = self.get_to_excel_build(
+                request, to_excel_kwargs, parser, executor=None if background else self.get_to_excel_executor(),
+                observer=observer if background else export_metrics)
+
+            if direct:
+                return self.to_excel_response(request, key_parts, build, cache)
+
+            if cache is not None:
+                base_name = self.get_excel_base_name(request)
+                key = make_key(*key_parts)
+                file_url = cache.url(base_name, key)
+                if background and cache.get(base_name, key) is None:
+                    job_id = self.get_to_excel_job_queue().submit(
+                        cache.get_or_create, args=(base_name, key, build), meta={'file_url': file_url})
+                    return JsonResponse({'success': True, 'job_id': job_id})
+
+                cache.get_or_create(base_name, key, build)
+                self.discard_to_excel_upload(request)
+                return JsonResponse({'success': True, 'file_url': file_url})
+
+            file_full_path, file_url = self.get_excel_file_name(request)
+            if background:
+                job_id = self.get_to_excel_job_queue().submit(build, args=(file_full_path,),
+                                                              meta={'file_url': file_url})
+                return JsonResponse({'success': True, 'job_id': job_id})
+
+            build(file_full_path)
+            return JsonResponse({'success': True, 'file_url': file_url})
+
+    def to_excel_status(self, request):
+        status = self.get_to_excel_job_queue().status(request.POST.get('job_id'))
+        if status['state'] == jobs.DONE:
+            return JsonResponse({'success': True, 'state': status['state'], 'file_url': status['meta']['file_url']})
+        elif status['state'] == jobs.PENDING:
+            return JsonResponse({'success': True, 'state': status['state']})
+        else:
+            if status['state'] == jobs.FAILED:
+                self.mail_to_excel_error(request, status['error'])
+            return JsonResponse({'success': False, 'state': status['state']})
+
     def post(self, request, *args, **kwargs):
-        if request.is_ajax() and 'to_excel' in request.POST:
+        if request.is_ajax() and 'to_excel_status' in request.POST:
+            return self.to_excel_status(request)
+
+        elif request.is_ajax() and 'to_excel_upload' in request.POST:
             # noinspection PyBroadException
             try:
-                file_full_path, file_url = self.get_excel_file_name(request)
-                to_excel_kwargs = self.get_to_excel_params()
-                html_tables = json.loads(request.POST['tables'])
-                parsed_tables = parse_tables_from_table_list(html_tables)
-                PageToExcel(file_full_path, parsed_tables, **to_excel_kwargs)
-                return JsonResponse({'success': True, 'file_url': file_url})
+                return self.to_excel_upload(request)
+            except:
+                self.mail_to_excel_error(request, traceback.format_exc())
+                return JsonResponse({'success': False})
+
+        elif request.is_ajax() and 'to_excel' in request.POST:
+            # noinspection PyBroadException
+            try:
+                return self.to_excel(request)
             except:
-                txt = '\n'.join(['Got error while rendering page to excel: ' + request.path,
-                                 'User: ' + request.user.email,
-                                 traceback.format_exc()])
-                django.core.mail.mail_admins('HTS: Got error while rendering page to excel', txt)
+                self.mail_to_excel_error(request, traceback.format_exc())
                 return JsonResponse({'success': False})
 
         else:
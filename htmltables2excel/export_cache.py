@@ -0,0 +1,157 @@
+"""
+A content addressed cache of exported files.
+
+The key of an export is a hash of everything that goes into it, e.g. the posted tables and the PageToExcel params, so
+asking again for the same export returns the file already written. Requests for an export that is being written wait
+for it rather than writing it again (single flight, within a process). Files are evicted oldest use first when the cache
+is over its size, and when they are older than max_age.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def make_key(*parts):
+    """
+    :param parts: anything json can serialize. Anything else is serialized by repr().
+    :return: a hex digest
+    """
+    s = json.dumps(parts, sort_keys=True, default=repr, separators=(',', ':'))
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+class _Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.error = None
+
+
+class ExportCache(object):
+    def __init__(self, directory, url_prefix='', max_bytes=None, max_age=None, suffix='.xlsx'):
+        """
+        :param directory: where the files are kept. Every file in it with the suffix belongs to the cache.
+        :param url_prefix: the url of the directory, e.g. settings.MEDIA_URL + 'excel_cache/'
+        :param max_bytes: None or the most the files may add up to
+        :param max_age: None or the most seconds since a file was last used
+        :param suffix: the file extension
+        """
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def file_name(self, name, key):
+        return '{}_{}{}'.format(name, key[:32], self.suffix)
+
+    def path(self, name, key):
+        return os.path.join(self.directory, self.file_name(name, key))
+
+    def url(self, name, key):
+        return self.url_prefix + self.file_name(name, key)
+
+    def get(self, name, key):
+        """
+        :return: (full path, url) of the file if it is in the cache, else None
+        """
+        path = self.path(name, key)
+        if os.path.exists(path):
+            self.touch(path)
+            return path, self.url(name, key)
+        return None
+
+    def get_or_create(self, name, key, build):
+        """
+        :param name: the start of the file name, e.g. the report name
+        :param key: see make_key()
+        :param build: build(full_path) writes the file
+        :return: (full path, url) of the file
+        """
+        path = self.path(name, key)
+        with self.lock:
+            flight = self.in_flight.get(path)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[path] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            self.touch(path)
+            return path, self.url(name, key)
+
+        try:
+            if os.path.exists(path):
+                self.touch(path)
+            else:
+                # Write to a temp name first, so no one sees a half written file
+                temp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+                try:
+                    build(temp_path)
+                    os.rename(temp_path, path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                self.evict(keep=path)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[path]
+            flight.event.set()
+
+        return path, self.url(name, key)
+
+    def touch(self, path):
+        """Marks the file as used."""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """
+        Removes files older than max_age, then the least recently used files until the cache is under max_bytes.
+
+        :param keep: a path never to remove
+        :return: the number of files removed
+        """
+        now = time.time()
+        files = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(x[1] for x in files)
+        n_removed = 0
+        for mtime, size, path in files:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                continue
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            n_removed += 1
+        return n_removed
@@ -0,0 +1,215 @@
+"""
+Exports a page to several formats from a single parse.
+
+The page is parsed once into raw tables (see cells.py) and each row is handed to every sink as it is read, so an xlsx
+and a csv of the same report cost one parse, and with the 'stream' parser memory does not grow with the number of rows.
+
+A sink has these methods, called in this order for each table:
+
+    start_table(data, table): data is the parsed table dict without its rows (headers, caption and table info) and
+        table is the raw table (attrs, caption and raw header rows).
+    write_row(raw_row, cells): a body row, raw and parsed.
+    end_table(raw_footers, footers): the footer rows, raw and parsed.
+
+and close() once all the tables are written.
+"""
+import csv
+import json
+from collections import deque
+
+import six
+
+from backends import iter_raw_tables
+from cells import parse_raw_table
+from convert_tables import PageToExcel
+from page_to_csv import BUFFER_ROWS, parse_raw_row as csv_row
+
+
+class _TeeTable(object):
+    """A raw table that keeps each body row it reads until it is taken, to pair the raw rows with the parsed rows."""
+
+    def __init__(self, table):
+        self.table = table
+        self.attrs = table.attrs
+        self.caption = table.caption
+        self.headers = table.headers
+        self.raw_rows = deque()
+
+    @property
+    def footers(self):
+        return self.table.footers
+
+    def rows(self):
+        for row in self.table.rows():
+            self.raw_rows.append(row)
+            yield row
+
+    def drain(self):
+        self.table.drain()
+
+
+def _json_value(value):
+    """Dates are written in ISO format."""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return six.text_type(value)
+
+
+def _open(file_or_path):
+    """
+    :return: (text stream, True if it was opened here)
+    """
+    if isinstance(file_or_path, six.string_types):
+        return open(file_or_path, 'w', newline='', encoding='utf-8'), True
+    return file_or_path, False
+
+
+class ExcelSink(object):
+    def __init__(self, file_full_path, **kwargs):
+        """
+        :param file_full_path: a path or a file-like object
+        :param kwargs: the params of PageToExcel
+        """
+        constant_memory = kwargs.pop('constant_memory', False)
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(file_full_path, {'constant_memory': constant_memory})
+        self.writer = PageToExcel(file_full_path, [], external_workbook=self.workbook, **kwargs)
+        self.n_tables = 0
+        self.page = None
+
+    def start_table(self, data, table):
+        name, eh, cw, show_table_caption = self.writer.page_params(self.n_tables)
+        self.page = self.writer.start_page(name, data, eh, cw, show_table_caption)
+        self.n_tables += 1
+
+    def write_row(self, raw_row, cells):
+        self.writer.write_row(self.page, cells)
+
+    def end_table(self, raw_footers, footers):
+        for row in footers:
+            self.writer.write_row(self.page, row)
+
+    def close(self):
+        self.workbook.close()
+
+
+class CsvSink(object):
+    def __init__(self, file_or_path, extra_headers=None, buffer_rows=BUFFER_ROWS):
+        """
+        Writes the same rows as page_to_csv.page_to_csv().
+
+        :param file_or_path: a path or a text stream opened with newline=''
+        :param extra_headers: a list of lists of header text
+        :param buffer_rows: how many rows to hand to the csv writer at a time
+        """
+        self.stream, self.owned = _open(file_or_path)
+        self.writer = csv.writer(self.stream)
+        self.buffer_rows = buffer_rows
+        self.buf = list(extra_headers or [])
+
+    def _write(self, row):
+        self.buf.append(row)
+        if len(self.buf) >= self.buffer_rows:
+            self.writer.writerows(self.buf)
+            del self.buf[:]
+
+    def start_table(self, data, table):
+        if table.caption is not None:
+            self._write([table.caption])
+        if table.headers:
+            self._write([text for tag, attrs, text in table.headers[0] if tag == 'th'])
+
+    def write_row(self, raw_row, cells):
+        self._write(csv_row(raw_row))
+
+    def end_table(self, raw_footers, footers):
+        for row in raw_footers:
+            self._write(csv_row(row))
+        self._write([])
+
+    def close(self):
+        self.writer.writerows(self.buf)
+        del self.buf[:]
+        if self.owned:
+            self.stream.close()
+
+
+class JsonLinesSink(object):
+    def __init__(self, file_or_path):
+        """
+        Writes one JSON object per line: a line for each table,
+
+            {"table": 0, "id": "t1" or null, "caption": "Labor" or null}
+
+        then a line for each row of the table with the parsed cell values. The section is headers, rows or footers.
+
+            {"table": 0, "section": "rows", "values": [...]}
+
+        :param file_or_path: a path or a text stream
+        """
+        self.stream, self.owned = _open(file_or_path)
+        self.n_tables = 0
+
+    def _write(self, obj):
+        self.stream.write(json.dumps(obj, separators=(',', ':'), default=_json_value))
+        self.stream.write(u'\n')
+
+    def _write_row(self, section, cells):
+        self._write({'table': self.n_tables - 1, 'section': section, 'values': [x['value'] for x in cells]})
+
+    def start_table(self, data, table):
+        self._write({'table': self.n_tables, 'id': data['table'].attrs.get('id'), 'caption': data.get('caption')})
+        self.n_tables += 1
+        for row in data['headers']:
+            self._write_row('headers', row)
+
+    def write_row(self, raw_row, cells):
+        self._write_row('rows', cells)
+
+    def end_table(self, raw_footers, footers):
+        for row in footers:
+            self._write_row('footers', row)
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+
+def export(html, sinks, excluded_tables=None, parser=None, infer_types=False, include_tables=None):
+    """
+    Parses the page once and writes every table to each sink. The sinks are closed at the end.
+
+    :param html: the page: text, bytes or a file, see sources.py
+    :param sinks: a list of sinks, e.g. [ExcelSink('report.xlsx'), CsvSink('report.csv')]
+    :param excluded_tables: a list of table ids to skip, or any of the selectors of table_index.py
+    :param parser: the parser backend, see backends.py
+    :param infer_types: parse the body rows by inferred column type, see type_inference.py
+    :param include_tables: None for every table, or a list of the tables to write, see table_index.py
+    :return: a dict: {'tables': number of tables, 'rows': number of body rows}
+    """
+    if infer_types:
+        from type_inference import parse_raw_table_typed
+
+    counts = {'tables': 0, 'rows': 0}
+    try:
+        for raw_table in iter_raw_tables(html, excluded_tables, parser, include_tables):
+            table = _TeeTable(raw_table)
+            data = parse_raw_table_typed(table) if infer_types else parse_raw_table(table)
+            for sink in sinks:
+                sink.start_table(data, table)
+
+            for cells in data['rows']:
+                raw_row = table.raw_rows.popleft()
+                for sink in sinks:
+                    sink.write_row(raw_row, cells)
+                counts['rows'] += 1
+
+            footers = list(data['footers'])
+            for sink in sinks:
+                sink.end_table(table.footers, footers)
+            counts['tables'] += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+    return counts
@@ -0,0 +1,369 @@
+"""
+The named cell formats and the registry that composes them into xlsxwriter Formats.
+
+A cell can have several format classes (e.g. "money bold") on top of a default format (e.g. the header format) and a
+number format from its parsed value (money, percent or date). The registry merges all of them into a single Format.
+Formats are only added to the workbook when first used and each distinct combination is added once, so there are no
+duplicate formats in styles.xml.
+
+The inline style of a cell is applied last, over its classes, as in a browser. css_to_props() translates the
+properties xlsxwriter can show: color, background(-color), font-weight, font-style, font-size, font-family,
+text-decoration, text-align, vertical-align, white-space, border(-top/right/bottom/left) and mso-number-format, the
+number format property Excel itself writes when saving as HTML, e.g. mso-number-format:"0.0%". Each distinct style is
+translated once per registry, and cells whose classes and style merge to the same properties share one Format.
+"""
+import re
+
+import six
+
+from cells import Cell, style_key
+
+# The order matters: when two formats set the same property, the later one wins.
+DEFAULT_FORMATS = (
+    ('money', {'num_format': '$#,##0.00', 'align': 'right'}),
+    ('dollars', {'num_format': '$#,##0', 'align': 'right'}),
+    ('hours', {'num_format': '#,##0.0', 'align': 'right'}),
+    ('percent', {'num_format': '0.00%', 'align': 'right'}),
+    ('integer', {'num_format': '#,##0', 'align': 'right'}),
+
+    ('header', {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1}),
+    ('centered_header', {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1,
+                         'align': 'center_across'}),
+    ('right_header', {'bold': True, 'bg_color': '#CCCCCC', 'bottom_color': 'black', 'bottom': 1, 'align': 'right'}),
+    ('upper_header', {'bold': True, 'bg_color': '#CCCCCC'}),
+
+    ('bold', {'bold': True}),
+    ('underline', {'underline': 1}),
+    ('title', {'bold': True, 'font_size': 13}),
+    ('url', {'font_color': 'blue', 'underline': 1}),
+    ('right_align', {'align': 'right'}),
+    ('row_date', {'num_format': 'D-MMM'}),
+    ('date', {'num_format': 'yyyy-mm-dd'}),
+
+    # HTML-like formatting
+    ('th', {'bold': True}),
+    ('td', None),
+)
+
+# CSS color names, the rest are ignored
+CSS_COLORS = {
+    'black': '#000000', 'white': '#FFFFFF', 'red': '#FF0000', 'green': '#008000', 'blue': '#0000FF',
+    'yellow': '#FFFF00', 'gray': '#808080', 'grey': '#808080', 'silver': '#C0C0C0', 'maroon': '#800000',
+    'purple': '#800080', 'fuchsia': '#FF00FF', 'magenta': '#FF00FF', 'lime': '#00FF00', 'olive': '#808000',
+    'navy': '#000080', 'teal': '#008080', 'aqua': '#00FFFF', 'cyan': '#00FFFF', 'orange': '#FFA500',
+    'pink': '#FFC0CB', 'brown': '#A52A2A', 'gold': '#FFD700', 'lightgray': '#D3D3D3', 'lightgrey': '#D3D3D3',
+    'darkgray': '#A9A9A9', 'darkgrey': '#A9A9A9', 'darkred': '#8B0000', 'darkgreen': '#006400',
+    'darkblue': '#00008B', 'lightblue': '#ADD8E6', 'lightgreen': '#90EE90', 'lightyellow': '#FFFFE0',
+}
+# The number formats Excel names in mso-number-format
+MSO_NUMBER_FORMATS = {
+    'general': 'General', 'standard': '#,##0.00', 'fixed': '0.00', 'percent': '0.00%',
+    'short date': 'm/d/yyyy', 'medium date': 'd-mmm-yy', 'long date': 'dddd, mmmm d, yyyy',
+    'short time': 'h:mm', 'medium time': 'h:mm AM/PM', 'long time': 'h:mm:ss', '@': '@',
+}
+ALIGN = {'left': 'left', 'start': 'left', 'right': 'right', 'end': 'right', 'center': 'center', 'justify': 'justify'}
+VALIGN = {'top': 'top', 'middle': 'vcenter', 'bottom': 'bottom'}
+BORDER_WIDTHS = {'thin': 1, 'medium': 2, 'thick': 3}
+BORDER_SIDES = ('top', 'right', 'bottom', 'left')
+LENGTH_RE = re.compile(r'^([\d.]+)(px|pt)?$')
+RGB_RE = re.compile(r'^rgba?\(([^)]*)\)$')
+CSS_ESCAPE_RE = re.compile(r'\\(.)')
+# The space separated values of a shorthand property, e.g. "2px solid rgb(0, 0, 0)"
+CSS_TOKEN_RE = re.compile(r'[^\s(]+\([^)]*\)|\S+')
+
+
+def css_color(value):
+    """
+    :param value: a CSS color: #rgb, #rrggbb, rgb(), rgba() or a name in CSS_COLORS
+    :return: '#RRGGBB', or None for colors that are not shown (transparent) or not understood
+    """
+    value = value.strip().lower()
+    if value.startswith('#'):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = ''.join(x * 2 for x in digits)
+        if len(digits) == 6 and all(x in '0123456789abcdef' for x in digits):
+            return '#' + digits.upper()
+        return None
+
+    match = RGB_RE.match(value)
+    if match:
+        parts = [x.strip() for x in match.group(1).replace('/', ',').split(',')]
+        try:
+            if len(parts) == 4 and float(parts[3].rstrip('%')) == 0:
+                return None
+            rgb = [float(x[:-1]) * 255 / 100 if x.endswith('%') else float(x) for x in parts[:3]]
+        except ValueError:
+            return None
+        if len(rgb) < 3:
+            return None
+        return '#' + ''.join('{:02X}'.format(int(round(min(max(x, 0), 255)))) for x in rgb)
+
+    return CSS_COLORS.get(value)
+
+
+def css_length(value):
+    """
+    :return: the length in points, or None. Pixels are 3/4 of a point.
+    """
+    match = LENGTH_RE.match(value.strip().lower())
+    if not match:
+        return None
+    try:
+        n = float(match.group(1))
+    except ValueError:
+        return None
+    return n * 0.75 if match.group(2) != 'pt' else n
+
+
+def css_border(value):
+    """
+    :param value: a CSS border shorthand, e.g. "1px solid #000"
+    :return: (the xlsxwriter border style index, the color or None), or None if the border is not understood
+    """
+    width = 1
+    style = None
+    color = None
+    for token in CSS_TOKEN_RE.findall(value.lower()):
+        if token in ('none', 'hidden'):
+            return 0, None
+        elif token in ('solid', 'dashed', 'dotted', 'double'):
+            style = token
+        elif token in BORDER_WIDTHS:
+            width = BORDER_WIDTHS[token]
+        elif css_length(token) is not None:
+            points = css_length(token)
+            if points == 0:
+                return 0, None
+            width = 1 if points <= 1 else 2 if points <= 1.5 else 3
+        else:
+            color = css_color(token) or color
+    if style is None:
+        # A border with no style is not drawn
+        return None
+    index = {
+        'solid': {1: 1, 2: 2, 3: 5},
+        'dashed': {1: 3, 2: 8, 3: 8},
+        'dotted': {1: 4, 2: 4, 3: 4},
+        'double': {1: 6, 2: 6, 3: 6},
+    }[style][width]
+    return index, color
+
+
+def css_number_format(value):
+    """
+    :param value: a mso-number-format value, which can be quoted and use CSS escapes, e.g. "\\#\\,\\#\\#0"
+    :return: an Excel number format
+    """
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+        value = value[1:-1]
+    value = CSS_ESCAPE_RE.sub(r'\1', value)
+    return MSO_NUMBER_FORMATS.get(value.lower(), value)
+
+
+def css_to_props(style):
+    """
+    Translates the properties of an inline style that xlsxwriter can show into format params.
+
+    :param style: a parsed style attribute, see cells.style_to_dict()
+    :return: a dict of xlsxwriter format params, empty if there is nothing to show
+    """
+    props = {}
+    for name, value in six.iteritems(style):
+        value = value.strip()
+        if value.lower().endswith('!important'):
+            value = value[:-len('!important')].strip()
+        lower = value.lower()
+        if not value:
+            continue
+
+        if name == 'color':
+            color = css_color(value)
+            if color:
+                props['font_color'] = color
+        elif name in ('background-color', 'background'):
+            colors = [css_color(x) for x in CSS_TOKEN_RE.findall(value)] if name == 'background' else [css_color(value)]
+            colors = [x for x in colors if x]
+            if colors:
+                props['bg_color'] = colors[0]
+        elif name == 'font-weight':
+            if lower in ('bold', 'bolder') or (lower.isdigit() and int(lower) >= 600):
+                props['bold'] = True
+            elif lower in ('normal', 'lighter') or lower.isdigit():
+                props['bold'] = False
+        elif name == 'font-style':
+            props['italic'] = lower in ('italic', 'oblique')
+        elif name == 'font-size':
+            points = css_length(value)
+            if points:
+                props['font_size'] = round(points, 1)
+        elif name == 'font-family':
+            family = value.split(',')[0].strip().strip('"\'')
+            if family:
+                props['font_name'] = family
+        elif name in ('text-decoration', 'text-decoration-line'):
+            if 'underline' in lower:
+                props['underline'] = 1
+            if 'line-through' in lower:
+                props['font_strikeout'] = True
+        elif name == 'text-align':
+            if lower in ALIGN:
+                props['align'] = ALIGN[lower]
+        elif name == 'vertical-align':
+            if lower in VALIGN:
+                props['valign'] = VALIGN[lower]
+        elif name == 'white-space':
+            if lower in ('pre-wrap', 'pre-line', 'normal'):
+                props['text_wrap'] = lower != 'normal'
+        elif name == 'mso-number-format':
+            props['num_format'] = css_number_format(value)
+        elif name == 'border' or name[7:] in BORDER_SIDES and name.startswith('border-'):
+            border = css_border(value)
+            if border is None:
+                continue
+            index, color = border
+            key = 'border' if name == 'border' else name[7:]
+            if key == 'border':
+                for side in BORDER_SIDES:
+                    props.pop(side, None)
+                    props.pop(side + '_color', None)
+            props[key] = index
+            if color:
+                props[key + '_color'] = color
+    return props
+
+
+def cell_kind(cell):
+    """
+    :return: the name of the format implied by the parsed value of the cell, or None
+    """
+    if isinstance(cell, Cell):
+        return cell.kind
+    elif cell.get('is_money'):
+        return 'money'
+    elif cell.get('is_percent'):
+        return 'percent'
+    elif cell.get('is_date'):
+        return 'date'
+    return None
+
+
+class FormatRegistry(object):
+    def __init__(self, workbook, custom_formats=None, inline_styles=True):
+        """
+        :param workbook: an xlsxwriter workbook
+        :param custom_formats: None or a dict: {'class name': {format params}}. These replace any default format with
+            the same name and come after the defaults.
+        :param inline_styles: apply the style attribute of cells, see css_to_props()
+        """
+        self.workbook = workbook
+        self.inline_styles = inline_styles
+        self.props = {}
+        self.order = {}
+        self.n_defined = 0
+        for name, props in DEFAULT_FORMATS:
+            self[name] = props
+
+        if custom_formats:
+            for name, props in six.iteritems(custom_formats):
+                self[name] = props
+
+        # (classes tuple, default, kind, style key) -> Format. The fast path for cells.
+        self.cell_formats = {}
+        # (frozenset of format names, style props) -> Format
+        self.composed = {}
+        # style key -> format props
+        self.style_props = {}
+        # (sorted merged props) -> Format. Combinations with the same result share a Format.
+        self.by_props = {}
+
+    def __setitem__(self, name, props):
+        """
+        Adds or replaces a named format.
+
+        :param name: the format name
+        :param props: a dict of xlsxwriter format params, or None for no format
+        """
+        self.n_defined += 1
+        self.order[name] = self.n_defined
+        self.props[name] = props
+        self.cell_formats = {}
+        self.composed = {}
+
+    def __contains__(self, name):
+        return name in self.props
+
+    def __getitem__(self, name):
+        if name not in self.props:
+            raise KeyError(name)
+        return self.compose([name])
+
+    def get(self, name, default=None):
+        if name in self.props:
+            return self.compose([name])
+        return default
+
+    def compose(self, names, style_props=None):
+        """
+        :param names: format names, unknown names are ignored
+        :param style_props: None or a dict of format params from an inline style, applied after the named formats
+        :return: the Format merging the named formats, or None if none of them have any properties
+        """
+        key = frozenset([x for x in names if x in self.props])
+        if style_props:
+            key = (key, tuple(sorted((k, repr(v)) for k, v in six.iteritems(style_props))))
+        try:
+            return self.composed[key]
+        except KeyError:
+            pass
+
+        merged = {}
+        for name in sorted(key[0] if style_props else key, key=self.order.get):
+            merged.update(self.props[name] or {})
+        if style_props:
+            merged.update(style_props)
+
+        if merged:
+            props_key = tuple(sorted((k, repr(v)) for k, v in six.iteritems(merged)))
+            the_format = self.by_props.get(props_key)
+            if the_format is None:
+                the_format = self.workbook.add_format(merged)
+                self.by_props[props_key] = the_format
+        else:
+            the_format = None
+
+        self.composed[key] = the_format
+        return the_format
+
+    def inline_props(self, style, key):
+        """
+        :param style: a parsed style attribute
+        :param key: its cells.style_key()
+        :return: the format params of the style, translated once for each distinct style
+        """
+        try:
+            return self.style_props[key]
+        except KeyError:
+            props = self.style_props[key] = css_to_props(style)
+            return props
+
+    def cell_format(self, cell, default=None):
+        """
+        :param cell: a parsed cell
+        :param default: the name of the format the cell starts from, e.g. 'header'
+        :return: the Format for the cell: the default, then the format for its kind of value, then its classes, then
+            its inline style
+        """
+        attrs = cell['attrs']
+        classes = attrs.get('class')
+        style = attrs.get('style') if self.inline_styles else None
+        key = (tuple(classes) if classes else (), default, cell_kind(cell), style_key(style))
+        try:
+            return self.cell_formats[key]
+        except KeyError:
+            names = [key[1], key[2]] + list(key[0])
+            style_props = self.inline_props(style, key[3]) if key[3] is not None else None
+            the_format = self.compose([x for x in names if x], style_props)
+            self.cell_formats[key] = the_format
+            return the_format
@@ -0,0 +1,350 @@
+"""
+Excel formulas from the "data-excel" attribute of a cell.
+
+A column of a big table usually repeats the same data-excel string in every row, so each string is compiled once into
+a FormulaTemplate (the compiled templates are kept in an LRU cache) and rendering the formula for a cell is only string
+formatting. Bad formula strings raise a FormulaError when they are compiled, and relative formulas that refer to a
+cell before A1 when they are rendered. PageToExcel writes the cell's value instead of such a formula and logs a warning,
+so one bad attribute does not abort the export.
+
+evaluate() works out the result of a formula from the values already written, so it can be stored with the formula
+and the workbook shows it without recalculating. It knows SUM ROW, SUM COL and formulas that are only arithmetic on
+numbers and cell references. Anything else has no result.
+"""
+import re
+from functools import lru_cache
+
+CACHE_SIZE = 1024
+
+COL_NAME_RE = re.compile(r'^[A-Z]{1,3}$')
+# Cell location codes, see locate_cells(). The sign and digits are checked when compiled.
+LOCATION_RE = re.compile(r'(?P<kind>col|row)(?P<sign>[m,p])(?P<offset>\d+)')
+# The tokens of a formula evaluate() can work out
+TOKEN_RE = re.compile(r'\s*(?:(?P<number>\d+\.?\d*|\.\d+)|(?P<ref>\$?[A-Z]{1,3}\$?\d+)|(?P<op>[-+*/()]))')
+
+
+CELL_RE = re.compile(r'^\$?([A-Z]{1,3})\$?(\d+)$')
+
+
+@lru_cache(maxsize=None)
+def xl_col_to_name(col):
+    """
+    The same as xlsxwriter.utility.xl_col_to_name(), which is not imported so that importing this module does not
+    import xlsxwriter.
+
+    :param col: zero-based column number
+    :return: the column name, e.g. 'AB'
+    """
+    name = u''
+    col += 1
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+def xl_cell_to_rowcol(cell):
+    """
+    The same as xlsxwriter.utility.xl_cell_to_rowcol().
+
+    :param cell: a cell reference, e.g. 'B3' or '$B$3'
+    :return: (zero-based row, zero-based column)
+    """
+    match = CELL_RE.match(cell)
+    if match is None:
+        return 0, 0
+    col = 0
+    for c in match.group(1):
+        col = col * 26 + ord(c) - ord('A') + 1
+    return int(match.group(2)) - 1, col - 1
+
+
+class FormulaError(ValueError):
+    pass
+
+
+class FormulaTemplate(object):
+    """
+    A compiled formula string. render() makes the formula for a cell.
+
+        text: a str.format() template. {0} is the current row number (one based) and {1}, {2}... are the cell
+            locations.
+        locations: a list of (kind, offset) for each location in the text. kind is 'col' or 'row'.
+        sum_col: True for "SUM COL", which also needs the first data row.
+        sum_row: for "SUM ROW", the zero based columns to sum. None for other formulas.
+    """
+    __slots__ = ('formula_str', 'text', 'locations', 'sum_col', 'sum_row')
+
+    def __init__(self, formula_str, text, locations=(), sum_col=False, sum_row=None):
+        self.formula_str = formula_str
+        self.text = text
+        self.locations = tuple(locations)
+        self.sum_col = sum_col
+        self.sum_row = sum_row
+
+    def render(self, row, col, first_data_row=None, earlier_sheets=()):
+        """
+        :param row: zero based cell row
+        :param col: zero based cell column
+        :param first_data_row: zero based, for column formulas
+        :param earlier_sheets: for column formulas of a table continued from other worksheets, a list of (sheet name,
+            zero based first data row, zero based row after the last row) for each of them. Their rows are summed too.
+        :return: the formula
+        """
+        if self.sum_col:
+            if first_data_row is None:
+                raise FormulaError('"{}" needs the first data row'.format(self.formula_str))
+            col_name = xl_col_to_name(col)
+            formula = self.text.format(col_name, first_data_row + 1, row)
+            if earlier_sheets:
+                ranges = ["'{}'!{}{}:{}{}".format(name.replace("'", "''"), col_name, first + 1, col_name, end)
+                          for name, first, end in earlier_sheets]
+                formula = '=SUM({},{})'.format(','.join(ranges), formula[len('=SUM('):-1])
+            return formula
+
+        values = [row + 1]
+        for kind, offset in self.locations:
+            if kind == 'col':
+                if col + offset < 0:
+                    raise FormulaError('"{}" refers to a column before A'.format(self.formula_str))
+                values.append(xl_col_to_name(col + offset))
+            else:
+                if row + offset < 0:
+                    raise FormulaError('"{}" refers to a row before 1'.format(self.formula_str))
+                values.append(row + offset + 1)
+        return self.text.format(*values)
+
+
+def escape(s):
+    return s.replace('{', '{{').replace('}', '}}')
+
+
+def compile_relative(formula_str, text):
+    """
+    :param formula_str: the whole data-excel string, for error messages
+    :param text: the formula with cell location codes, see locate_cells()
+    :return: a FormulaTemplate
+    """
+    pieces = []
+    locations = []
+    start = 0
+    for match in LOCATION_RE.finditer(text):
+        sign = match.group('sign')
+        offset = match.group('offset')
+        if sign == ',' or len(offset) != 3:
+            raise FormulaError('Bad cell location "{}" in "{}". Use {}m000 or {}p000.'.format(
+                match.group(0), formula_str, match.group('kind'), match.group('kind')))
+
+        pieces.append(escape(text[start:match.start()]))
+        locations.append((match.group('kind'), int(offset) if sign == 'p' else -int(offset)))
+        pieces.append('{' + str(len(locations)) + '}')
+        start = match.end()
+    pieces.append(escape(text[start:]))
+    return FormulaTemplate(formula_str, '=' + ''.join(pieces), locations)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_formula(formula_str):
+    # noinspection SpellCheckingInspection
+    """
+    Allowed formula strings:
+
+        "SUM ROW A-C": sum the current row from A-C
+
+        "SUM ROW A,C": sum cells A and C in the current row
+
+        "SUM COL": sums current col from first_row to row - 1
+
+        "FORMULA RAW IF(F13 > 0, (F13-E13)/F13, '')": uses formula as is
+
+        "FORMULA RELATIVE IF(colm001rowp000 > 0, (colm001rowp000-colm002rowp000)/colm001rowp001, '')": creates the
+            formula relative to the current location. colm002 means two cols to the left of the current cell.
+            rowp000 means the current row plus 0 (e.g. the current row)
+
+    :param formula_str: the value of the "data-excel" tag
+    :return: a FormulaTemplate
+    """
+    parts = formula_str.split(' ')
+    func = parts[0]
+    func_modifier = parts[1] if len(parts) > 1 else None
+    args = parts[-1]
+
+    if func == 'SUM' and func_modifier == 'ROW' and len(parts) == 3:
+        if '-' in args:
+            cols = args.split('-')
+            separator = ':'
+        else:
+            cols = [x.strip() for x in args.split(',')]
+            separator = '+'
+
+        if len(cols) < 2 or (separator == ':' and len(cols) != 2) or not all(COL_NAME_RE.match(x) for x in cols):
+            raise FormulaError('Bad columns "{}" in "{}". Use A-C or A,C.'.format(args, formula_str))
+
+        col_numbers = [xl_cell_to_rowcol(x + '1')[1] for x in cols]
+        if separator == ':':
+            col_numbers = list(range(col_numbers[0], col_numbers[1] + 1))
+
+        # Put the row number after each col letter
+        return FormulaTemplate(formula_str, '=SUM({})'.format(separator.join([x + '{0}' for x in cols])),
+                               sum_row=tuple(col_numbers))
+
+    elif func == 'SUM' and func_modifier == 'COL' and len(parts) == 2:
+        return FormulaTemplate(formula_str, '=SUM({0}{1}:{0}{2})', sum_col=True)
+
+    elif func == 'FORMULA' and func_modifier == 'RAW' and len(parts) > 2:
+        return FormulaTemplate(formula_str, escape('=' + ' '.join(parts[2:])))
+
+    elif func == 'FORMULA' and func_modifier == 'RELATIVE' and len(parts) > 2:
+        return compile_relative(formula_str, ' '.join(parts[2:]))
+
+    raise FormulaError('Bad formula "{}". See formulas.compile_formula() for the allowed formulas.'.format(
+        formula_str))
+
+
+def locate_cells(formula, current_row, current_col):
+    """
+    Converts all cell location codes to an excel locations relative to the current cell. Cell location codes are
+    in the following format.
+
+    Cols: colmddd - the string col then either an m or a p then a 3 digit offset. m means the offset should be
+        subtracted from the current col. p means the offset should be added to the current col
+
+    Rows: rowpddd - similar to cols
+
+    :param formula: the formula string
+    :param current_row: zero based value of the current row
+    :param current_col: zero based value of the current col
+    :return: the formula with the row and column references in excel format (eg. B10).
+    """
+    return compile_relative(formula, formula).render(current_row, current_col)[1:]
+
+
+def make_formula(formula_str, row, col, first_data_row=None):
+    """
+    A cell will be written as a formula if the HTML tag has the attribute "data-excel" set. See compile_formula() for
+    the allowed formula strings.
+
+    Note that this function is called when the spreadsheet is being created. The cell it applies to knows where it
+    is and what the first data row is.
+
+    :param formula_str: the value of the "data-excel" tag containing params for generating the formula
+    :param row: cell row
+    :param col: cell column
+    :param first_data_row: for column formulas
+    :return: a string
+    """
+    return compile_formula(formula_str).render(row, col, first_data_row)
+
+
+class _NoResult(Exception):
+    pass
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def evaluate_arithmetic(text, lookup):
+    """
+    :param text: a formula without the "=", e.g. "(E14-D14)/E14"
+    :param lookup: see evaluate()
+    :return: the result, or None if the formula is not only arithmetic on numbers and known cells
+    """
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            return None
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        pos = match.end()
+    tokens.append(('end', None))
+    state = {'i': 0}
+
+    def peek():
+        return tokens[state['i']]
+
+    def take():
+        token = tokens[state['i']]
+        state['i'] += 1
+        return token
+
+    def factor():
+        kind, value = take()
+        if kind == 'op' and value in '+-':
+            result = factor()
+            return -result if value == '-' else result
+        elif kind == 'number':
+            return float(value)
+        elif kind == 'ref':
+            row, col = xl_cell_to_rowcol(value.replace('$', ''))
+            cell_value = lookup(row, col)
+            if cell_value == u'':
+                return 0.0
+            if not is_number(cell_value):
+                raise _NoResult()
+            return cell_value
+        elif kind == 'op' and value == '(':
+            result = expression()
+            if take() != ('op', ')'):
+                raise _NoResult()
+            return result
+        raise _NoResult()
+
+    def term():
+        result = factor()
+        while peek() in (('op', '*'), ('op', '/')):
+            op = take()[1]
+            right = factor()
+            if op == '*':
+                result *= right
+            elif right == 0:
+                raise _NoResult()
+            else:
+                result /= right
+        return result
+
+    def expression():
+        result = term()
+        while peek() in (('op', '+'), ('op', '-')):
+            op = take()[1]
+            right = term()
+            result = result + right if op == '+' else result - right
+        return result
+
+    try:
+        result = expression()
+    except _NoResult:
+        return None
+    if peek()[0] != 'end':
+        return None
+    return result
+
+
+def evaluate(template, formula, row, col, lookup, column_total):
+    """
+    :param template: the compiled formula
+    :param formula: the formula rendered for the cell
+    :param row: zero based cell row
+    :param col: zero based cell column
+    :param lookup: func(row, col) -> the value written to the cell: a number, u'' for an empty cell, or None if the
+        value is not known (not written yet, too far back, or a formula without a result)
+    :param column_total: func(col) -> the total of the column from the first data row to the row above, or None if
+        it is not known
+    :return: the result of the formula, or None
+    """
+    if template.sum_col:
+        return column_total(col)
+
+    if template.sum_row is not None:
+        total = 0
+        for col in template.sum_row:
+            value = lookup(row, col)
+            if value is None:
+                return None
+            if is_number(value):
+                total += value
+        return total
+
+    return evaluate_arithmetic(formula[1:], lookup)
@@ -0,0 +1,140 @@
+"""
+Job queues for converting tables in the background, so a web request does not wait for a big report to be written.
+
+A queue runs func(*args, **kwargs) and reports the state of the job by id. ExecutorJobQueue runs jobs on a
+concurrent.futures executor (a thread pool by default, or a process pool when the function and its arguments can be
+pickled). LocalJobQueue runs each job as soon as it is submitted; it is the stand-in for tests and development.
+Anything with the same submit() and status() methods, e.g. a wrapper around a task queue, can be used instead.
+"""
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+UNKNOWN = 'unknown'
+
+MAX_JOBS = 1000
+
+
+def run_job(func, args, kwargs):
+    """
+    Runs the job and catches any error, so the traceback survives the trip back from another process.
+
+    :return: (True, result) or (False, traceback text)
+    """
+    # noinspection PyBroadException
+    try:
+        return True, func(*args, **kwargs)
+    except:
+        return False, traceback.format_exc()
+
+
+class JobQueue(object):
+    def submit(self, func, args=(), kwargs=None, meta=None):
+        """
+        :param func: the job
+        :param args: positional args for func
+        :param kwargs: keyword args for func
+        :param meta: a dict returned with the status, e.g. the url of the file being made
+        :return: the job id
+        """
+        raise NotImplementedError
+
+    def status(self, job_id):
+        """
+        :return: a dict: {'job_id': job_id, 'state': state, 'result': result, 'error': traceback text, 'meta': meta}.
+            state is one of PENDING, DONE, FAILED or UNKNOWN.
+        """
+        raise NotImplementedError
+
+
+class ExecutorJobQueue(JobQueue):
+    def __init__(self, executor=None, max_jobs=MAX_JOBS):
+        """
+        :param executor: a concurrent.futures executor, defaults to a thread pool with 2 workers
+        :param max_jobs: how many jobs to remember. The oldest are forgotten first.
+        """
+        self.executor = executor or ThreadPoolExecutor(max_workers=2)
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, func, args=(), kwargs=None, meta=None):
+        job_id = uuid.uuid4().hex
+        future = self.executor.submit(run_job, func, tuple(args), kwargs or {})
+        with self.lock:
+            self.jobs[job_id] = (future, meta or {})
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+
+        status = {'job_id': job_id, 'state': UNKNOWN, 'result': None, 'error': None, 'meta': {}}
+        if job is None:
+            return status
+
+        future, status['meta'] = job
+        if not future.done():
+            status['state'] = PENDING
+        elif future.exception() is not None:
+            status['state'] = FAILED
+            status['error'] = repr(future.exception())
+        else:
+            ok, result = future.result()
+            if ok:
+                status['state'] = DONE
+                status['result'] = result
+            else:
+                status['state'] = FAILED
+                status['error'] = result
+        return status
+
+
+class LocalJobQueue(JobQueue):
+    """Runs each job when it is submitted."""
+
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+
+    def submit(self, func, args=(), kwargs=None, meta=None):
+        job_id = uuid.uuid4().hex
+        ok, result = run_job(func, tuple(args), kwargs or {})
+        self.jobs[job_id] = (ok, result, meta or {})
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job_id
+
+    def status(self, job_id):
+        status = {'job_id': job_id, 'state': UNKNOWN, 'result': None, 'error': None, 'meta': {}}
+        if job_id in self.jobs:
+            ok, result, status['meta'] = self.jobs[job_id]
+            if ok:
+                status['state'] = DONE
+                status['result'] = result
+            else:
+                status['state'] = FAILED
+                status['error'] = result
+        return status
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def default_queue():
+    """
+    :return: the ExecutorJobQueue shared by the process
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = ExecutorJobQueue()
+        return _default_queue
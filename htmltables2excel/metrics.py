@@ -0,0 +1,226 @@
+"""
+Phase timings and counters for exports, to find where the time of a slow export goes.
+
+Pass an observer to full_page_to_excel(), PageToExcel or the Django mixin (get_to_excel_observer()). Each export
+collects its metrics in a Metrics object and hands them to observer.observe() once, when it ends:
+
+    {'phases': {'parse': seconds, 'write': seconds, 'close': seconds, ...},
+     'counts': {'tables': n, 'rows': n, 'cells': n, 'merges': n, 'formulas': n},
+     'gauges': {'bytes_written': n, 'process_peak_memory_bytes': n, 'peak_memory_bytes': n}}
+
+parse is the time spent reading the tables and rows, write the time spent writing cells (including formulas and merged
+ranges) and close the time spent zipping the workbook. Rows from a streaming parser are parsed as they are written, so
+the two are timed row by row.
+
+process_peak_memory_bytes is the high-water mark of the whole process (ru_maxrss), not of the export: in a long running
+process every export after the biggest one reports the same value. For the peak of each export set trace_memory on the
+observer. peak_memory_bytes is then the most memory python allocated during the export, measured with tracemalloc,
+which slows the export down and counts the allocations of every thread, so it is meant for one export at a time.
+
+LoggingObserver logs a line for each export and PrometheusCollector keeps totals in the Prometheus text format.
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import six
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def process_peak_memory():
+    """
+    :return: the peak resident memory of the process since it started, in bytes, or None where it is not known
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Observer(object):
+    # Measure the peak memory of each export with tracemalloc, see the module docstring
+    trace_memory = False
+
+    def observe(self, metrics):
+        """
+        :param metrics: the metrics of one export, see the module docstring
+        """
+        raise NotImplementedError
+
+
+class Metrics(object):
+    def __init__(self, observer):
+        """
+        :param observer: an Observer
+        """
+        self.observer = observer
+        self.depth = 0
+        self.tracing = False
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.counts = {}
+        self.gauges = {}
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    @contextmanager
+    def export(self):
+        """
+        The span of an export. Exports can be nested, e.g. PageToExcel inside full_page_to_excel(). The metrics are
+        reported when the outermost one ends.
+        """
+        if self.depth == 0 and getattr(self.observer, 'trace_memory', False) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                if self.tracing:
+                    self.set('peak_memory_bytes', tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                    self.tracing = False
+                self.set('process_peak_memory_bytes', process_peak_memory())
+                metrics = self.as_dict()
+                self.reset()
+                self.observer.observe(metrics)
+
+    def as_dict(self):
+        return {'phases': dict(self.phases), 'counts': dict(self.counts), 'gauges': dict(self.gauges)}
+
+
+def as_metrics(observer):
+    """
+    :param observer: None, an Observer, or the Metrics of an enclosing export
+    :return: None or a Metrics
+    """
+    if observer is None or isinstance(observer, Metrics):
+        return observer
+    return Metrics(observer)
+
+
+@contextmanager
+def exporting(metrics):
+    """Metrics.export() for a Metrics or None."""
+    if metrics is None:
+        yield None
+    else:
+        with metrics.export():
+            yield metrics
+
+
+@contextmanager
+def timed(metrics, phase):
+    """Metrics.timed() for a Metrics or None."""
+    if metrics is None:
+        yield
+    else:
+        with metrics.timed(phase):
+            yield
+
+
+class MultiObserver(Observer):
+    def __init__(self, observers):
+        self.observers = observers
+
+    def observe(self, metrics):
+        for observer in self.observers:
+            observer.observe(metrics)
+
+
+class LoggingObserver(Observer):
+    def __init__(self, logger=None, level=None):
+        """
+        :param logger: a logger, defaults to the htmltables2excel logger
+        :param level: the level of the log lines, defaults to INFO
+        """
+        import logging
+
+        self.logger = logger or logging.getLogger('htmltables2excel')
+        self.level = level if level is not None else logging.INFO
+
+    def observe(self, metrics):
+        parts = ['{}={:.3f}s'.format(k, v) for k, v in sorted(metrics['phases'].items())]
+        parts += ['{}={}'.format(k, v) for k, v in sorted(metrics['counts'].items())]
+        parts += ['{}={}'.format(k, v) for k, v in sorted(metrics['gauges'].items()) if v is not None]
+        self.logger.log(self.level, 'Excel export: %s', ' '.join(parts))
+
+
+class PrometheusCollector(Observer):
+    def __init__(self, prefix='htmltables2excel'):
+        """
+        Totals over all the exports, for a metrics endpoint. Serve exposition() with the content type
+        'text/plain; version=0.0.4'.
+
+        :param prefix: the start of the metric names
+        """
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.n_exports = 0
+        self.phase_seconds = {}
+        self.phase_counts = {}
+        self.counts = {}
+        self.gauges = {}
+
+    def observe(self, metrics):
+        with self.lock:
+            self.n_exports += 1
+            for phase, seconds in six.iteritems(metrics['phases']):
+                self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+                self.phase_counts[phase] = self.phase_counts.get(phase, 0) + 1
+            for name, n in six.iteritems(metrics['counts']):
+                self.counts[name] = self.counts.get(name, 0) + n
+            for name, value in six.iteritems(metrics['gauges']):
+                if value is not None:
+                    self.gauges[name] = value
+
+    def exposition(self):
+        """
+        :return: the metrics in the Prometheus text format
+        """
+        p = self.prefix
+        with self.lock:
+            lines = ['# HELP {}_exports_total Exports finished.'.format(p),
+                     '# TYPE {}_exports_total counter'.format(p),
+                     '{}_exports_total {}'.format(p, self.n_exports)]
+
+            lines += ['# HELP {}_phase_seconds Time spent in each phase of an export.'.format(p),
+                      '# TYPE {}_phase_seconds summary'.format(p)]
+            for phase in sorted(self.phase_seconds):
+                lines.append('{}_phase_seconds_sum{{phase="{}"}} {!r}'.format(p, phase, self.phase_seconds[phase]))
+                lines.append('{}_phase_seconds_count{{phase="{}"}} {}'.format(p, phase, self.phase_counts[phase]))
+
+            for name in sorted(self.counts):
+                lines += ['# TYPE {}_{}_total counter'.format(p, name),
+                          '{}_{}_total {}'.format(p, name, self.counts[name])]
+
+            for name in sorted(self.gauges):
+                lines += ['# TYPE {}_last_{} gauge'.format(p, name),
+                          '{}_last_{} {}'.format(p, name, self.gauges[name])]
+        return '\n'.join(lines) + '\n'
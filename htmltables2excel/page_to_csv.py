@@ -1,8 +1,9 @@
-import unittest
-import os
 import csv
 
-from bs4 import BeautifulSoup
+from backends import iter_raw_tables
+
+# Rows are handed to the csv writer this many at a time
+BUFFER_ROWS = 1000
 
 
 def remove_dollar_sign(s):
@@ -12,104 +13,133 @@ def remove_dollar_sign(s):
         return s
 
 
-def clean_cell(cell):
-    if cell.string:
-        s = str(cell.string).strip()
-        if s is None or s == u'\n' or len(s) == 0:
-            return ''
-        else:
-            return remove_dollar_sign(s)
-    else:
-        s = remove_dollar_sign(''.join([x for x in cell.stripped_strings]))
-        return s
-
-
-def parse_table(table):
-    rows = []
-    if table.caption:
-        title = table.caption.string
-        rows.append([title])
+def iter_raw_table_rows(table):
+    """
+    :param table: a raw table from one of the parser backends
+    :return: a generator of the csv rows of the table, see parse_raw_table()
+    """
+    if table.caption is not None:
+        yield [table.caption]
 
-    header = [x.string for x in table.thead.tr.find_all('th')]
-    rows.append(header)
+    if table.headers:
+        yield [text for tag, attrs, text in table.headers[0] if tag == 'th']
 
-    table_rows = table.tbody.find_all('tr')
-    if table.tfoot:
-        table_rows += table.tfoot.find_all('tr')
+    for row in table.rows():
+        yield parse_raw_row(row)
+    for row in table.footers:
+        yield parse_raw_row(row)
+    yield []
 
-    for row in table_rows:
-        csv_row = []
-        for cell in row.find_all('td'):
-            colspan = int(cell.attrs.get('colspan', '0'))
-            for i in range(max(0, colspan - 1)):
-                csv_row.append(u'')
 
-            s = clean_cell(cell)
-            csv_row.append(s)
-        rows.append(csv_row)
-    rows.append([])
-    return rows
+def parse_raw_table(table):
+    """
+    :param table: a raw table from one of the parser backends
+    :return: a list of the csv rows of the table: the caption, the first header row, then the body and footer rows.
+        Only td cells are written in body and footer rows, a colspan adds empty cells before the text.
+    """
+    return list(iter_raw_table_rows(table))
 
 
-def parse_row(row, cell_type):
+def parse_raw_row(row, cell_type='td'):
     result = []
-    for cell in row.find_all(cell_type):
-        colspan = int(cell.attrs.get('colspan', '0'))
+    for tag, attrs, text in row:
+        if tag != cell_type:
+            continue
+
+        colspan = int(attrs.get('colspan', '0'))
         for i in range(max(0, colspan - 1)):
             result.append(u'')
-
-        s = clean_cell(cell)
-        result.append(s)
+        result.append(remove_dollar_sign(text))
     return result
 
 
-def parse_tables(html, excluded_tables, parse_table_func):
-    soup = BeautifulSoup(html, 'html.parser')
-    tables = soup.find_all('table')
+def iter_csv_rows(html, extra_headers=None, excluded_tables=None, parser=None, counts=None, include_tables=None):
+    """
+    :param counts: None or a dict. 'tables' and 'rows' are set to the number of tables and rows read so far.
+    :param include_tables: None for every table, or a list of the tables to read, see table_index.py
+    :return: a generator of the csv rows of the page: the extra headers, then the rows of each table
+    """
+    if counts is None:
+        counts = {}
+    counts['tables'] = 0
+    counts['rows'] = 0
 
-    parsed_tables = []
-    for table in tables:
-        table_id = table.attrs.get(u'id')
-        if table_id not in excluded_tables:
-            parsed_tables.append(parse_table_func(table))
-    return parsed_tables
+    for row in extra_headers or []:
+        counts['rows'] += 1
+        yield row
 
+    for table in iter_raw_tables(html, excluded_tables, parser, include_tables):
+        counts['tables'] += 1
+        for row in iter_raw_table_rows(table):
+            counts['rows'] += 1
+            yield row
 
-def page_to_csv(file_full_path, html,  extra_headers=None, excluded_tables=None):
+
+def write_csv_rows(stream, rows, buffer_rows=BUFFER_ROWS):
+    """
+    Writes rows to a text stream as they are read. Only buffer_rows rows are held at a time.
+
+    :param stream: a text stream opened with newline=''
+    :param rows: an iterable of rows
+    :param buffer_rows: how many rows to hand to the csv writer at a time
+    :return: a generator of the rows. They are written as the generator is read.
+    """
+    writer = csv.writer(stream)
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= buffer_rows:
+            writer.writerows(buf)
+            del buf[:]
+        yield row
+    if buf:
+        writer.writerows(buf)
+
+
+def stream_csv(stream, html, extra_headers=None, excluded_tables=None, parser=None, buffer_rows=BUFFER_ROWS,
+               include_tables=None):
+    """
+    Writes the tables of a page to a text stream, e.g. an open file or a response. Memory does not grow with the
+    number of rows when the parser is 'stream'.
+
+    :param stream: a text stream opened with newline=''
+    :return: a dict: {'tables': number of tables, 'rows': number of rows}
+    """
+    counts = {}
+    rows = iter_csv_rows(html, extra_headers, excluded_tables, parser, counts, include_tables)
+    for _ in write_csv_rows(stream, rows, buffer_rows):
+        pass
+    return counts
+
+
+def page_to_csv(file_full_path, html,  extra_headers=None, excluded_tables=None, parser=None, iter_rows=False,
+                buffer_rows=BUFFER_ROWS, buffering=-1, include_tables=None):
     """
     Page can contain one or more tables. The tables need to be well structured (eg. thead, tbody. tfoot)
 
     :param file_full_path:
-    :param html:
+    :param html: the page: text, bytes or a file, see sources.py. With parser='stream' a file is read in chunks.
     :param extra_headers: a list of lists of header text
-    :param excluded_tables: a list of table ids to be excluded.
-    :return:
+    :param excluded_tables: a list of table ids to be excluded, or any of the selectors of table_index.py
+    :param parser: the parser backend, see backends.py. Defaults to html.parser.
+    :param iter_rows: return a generator of the rows instead of the counts. The file is written as it is read.
+    :param buffer_rows: how many rows to hand to the csv writer at a time
+    :param buffering: the buffer size of the file, see open()
+    :param include_tables: None for every table, or a list of the tables to write, see table_index.py. Tables that
+        are not written are never parsed.
+    :return: a dict: {'tables': number of tables, 'rows': number of rows}, or a generator of rows
     """
-    csv_rows = extra_headers or []
-    parsed_tables = parse_tables(html, excluded_tables or [], parse_table)
-
-    for table in parsed_tables:
-        csv_rows += table
-
-    fp = open(file_full_path, 'wb')
-    writer = csv.writer(fp)
-    for row in csv_rows:
-        writer.writerow(row)
-    fp.close()
-    return csv_rows
-
-
-class TestPageToCSV(unittest.TestCase):
-    def setUp(self):
-        fp = open(os.path.join('data_for_tests/table_to_csv_test_data.html'), 'rb')
-        self.html = fp.read()
-        fp.close()
-
-    def test_1(self):
-        path = 'page_to_csv.csv'
-        rows = page_to_csv(path, self.html)
-        self.assertTrue(os.path.exists(path))
-        self.assertEqual(len(rows), 291)
-        self.assertEqual(rows[-2], ['', '', 'Total', '28,852.00'])
-        self.assertEqual(rows[180], [u'', u'', u'', u'', 'Total', '1,282.00', '3.50', '57,190.99', u'', 'NB = 0.27%'])
-        self.assertEqual(rows[179][9], '1121927')
+    if iter_rows:
+        return _iter_page_to_csv(file_full_path, html, extra_headers, excluded_tables, parser, buffer_rows,
+                                 buffering, include_tables)
+
+    with open(file_full_path, 'w', newline='', encoding='utf-8', buffering=buffering) as fp:
+        return stream_csv(fp, html, extra_headers, excluded_tables, parser, buffer_rows, include_tables)
+
+
+def _iter_page_to_csv(file_full_path, html, extra_headers, excluded_tables, parser, buffer_rows, buffering,
+                      include_tables):
+    with open(file_full_path, 'w', newline='', encoding='utf-8', buffering=buffering) as fp:
+        rows = iter_csv_rows(html, extra_headers, excluded_tables, parser, include_tables=include_tables)
+        for row in write_csv_rows(fp, rows, buffer_rows):
+            yield row
@@ -2,7 +2,8 @@
  * Created by chuck on 10/7/15.
  *
  * Creates an excel file by uploading the tables on the page to the server. On the server, the tables are converted
- * to an excel file, then the page calls that link and the file is downloaded.
+ * to an excel file, then the page calls that link and the file is downloaded. With direct_download, the file comes
+ * back in the response instead.
  *
  * Requires jquery
  *
@@ -11,11 +12,21 @@
  *  excludes: a list of table IDs to exclude
  *  csrf_token: from Django, you can get it as {{ csrf_token }}
  *  page_to_excel_url: url to call to create excel. If you leave it undefined, then it will call the page its on
+ *  poll_interval: milliseconds between status checks when the server converts in the background (the view sets
+ *      excel_async). Defaults to 1000.
+ *  direct_download: when true, the server sends the file back as the response to the POST and the browser saves it
+ *      from there, so there is no second request and no file left on the server. Defaults to false.
+ *  payload: what is sent for each table. 'html' (the default) sends the table html. 'rows' sends the text, class,
+ *      colspan, data-excel and style of each cell, which is much smaller and needs no HTML parsing on the server (see
+ *      table_json.py). 'rows_gz' sends the rows gzipped, where the browser has CompressionStream, else as 'rows'.
+ *      'chunks' uploads the rows a few at a time (see uploads.py), for tables too big to send in one request.
+ *  chunk_rows: the number of body rows in each chunk with the 'chunks' payload. Defaults to 1000.
  *
  *
  */
 
-make_page_to_excel_func = function(excludes, csrf_token, page_to_excel_url){
+make_page_to_excel_func = function(excludes, csrf_token, page_to_excel_url, poll_interval, direct_download, payload,
+                                   chunk_rows){
     var include;
     var the_tables = [];
 
@@ -23,6 +34,241 @@ make_page_to_excel_func = function(excludes, csrf_token, page_to_excel_url){
         page_to_excel_url = window.location;
     }
 
+    if (poll_interval === undefined){
+        poll_interval = 1000;
+    }
+
+    if (chunk_rows === undefined){
+        chunk_rows = 1000;
+    }
+
+    if (payload === 'rows_gz' && typeof CompressionStream === 'undefined'){
+        payload = 'rows';
+    }
+
+    // The text of a cell, the same as the server gets from the html: each string stripped then joined.
+    var cell_text = function(node){
+        var text = '';
+        var walker = document.createTreeWalker(node, NodeFilter.SHOW_TEXT, null, false);
+        while(walker.nextNode()){
+            text += walker.currentNode.nodeValue.trim();
+        }
+        return text;
+    };
+
+    // [text, class, colspan, data-excel, tag, style], leaving out the trailing empty items.
+    var cell_row = function(tr, default_tag){
+        var row = [];
+        $(tr).children('th,td').each(function(i, td){
+            var tag = td.tagName.toLowerCase();
+            var cell = [cell_text(td), td.className || null, td.colSpan > 1 ? td.colSpan : null,
+                td.getAttribute('data-excel'), tag === default_tag ? null : tag, td.getAttribute('style')];
+            while(cell.length > 1 && (cell[cell.length - 1] === null || cell[cell.length - 1] === '')){
+                cell.pop();
+            }
+            row.push(cell.length === 1 ? cell[0] : cell);
+        });
+        return row;
+    };
+
+    // The tr elements of each section of a table, leaving out the rows of tables nested in it.
+    var table_sections = function(a_table){
+        var sections = {headers: [], rows: [], footers: []};
+        $.each(a_table.rows, function(i, tr){
+            if(tr.parentNode !== a_table && tr.parentNode.parentNode !== a_table){
+                return;
+            }
+            var section = tr.parentNode.tagName.toLowerCase();
+            if(section === 'thead'){
+                sections.headers.push(tr);
+            } else if(section === 'tfoot'){
+                sections.footers.push(tr);
+            } else {
+                sections.rows.push(tr);
+            }
+        });
+        return sections;
+    };
+
+    var cell_rows = function(trs, default_tag){
+        var rows = [];
+        for(var i = 0; i < trs.length; i++){
+            rows.push(cell_row(trs[i], default_tag));
+        }
+        return rows;
+    };
+
+    // The structured payload for a table, see table_json.py. Without the rows when sections is undefined.
+    var table_rows = function(a_table, sections){
+        var data = {attrs: {}, caption: null};
+        $.each(['id', 'data-excel'], function(i, name){
+            if(a_table.hasAttribute(name)){
+                data.attrs[name] = a_table.getAttribute(name);
+            }
+        });
+        if(a_table.caption){
+            data.caption = cell_text(a_table.caption);
+        }
+        if(sections !== undefined){
+            data.headers = cell_rows(sections.headers, 'th');
+            data.rows = cell_rows(sections.rows, 'td');
+            data.footers = cell_rows(sections.footers, 'td');
+        }
+        return data;
+    };
+
+    // Uploads the tables chunk_rows rows at a time, see uploads.py, then calls done(upload_id, n_chunks). A chunk
+    // that fails is sent again, up to 3 times.
+    var upload = function(done){
+        var plan = [];
+        $.each(the_tables, function(t, a_table){
+            var sections = table_sections(a_table);
+            var n = Math.max(1, Math.ceil(sections.rows.length / chunk_rows));
+            for(var i = 0; i < n; i++){
+                plan.push({table: t, element: a_table, sections: sections, first: i === 0, last: i === n - 1,
+                    start: i * chunk_rows});
+            }
+        });
+
+        var send = function(upload_id, seq, tries){
+            if(seq === plan.length){
+                done(upload_id, plan.length);
+                return;
+            }
+
+            var item = plan[seq];
+            var chunk = item.first ? table_rows(item.element) : {};
+            chunk.table = item.table;
+            if(item.first){
+                chunk.headers = cell_rows(item.sections.headers, 'th');
+            }
+            chunk.rows = cell_rows(item.sections.rows.slice(item.start, item.start + chunk_rows), 'td');
+            if(item.last){
+                chunk.footers = cell_rows(item.sections.footers, 'td');
+            }
+
+            $.ajax({
+                method: "POST",
+                url: page_to_excel_url,
+                data: {'to_excel_upload': 'chunk', 'upload_id': upload_id, 'seq': seq, 'chunk': JSON.stringify(chunk),
+                    csrfmiddlewaretoken: csrf_token}
+            }).done(function (content) {
+                if(content.success){
+                    send(upload_id, seq + 1, 0);
+                } else {
+                    alert( "Error creating file");
+                }
+            }).fail(function(){
+                if(tries < 3){
+                    setTimeout(function(){send(upload_id, seq, tries + 1);}, 1000 * (tries + 1));
+                } else {
+                    alert( "Error creating file");
+                }
+            });
+        };
+
+        $.ajax({
+            method: "POST",
+            url: page_to_excel_url,
+            data: {'to_excel_upload': 'start', csrfmiddlewaretoken: csrf_token}
+        }).done(function (content) {
+            if(content.success){
+                /** @namespace content.upload_id */
+                send(content.upload_id, 0, 0);
+            } else {
+                alert( "Error creating file");
+            }
+        });
+    };
+
+    // Calls done(form) with the form data for the current table content.
+    var make_form = function(done){
+        var form = new FormData();
+        var tables = [];
+        form.append('to_excel', true);
+        form.append('csrfmiddlewaretoken', csrf_token);
+        if(direct_download){
+            form.append('direct_download', true);
+        }
+
+        if(payload === 'chunks'){
+            upload(function(upload_id, n_chunks){
+                form.append('upload_id', upload_id);
+                form.append('n_chunks', n_chunks);
+                done(form);
+            });
+            return;
+        }
+
+        // Get current table content
+        $.each(the_tables, function(i, v){
+            tables.push(payload === 'rows' || payload === 'rows_gz' ? table_rows(v, table_sections(v)) :
+                $(v).prop('outerHTML'));
+        });
+
+        if(payload === 'rows_gz'){
+            var stream = new Blob([JSON.stringify(tables)]).stream().pipeThrough(new CompressionStream('gzip'));
+            new Response(stream).blob().then(function(blob){
+                form.append('tables_gz', blob, 'tables.json.gz');
+                done(form);
+            });
+        } else {
+            form.append('tables', JSON.stringify(tables));
+            done(form);
+        }
+    };
+
+    // Posts the tables and saves the file sent back in the response.
+    var download = function(form){
+        var xhr = new XMLHttpRequest();
+        xhr.open('POST', page_to_excel_url);
+        xhr.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+        xhr.responseType = 'blob';
+        xhr.onload = function(){
+            var content_type = xhr.getResponseHeader('Content-Type') || '';
+            if(xhr.status !== 200 || content_type.indexOf('application/json') === 0){
+                alert( "Error creating file");
+                return;
+            }
+
+            var file_name = 'report.xlsx';
+            var match = /filename="([^"]+)"/.exec(xhr.getResponseHeader('Content-Disposition') || '');
+            if(match){
+                file_name = match[1];
+            }
+
+            var url = window.URL.createObjectURL(xhr.response);
+            var link = document.createElement('a');
+            link.href = url;
+            link.download = file_name;
+            document.body.appendChild(link);
+            link.click();
+            document.body.removeChild(link);
+            setTimeout(function(){window.URL.revokeObjectURL(url);}, 1000);
+        };
+        xhr.onerror = function(){
+            alert( "Error creating file");
+        };
+        xhr.send(form);
+    };
+
+    // Asks for the state of a background conversion until the file is ready.
+    var poll = function(job_id){
+        $.ajax({
+            method: "POST",
+            url: page_to_excel_url,
+            data: {'to_excel_status': true, 'job_id': job_id, csrfmiddlewaretoken: csrf_token}
+        }).done(function (content) {
+            if(!content.success){
+                alert( "Error creating file");
+            } else if(content.state === 'done'){
+                window.location.href = content.file_url;
+            } else {
+                setTimeout(function(){poll(job_id);}, poll_interval);
+            }
+        });
+    };
+
     // Make a list of tables. Grab the content on demand so that it matches the sorting applied by the user.
     $('table').each(function(i1, a_table){
         include = true;
@@ -37,22 +283,29 @@ make_page_to_excel_func = function(excludes, csrf_token, page_to_excel_url){
     });
 
     return function(){
-        var table_html = [];
-
-        // Get current table content
-        $.each(the_tables, function(i, v){table_html.push($(v).prop('outerHTML'))});
-
-        $.ajax({
-            method: "POST",
-            url: page_to_excel_url,
-            data: {'tables': JSON.stringify(table_html), 'to_excel': true, csrfmiddlewaretoken: csrf_token}
-        }).done(function (content) {
-            if(content.success){
-                /** @namespace content.file_url */
-                window.location.href = content.file_url;
-            } else {
-                alert( "Error creating file");
+        make_form(function(form){
+            if(direct_download){
+                download(form);
+                return;
             }
+
+            $.ajax({
+                method: "POST",
+                url: page_to_excel_url,
+                data: form,
+                processData: false,
+                contentType: false
+            }).done(function (content) {
+                if(content.success && content.job_id !== undefined){
+                    /** @namespace content.job_id */
+                    poll(content.job_id);
+                } else if(content.success){
+                    /** @namespace content.file_url */
+                    window.location.href = content.file_url;
+                } else {
+                    alert( "Error creating file");
+                }
+            });
         });
     }
 };
@@ -0,0 +1,95 @@
+"""
+Pages read from files. Wherever a page is taken as text or bytes it can also be given as a file:
+
+    an os.PathLike path, e.g. pathlib.Path('report.html'). A str is always the html itself, never a path.
+    a binary file object, e.g. open('report.html', 'rb') or a response body. It is read from its current position.
+    an mmap.mmap of the page.
+
+The stream parser reads a file in chunks and decodes it incrementally, so memory does not grow with the size of the
+page. Selecting tables (see table_index.py) memory-maps the file when it can and parses only the selected tables. The
+other parsers build a tree of the whole page, so the file is read in one piece for them, once.
+"""
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+import six
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_file_source(source):
+    """
+    :return: True if source is a path, a file object or an mmap rather than the page itself
+    """
+    return isinstance(source, mmap.mmap) or hasattr(source, 'read') or hasattr(source, '__fspath__')
+
+
+def iter_file_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    :param source: a path, a file object or an mmap
+    :param chunk_size: the most bytes (or characters, for a text file object) in a chunk
+    :return: a generator of the chunks of the file
+    """
+    if isinstance(source, mmap.mmap):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        with open(source, 'rb') as fp:
+            for chunk in iter_file_chunks(fp, chunk_size):
+                yield chunk
+
+
+@contextmanager
+def open_page(source):
+    """
+    Gives random access to a page, for table_index.py. A path, or a file object backed by a file, is memory-mapped
+    while the context is open. Other file objects are read.
+
+    :param source: the page, or a file, see the module docstring
+    :return: the page as text, bytes or an mmap
+    """
+    if not is_file_source(source) or isinstance(source, mmap.mmap):
+        yield source
+    elif hasattr(source, '__fspath__'):
+        with open(source, 'rb') as fp:
+            with open_page(fp) as page:
+                yield page
+    else:
+        try:
+            fileno = source.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileno = None
+
+        if fileno is None or isinstance(source, io.TextIOBase) or source.tell() != 0:
+            yield source.read()
+        elif os.fstat(fileno).st_size == 0:
+            yield b''
+        else:
+            page = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            try:
+                yield page
+            finally:
+                page.close()
+
+
+def read_page(source):
+    """
+    :param source: the page, or a file, see the module docstring
+    :return: the whole page as text or bytes, for the parsers that need it in one piece
+    """
+    if isinstance(source, (six.text_type, six.binary_type)):
+        return source
+    if isinstance(source, mmap.mmap):
+        return source[:]
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as fp:
+        return fp.read()
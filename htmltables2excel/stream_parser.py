@@ -0,0 +1,314 @@
+"""
+A streaming alternative to parsing the page with BeautifulSoup. The HTML is fed through an incremental tokenizer in
+chunks and each table row is handed out as soon as its closing tag is seen, so memory stays proportional to a single
+row rather than to the whole page.
+
+Tables are produced with the same cell semantics as convert_tables.parse_table() and convert_tables.clean_cell().
+"""
+import codecs
+from collections import deque
+
+import six
+from six.moves.html_parser import HTMLParser
+
+from cells import clean_text, parse_raw_table
+from sources import CHUNK_SIZE, is_file_source, iter_file_chunks
+from table_index import PRESCAN_SIZE, page_encoding
+
+
+class TableTokenizer(HTMLParser):
+    """
+    Turns the HTML into a queue of table events. Only top level tables are reported; the text of a nested table
+    becomes part of the text of the cell that contains it.
+
+        ('table', attrs)
+        ('caption', text)
+        ('row', section, cells) - section is one of thead, tbody or tfoot. Each cell is a tuple: (tag, attrs, text)
+        ('end_table', None)
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.events = deque()
+        self.table_depth = 0
+        self.section = None
+        self.row = None
+        self.cell = None
+        self.caption = None
+        # Adjacent pieces of data make up a single text node, any tag or comment ends it
+        self.in_text = False
+        # Inside a script or style tag, whose text is skipped
+        self.in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        self.in_text = False
+        if tag in ('script', 'style'):
+            self.in_script = True
+            return
+        if tag == 'table':
+            self.table_depth += 1
+            if self.table_depth == 1:
+                self.events.append(('table', make_attrs(attrs)))
+            return
+
+        if self.table_depth != 1:
+            return
+
+        if tag == 'caption':
+            self.caption = []
+        elif tag in ('thead', 'tbody', 'tfoot'):
+            self.end_row()
+            self.section = tag
+        elif tag == 'tr':
+            self.end_row()
+            self.row = []
+        elif tag in ('td', 'th'):
+            self.end_cell()
+            if self.row is None:
+                self.row = []
+            self.cell = (tag, make_attrs(attrs), [])
+
+    def handle_endtag(self, tag):
+        self.in_text = False
+        if tag in ('script', 'style'):
+            self.in_script = False
+            return
+        if tag == 'table':
+            if self.table_depth == 1:
+                self.end_row()
+                self.section = None
+                self.events.append(('end_table', None))
+            self.table_depth = max(0, self.table_depth - 1)
+            return
+
+        if self.table_depth != 1:
+            return
+
+        if tag == 'caption' and self.caption is not None:
+            self.events.append(('caption', u''.join(self.caption)))
+            self.caption = None
+        elif tag in ('thead', 'tbody', 'tfoot'):
+            self.end_row()
+            self.section = None
+        elif tag == 'tr':
+            self.end_row()
+        elif tag in ('td', 'th'):
+            self.end_cell()
+
+    def handle_data(self, data):
+        if self.in_script:
+            return
+        if self.cell is not None:
+            strings = self.cell[2]
+        elif self.caption is not None:
+            strings = self.caption
+        else:
+            return
+
+        if self.in_text:
+            strings[-1] += data
+        else:
+            strings.append(data)
+            self.in_text = True
+
+    def handle_comment(self, data):
+        self.in_text = False
+
+    def end_cell(self):
+        if self.cell is not None:
+            tag, attrs, strings = self.cell
+            self.row.append((tag, attrs, clean_text(strings)))
+            self.cell = None
+
+    def end_row(self):
+        self.end_cell()
+        if self.row is not None:
+            self.events.append(('row', self.section or 'tbody', self.row))
+            self.row = None
+
+
+def make_attrs(attrs):
+    """
+    Makes a tag attribute dict that matches BeautifulSoup: valueless attributes are empty strings and the class is
+    split into a list. When an attribute is repeated the first value is kept, as browsers do.
+    """
+    d = {}
+    for key, value in attrs:
+        if key not in d:
+            d[key] = value if value is not None else u''
+    if 'class' in d:
+        d['class'] = d['class'].split()
+    return d
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE, encoding=None):
+    """
+    :param source: html as text or bytes, a file (see sources.py) or an iterable of text or bytes chunks
+    :param chunk_size: size of the chunks a single string or a file is cut into
+    :param encoding: used to decode bytes. Defaults to the encoding the page declares (see table_index.page_encoding(),
+        read from its first bytes), or utf-8 when it declares none.
+    :return: a generator of text chunks
+    """
+    if isinstance(source, (six.text_type, six.binary_type)):
+        chunks = (source[i:i + chunk_size] for i in range(0, len(source), chunk_size))
+    elif is_file_source(source):
+        chunks = iter_file_chunks(source, chunk_size)
+    else:
+        chunks = source
+
+    decoder = None
+    head = []
+    head_size = 0
+    for chunk in chunks:
+        if isinstance(chunk, six.binary_type):
+            if decoder is None:
+                # Hold the chunks back until there are enough bytes to find the declared encoding
+                head.append(chunk)
+                head_size += len(chunk)
+                if head_size < PRESCAN_SIZE:
+                    continue
+                decoder = make_decoder(encoding, b''.join(head))
+                chunk = b''.join(head)
+                head = []
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+
+    if decoder is None:
+        if not head:
+            return
+        decoder = make_decoder(encoding, b''.join(head))
+        tail = decoder.decode(b''.join(head), final=True)
+    else:
+        tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def make_decoder(encoding, head):
+    """
+    :param encoding: the encoding, or None to use the one declared in head
+    :param head: the first bytes of the page
+    :return: an incremental decoder
+    """
+    encoding = encoding or page_encoding(head) or 'utf-8'
+    return codecs.getincrementaldecoder(encoding)(errors='replace')
+
+
+def iter_events(source, chunk_size=CHUNK_SIZE):
+    """
+    :param source: see iter_chunks()
+    :param chunk_size:
+    :return: a generator of table events, see TableTokenizer
+    """
+    tokenizer = TableTokenizer()
+    for chunk in iter_chunks(source, chunk_size):
+        tokenizer.feed(chunk)
+        while tokenizer.events:
+            yield tokenizer.events.popleft()
+
+    tokenizer.close()
+    while tokenizer.events:
+        yield tokenizer.events.popleft()
+
+
+class StreamedTable(object):
+    """
+    A table read from the event stream. The caption and header rows are read up front, body rows are produced on
+    demand by rows() and footer rows are complete once the body has been read.
+    """
+
+    def __init__(self, attrs, events):
+        self.attrs = attrs
+        self.caption = None
+        self.headers = []
+        self.footers = []
+        self._events = events
+        self._pending = deque()
+        self._done = False
+        self._read_headers()
+
+    def _next_row(self):
+        """
+        :return: the next body row, or None when the table has ended. Caption, header and footer rows are stored
+            as they are found.
+        """
+        while not self._done:
+            try:
+                event = next(self._events)
+            except StopIteration:
+                event = ('end_table', None)
+
+            if event[0] == 'end_table':
+                self._done = True
+            elif event[0] == 'caption':
+                if self.caption is None:
+                    self.caption = event[1]
+            elif event[0] == 'row':
+                section, cells = event[1], event[2]
+                if section == 'thead':
+                    self.headers.append(cells)
+                elif section == 'tfoot':
+                    self.footers.append(cells)
+                else:
+                    return cells
+        return None
+
+    def _read_headers(self):
+        row = self._next_row()
+        if row is not None:
+            self._pending.append(row)
+
+    def rows(self):
+        """
+        :return: a generator of body rows. Each row is a list of (tag, attrs, text) tuples. Footers are complete
+            once it is exhausted.
+        """
+        while self._pending:
+            yield self._pending.popleft()
+
+        while True:
+            row = self._next_row()
+            if row is None:
+                break
+            yield row
+
+    def drain(self):
+        """Reads to the end of the table, discarding unread body rows."""
+        self._pending.clear()
+        while self._next_row() is not None:
+            pass
+
+
+def iter_raw_tables(source, excluded_tables=None, chunk_size=CHUNK_SIZE):
+    """
+    :param source: see iter_chunks()
+    :param excluded_tables: a list of table ids to skip
+    :param chunk_size:
+    :return: a generator of StreamedTable. Each table must be used before asking for the next one.
+    """
+    excluded_tables = excluded_tables or []
+    events = iter_events(source, chunk_size)
+    for event in events:
+        if event[0] != 'table':
+            continue
+
+        table = StreamedTable(event[1], events)
+        if table.attrs.get(u'id') not in excluded_tables:
+            yield table
+        table.drain()
+
+
+def iter_tables(source, excluded_tables=None, chunk_size=CHUNK_SIZE):
+    """
+    The streaming counterpart of parse_tables(html, excluded_tables, convert_tables.parse_table). The result can be
+    passed straight to PageToExcel.
+
+    :param source: see iter_chunks()
+    :param excluded_tables: a list of table ids to skip
+    :param chunk_size:
+    :return: a generator of table dicts. 'headers' is a list, 'rows' and 'footers' are generators that must be read in
+        that order.
+    """
+    for table in iter_raw_tables(source, excluded_tables, chunk_size):
+        yield parse_raw_table(table)
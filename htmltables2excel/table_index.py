@@ -0,0 +1,218 @@
+"""
+An index of the top level tables of a page, so tables can be selected before any parsing.
+
+index_tables() scans the page once with a regular expression for table, script and style tags and comments. Each
+top level table gets a TableEntry with its position on the page, the offsets of its start and end (byte offsets when
+the page is bytes or an mmap) and the attributes of its table tag. Only the selected table fragments are then handed
+to the parser, so an excluded table costs the scan and nothing more. A fragment of a page of bytes no longer has the
+meta tag that declares the encoding of the page, so the fragments are decoded with the page's encoding, see
+page_encoding().
+
+Tables are selected by id, class or position (from 0, counting every top level table on the page):
+
+    '#totals' or 'totals': the table with id totals
+    '.summary': tables with the class summary
+    2: the third table
+
+A table is selected when it matches an include selector (or there are none) and no exclude selector. When a table tag
+repeats an attribute the first value is used, as the backends do.
+"""
+import codecs
+import re
+from html import unescape
+
+import six
+
+
+def _compile(text):
+    """
+    :return: the patterns for a page of text, or of bytes when text is False
+    """
+    def c(pattern):
+        return re.compile(pattern if text else pattern.encode('ascii'), re.IGNORECASE)
+
+    return {
+        'token': c(r'<!--|<(/?)(table|script|style)(?=[\s/>])((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>'),
+        'comment_end': c(r'-->'),
+        'script': c(r'</script\s*>'),
+        'style': c(r'</style\s*>'),
+        'attr': c(r'([^\s=/>"\']+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+)))?'),
+    }
+
+
+PATTERNS = {True: _compile(True), False: _compile(False)}
+
+# Browsers look for the encoding a page declares in its first 1024 bytes
+PRESCAN_SIZE = 1024
+CHARSET_RE = re.compile(br'<meta\s[^>]*?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+
+class TableEntry(object):
+    """A top level table of a page: html[start:end] is the table from <table to </table>."""
+    __slots__ = ('position', 'start', 'end', 'attrs')
+
+    def __init__(self, position, start, end, attrs):
+        self.position = position
+        self.start = start
+        self.end = end
+        self.attrs = attrs
+
+    def __repr__(self):
+        return 'TableEntry({}, {}, {}, {!r})'.format(self.position, self.start, self.end, self.attrs)
+
+
+def parse_attrs(text):
+    """
+    :param text: the inside of a start tag after the tag name, text or bytes
+    :return: the attribute dict, with the class split into a list as in cells.py
+    """
+    if isinstance(text, six.binary_type):
+        text = text.decode('utf-8', 'replace')
+    attrs = {}
+    for match in PATTERNS[True]['attr'].finditer(text):
+        name, double, single, bare = match.groups()
+        value = double if double is not None else single if single is not None else bare
+        attrs.setdefault(name.lower(), unescape(value) if value else u'')
+    if 'class' in attrs:
+        attrs['class'] = attrs['class'].split()
+    return attrs
+
+
+def index_tables(html):
+    """
+    :param html: the page: text, bytes or an mmap
+    :return: a list of TableEntry, one for each top level table. A table with no end tag ends at the end of the page.
+    """
+    patterns = PATTERNS[isinstance(html, six.text_type)]
+    token = patterns['token']
+    entries = []
+    depth = 0
+    start = None
+    attrs = None
+    pos = 0
+    while True:
+        match = token.search(html, pos)
+        if match is None:
+            break
+        pos = match.end()
+        tag = match.group(2)
+        if tag is None:
+            # A comment
+            end = patterns['comment_end'].search(html, pos)
+            pos = end.end() if end is not None else len(html)
+            continue
+
+        tag = (tag if isinstance(tag, six.text_type) else tag.decode('ascii')).lower()
+        if tag != u'table':
+            # The contents of script and style are not html
+            if not match.group(1):
+                end = patterns[tag].search(html, pos)
+                pos = end.end() if end is not None else len(html)
+            continue
+
+        if not match.group(1):
+            if depth == 0:
+                start = match.start()
+                attrs = parse_attrs(match.group(3))
+            depth += 1
+        elif depth:
+            depth -= 1
+            if depth == 0:
+                entries.append(TableEntry(len(entries), start, pos, attrs))
+
+    if depth:
+        entries.append(TableEntry(len(entries), start, len(html), attrs))
+    return entries
+
+
+class TableSelector(object):
+    def __init__(self, include=None, exclude=None):
+        """
+        :param include: None for every table, or a list of selectors, see the module docstring
+        :param exclude: None or a list of selectors
+        """
+        self.include = self.parse(include) if include is not None else None
+        self.exclude = self.parse(exclude or [])
+
+    @staticmethod
+    def parse(selectors):
+        """
+        :return: (ids, classes, positions), each a set
+        """
+        ids, classes, positions = set(), set(), set()
+        for selector in selectors:
+            if isinstance(selector, six.integer_types) and not isinstance(selector, bool):
+                positions.add(selector)
+            elif not isinstance(selector, six.string_types):
+                raise ValueError('Bad table selector: {!r}'.format(selector))
+            elif selector.startswith(u'.'):
+                classes.add(selector[1:])
+            elif selector.startswith(u'#'):
+                ids.add(selector[1:])
+            else:
+                ids.add(selector)
+        return ids, classes, positions
+
+    @property
+    def selects_all(self):
+        return self.include is None and not any(self.exclude)
+
+    @staticmethod
+    def match(selectors, position, attrs):
+        ids, classes, positions = selectors
+        if position in positions or attrs.get(u'id') in ids:
+            return True
+        return bool(classes) and any(x in classes for x in attrs.get(u'class') or [])
+
+    def matches(self, position, attrs):
+        """
+        :param position: the position of the table on the page
+        :param attrs: the attributes of the table tag
+        """
+        if self.include is not None and not self.match(self.include, position, attrs):
+            return False
+        return not self.match(self.exclude, position, attrs)
+
+
+def select_tables(html, include_tables=None, excluded_tables=None):
+    """
+    :param html: the page: text, bytes or an mmap
+    :param include_tables: None or a list of selectors
+    :param excluded_tables: None or a list of selectors
+    :return: the TableEntry of each selected table
+    """
+    selector = TableSelector(include_tables, excluded_tables)
+    return [x for x in index_tables(html) if selector.matches(x.position, x.attrs)]
+
+
+def page_encoding(html):
+    """
+    :param html: the page: text, bytes or an mmap
+    :return: the encoding declared by the byte order mark or a meta tag of a page of bytes, or None for text, a page
+        that declares none or an encoding python does not know
+    """
+    if isinstance(html, six.text_type):
+        return None
+    head = html[:PRESCAN_SIZE]
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8'
+    match = CHARSET_RE.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return None
+
+
+def iter_fragments(html, entries):
+    """
+    :return: a generator of the html of each table. The fragments of a page of bytes that declares its encoding are
+        decoded with it, the others are left for the parser to decode.
+    """
+    encoding = page_encoding(html)
+    for entry in entries:
+        fragment = html[entry.start:entry.end]
+        if encoding is not None:
+            fragment = fragment.decode(encoding, 'replace')
+        yield fragment
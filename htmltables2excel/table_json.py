@@ -0,0 +1,100 @@
+"""
+The structured table payload sent by page_to_excel.js instead of the table html. The client has already walked the
+DOM, so the server builds the raw tables (see cells.py) straight from the payload without parsing any HTML.
+
+A table is a dict:
+
+    {"attrs": {"id": "t1", "data-excel": "FREEZE 2,0"}, "caption": "Labor" or null,
+     "headers": [row, ...], "rows": [row, ...], "footers": [row, ...]}
+
+A row is a list of cells and a cell is either its text or a list [text, class, colspan, data-excel, tag, style].
+Trailing items can be left out and empty items are null or "". The tag defaults to th for header rows and td for the
+others. The style is the style attribute text, see formats.css_to_props().
+
+The payload can be gzipped, see decompress().
+"""
+import zlib
+
+import six
+
+from backends import RawTable
+from cells import parse_raw_table
+
+# The most bytes a gzipped payload may expand to
+MAX_PAYLOAD = 256 * 2 ** 20
+
+# The attributes at each position of a cell list. Position 4 is the tag.
+CELL_ATTRS = (None, 'class', 'colspan', 'data-excel', None, 'style')
+CELL_TAGS = {'td': 'td', 'th': 'th'}
+
+
+def decompress(data, max_size=MAX_PAYLOAD):
+    """
+    :param data: gzipped bytes
+    :param max_size: raise a ValueError rather than expand to more than this many bytes
+    :return: the bytes
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        result = decompressor.decompress(data, max_size)
+    except zlib.error as e:
+        raise ValueError('Bad gzipped table payload: {}'.format(e))
+    if decompressor.unconsumed_tail:
+        raise ValueError('The table payload is bigger than {} bytes'.format(max_size))
+    if not decompressor.eof:
+        # Otherwise a cut off upload would be exported without its last rows
+        raise ValueError('The gzipped table payload is truncated')
+    return result
+
+
+def raw_cell(cell, tag):
+    """
+    :param cell: the text or a list [text, class, colspan, data-excel, tag, style]
+    :param tag: the default tag
+    :return: a raw cell: (tag, attrs, text)
+    """
+    if cell is None or isinstance(cell, six.string_types):
+        return tag, {}, cell or u''
+
+    if not isinstance(cell, (list, tuple)) or not cell:
+        raise ValueError('Bad cell in table payload: {!r}'.format(cell))
+
+    attrs = {}
+    for name, value in zip(CELL_ATTRS[1:], cell[1:]):
+        if name is None or value in (None, u''):
+            continue
+        if name == 'class':
+            attrs[name] = value.split()
+        else:
+            attrs[name] = six.text_type(value)
+
+    if len(cell) > 4 and cell[4]:
+        tag = CELL_TAGS.get(cell[4], tag)
+    return tag, attrs, six.text_type(cell[0]) if cell[0] is not None else u''
+
+
+def raw_rows(rows, tag):
+    return [[raw_cell(cell, tag) for cell in row] for row in rows or []]
+
+
+def raw_table(table):
+    """
+    :param table: a table dict from the payload
+    :return: a RawTable
+    """
+    attrs = dict(table.get('attrs') or {})
+    return RawTable(attrs, table.get('caption'), raw_rows(table.get('headers'), 'th'),
+                    raw_rows(table.get('rows'), 'td'), raw_rows(table.get('footers'), 'td'))
+
+
+def parse_table_json(table, infer_types=False):
+    """
+    :param table: a table dict from the payload
+    :param infer_types: parse the body rows by inferred column type, see type_inference.py
+    :return: a table dict ready for PageToExcel, see cells.parse_raw_table()
+    """
+    if infer_types:
+        from type_inference import parse_raw_table_typed
+
+        return parse_raw_table_typed(raw_table(table))
+    return parse_raw_table(raw_table(table))
@@ -0,0 +1,97 @@
+import unittest
+
+from backends import BACKENDS, iter_raw_tables
+
+# Malformed tables that browsers read the same way, with the raw table every backend should give
+MALFORMED = (
+    # Unclosed cells and rows end at the next cell or row
+    (u'<table><tr><th>A<th>B</tr><tr><td>1<td>$234</tr></table>',
+     ({}, None, [], [[('th', {}, u'A'), ('th', {}, u'B')], [('td', {}, u'1'), ('td', {}, u'$234')]], [])),
+    (u'<table><thead><tr><th>H</thead><tr><td>1<tr><td class="x">2</table>',
+     ({}, None, [[('th', {}, u'H')]], [[('td', {}, u'1')], [('td', {'class': ['x']}, u'2')]], [])),
+    # Script and style text is not part of a cell or caption
+    (u'<table><caption>C<script>var c;</script></caption>'
+     u'<tr><td>a<script>var x = "<td>";</script>b</td><td>c<style>p {}</style></td></tr></table>',
+     ({}, u'C', [], [[('td', {}, u'ab'), ('td', {}, u'c')]], [])),
+    # The first value of a repeated attribute is kept
+    (u'<table id="first" id="second"><tr><td class="a" class="b" colspan="2" colspan="3">1</td></tr></table>',
+     ({'id': u'first'}, None, [], [[('td', {'class': ['a'], 'colspan': u'2'}, u'1')]], [])),
+    # Text in a row outside its cells is dropped
+    (u'<table><tr><td>a</td>junk<td>b</td></tr><tr><td>c<td>d</td>left over</tr></table>',
+     ({}, None, [], [[('td', {}, u'a'), ('td', {}, u'b')], [('td', {}, u'c'), ('td', {}, u'd')]], [])),
+    # A caption after the rows. The stream parser only has it once the rows have been read.
+    (u'<table><tr><td>a</td></tr><caption>Late</caption><tr><td>b</td></tr></table>',
+     ({}, u'Late', [], [[('td', {}, u'a')], [('td', {}, u'b')]], [])),
+    # CDATA sections are not text in HTML
+    (u'<table><caption>C<![CDATA[x]]></caption><tr><td>a<![CDATA[y]]>b</td></tr></table>',
+     ({}, u'C', [], [[('td', {}, u'ab')]], [])),
+)
+
+# A page that is not utf-8 and says so. \x80 is the euro sign in windows-1252 and a control character in latin-1.
+CP1252_PAGE = (u'<html><head><meta charset="windows-1252"></head><body><table><caption>Caf\xe9</caption>'
+               u'<tr><th>Cr\xe8me</th><td>\u20ac1.00</td></tr></table></body></html>').encode('cp1252')
+CP1252_TABLES = [({}, u'Caf\xe9', [], [[('th', {}, u'Cr\xe8me'), ('td', {}, u'\u20ac1.00')]], [])]
+
+
+def has_module(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        self.html = fp.read()
+        fp.close()
+
+    def read_tables(self, parser):
+        tables = []
+        for table in iter_raw_tables(self.html, parser=parser):
+            tables.append((table.attrs, table.caption, table.headers, list(table.rows()), table.footers))
+        return tables
+
+    def assert_same_as_html_parser(self, parser):
+        expected = self.read_tables('html.parser')
+        self.assertEqual(len(expected), 2)
+
+        self.assertEqual(self.read_tables(parser), expected)
+
+    def test_stream(self):
+        self.assert_same_as_html_parser('stream')
+
+    @unittest.skipUnless(has_module('lxml'), 'lxml is not installed')
+    def test_lxml(self):
+        self.assert_same_as_html_parser('lxml')
+
+    @unittest.skipUnless(has_module('selectolax'), 'selectolax is not installed')
+    def test_selectolax(self):
+        self.assert_same_as_html_parser('selectolax')
+
+    def test_malformed(self):
+        for parser in sorted(BACKENDS):
+            if parser in ('lxml', 'selectolax') and not has_module(parser):
+                continue
+            for html, expected in MALFORMED:
+                tables = []
+                for x in iter_raw_tables(html, parser=parser):
+                    rows = list(x.rows())
+                    tables.append((x.attrs, x.caption, x.headers, rows, x.footers))
+                self.assertEqual(tables, [expected], (parser, html))
+
+    def test_encoding(self):
+        import io
+
+        for parser in sorted(BACKENDS):
+            if parser in ('lxml', 'selectolax') and not has_module(parser):
+                continue
+            for source in (CP1252_PAGE, io.BytesIO(CP1252_PAGE)):
+                tables = [(x.attrs, x.caption, x.headers, list(x.rows()), x.footers)
+                          for x in iter_raw_tables(source, parser=parser)]
+                self.assertEqual(tables, CP1252_TABLES, parser)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            list(iter_raw_tables(self.html, parser='nope'))
@@ -0,0 +1,34 @@
+import json
+import unittest
+
+import backends
+from benchmarks import compare, import_times, make_page, run_benchmarks
+from cells import read_table
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_make_page(self):
+        config = {'rows': 50, 'cols': 6, 'tables': 3, 'colspan_density': 0.2, 'formula_density': 0.2}
+        html = make_page(config)
+        self.assertEqual(html, make_page(config))
+
+        tables = [read_table(x) for x in backends.parse_tables(html)]
+        self.assertEqual(len(tables), 3)
+        self.assertEqual(len(tables[0]['rows']), 50)
+        self.assertTrue(any(x['attrs'].get('colspan') for row in tables[0]['rows'] for x in row))
+        self.assertTrue(any(x['attrs'].get('data-excel') for row in tables[0]['rows'] for x in row))
+
+    def test_run(self):
+        results = run_benchmarks({'rows': 20, 'tables': 1, 'formula_calls': 100, 'repeat': 1})
+        self.assertIn('parse_tables[stream]', results['results'])
+        self.assertIn('write_page[constant_memory=True]', results['results'])
+        self.assertGreater(results['results']['parse_row']['peak_bytes'], 0)
+        self.assertEqual(len(compare(results, json.loads(json.dumps(results)))),
+                         len(results['results']) + len(results['imports']))
+
+    def test_imports(self):
+        # Only the heavy modules are checked here, the times depend on the machine
+        results = import_times({'convert_tables': 10, 'page_to_csv': 10, 'exporters': 10}, repeat=1)
+        for module, result in results.items():
+            self.assertEqual(result['heavy'], [], module)
+            self.assertTrue(result['ok'])
@@ -0,0 +1,48 @@
+import unittest
+
+from unittest import mock
+
+import cells
+from cells import intern_style, intern_text, parse_cell, style_key, style_to_dict
+
+
+class TestCells(unittest.TestCase):
+    def test_shared_attrs(self):
+        a = parse_cell(u'1', {'class': ['money', ''], 'href': '/a/', 'style': 'color: red'}, 'td')
+        b = parse_cell(u'2', {'class': ['money'], 'href': '/b/', 'style': 'color: red'}, 'td')
+        self.assertIs(a.attrs, b.attrs)
+        self.assertEqual(a.attrs, {'class': ['money'], 'style': {'color': 'red'}})
+
+    def test_shared_text(self):
+        a = parse_cell(u''.join([u'Tot', u'al']), {}, 'td')
+        b = parse_cell(u''.join([u'To', u'tal']), {}, 'td')
+        self.assertIs(a.value, b.value)
+        long_text = u'x' * (cells.MAX_INTERNED_TEXT + 1)
+        self.assertIsNot(intern_text(u''.join([long_text])), intern_text(long_text[:-1] + u'x'))
+
+        # The interned text is bounded, it is not kept for the life of the process
+        with mock.patch('cells.MAX_INTERNED', 3):
+            for i in range(10):
+                intern_text(u'text {}'.format(i))
+            self.assertLessEqual(len(cells._interned_text), 3)
+
+    def test_styles(self):
+        self.assertEqual(style_to_dict(u'Color: red; mso-number-format:"0.00;[Red]-0.00"; ;broken; x: a:b'),
+                         {'color': 'red', 'mso-number-format': '"0.00;[Red]-0.00"', 'x': 'a:b'})
+
+        # Parsed once for each style text, and equal styles have the same key
+        a = parse_cell(u'1', {'style': 'color: red'}, 'td')
+        b = parse_cell(u'2', {'style': 'color: red', 'class': ['bold']}, 'td')
+        self.assertIs(a.attrs['style'], b.attrs['style'])
+        self.assertIs(intern_style(u'color: red'), a.attrs['style'])
+        self.assertEqual(style_key(a.attrs['style']), style_key({'color': 'red'}))
+        self.assertIsNone(style_key({}))
+
+    def test_dict_compat(self):
+        cell = parse_cell(u'12.5%', {}, 'td')
+        self.assertEqual(cell, {'value': 0.125, 'attrs': {}, 'tag': 'td', 'is_percent': True})
+        self.assertTrue(cell['is_percent'])
+        self.assertFalse(cell.get('is_money'))
+        self.assertEqual(cell.get('nope', 1), 1)
+        self.assertEqual(parse_cell(u'$1,000', {}, 'th'),
+                         {'value': 1000.0, 'attrs': {}, 'tag': 'th', 'is_money': True})
@@ -0,0 +1,85 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from cli import convert_files, find_inputs, main
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find_inputs(self):
+        paths = find_inputs(['data_for_tests', 'data_for_tests/*.html', 'data_for_tests/test_data2.html'])
+        self.assertEqual(paths, ['data_for_tests/table_to_csv_test_data.html', 'data_for_tests/test_data2.html'])
+        with self.assertRaises(ValueError):
+            find_inputs(['data_for_tests/nope*.html'])
+
+    def test_files(self):
+        stderr = io.StringIO()
+        status = main(['data_for_tests', '--out-dir', self.directory, '--format', 'xlsx', 'csv', '--workers', '2',
+                       '--sheet-name', 'Labor', '--exclude-table', 'nope'], stderr=stderr)
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['table_to_csv_test_data.csv',
+                                                              'table_to_csv_test_data.xlsx',
+                                                              'test_data2.csv', 'test_data2.xlsx'])
+        with zipfile.ZipFile(os.path.join(self.directory, 'table_to_csv_test_data.xlsx')) as z:
+            workbook = z.read('xl/workbook.xml').decode('utf-8')
+        self.assertIn('name="Labor"', workbook)
+        self.assertIn('name="sheet_2"', workbook)
+
+        lines = stderr.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('MB/s', lines[0])
+        self.assertTrue(lines[-1].startswith('2 files, 0 failed'))
+
+    def test_same_outputs(self):
+        for name in ('a', 'b'):
+            os.mkdir(os.path.join(self.directory, name))
+            with open(os.path.join(self.directory, name, 'report.html'), 'w') as fp:
+                fp.write('<table><tbody><tr><td>{}</td></tr></tbody></table>'.format(name))
+
+        out_dir = os.path.join(self.directory, 'out')
+        inputs = [os.path.join(self.directory, x, 'report.html') for x in ('a', 'b')]
+        with self.assertRaises(ValueError):
+            convert_files(inputs, ['xlsx'], {}, out_dir, workers=2)
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit):
+            main(inputs + ['--out-dir', out_dir], stderr=stderr)
+        self.assertFalse(os.listdir(out_dir))
+
+        # Without an out dir each is written next to its html
+        self.assertEqual(main(inputs, stderr=stderr), 0)
+
+    def test_failed(self):
+        path = os.path.join(self.directory, 'bad.html')
+        with open(path, 'w') as fp:
+            fp.write('<table data-excel="FREEZE"><tbody><tr><td>1</td></tr></tbody></table>')
+        stderr = io.StringIO()
+        self.assertEqual(main([path, '--workers', '1'], stderr=stderr), 1)
+        self.assertIn('FAILED', stderr.getvalue())
+
+    def test_stdin(self):
+        with open('data_for_tests/table_to_csv_test_data.html', 'rb') as fp:
+            html = fp.read()
+
+        stdin = io.TextIOWrapper(io.BytesIO(html))
+        stdout = io.StringIO()
+        main(['--format', 'csv', '--exclude-table', 'wildcat_report_table'], stdin=stdin, stdout=stdout,
+             stderr=io.StringIO())
+        rows = list(csv.reader(io.StringIO(stdout.getvalue())))
+        self.assertEqual(rows[-2], ['', '', 'Total', '28,852.00'])
+        self.assertNotIn(['', '', '', '', 'Total', '1,282.00', '3.50', '57,190.99', '', 'NB = 0.27%'], rows)
+
+        stdin = io.TextIOWrapper(io.BytesIO(html))
+        stdout = io.TextIOWrapper(io.BytesIO())
+        main(['-'], stdin=stdin, stdout=stdout, stderr=io.StringIO())
+        with zipfile.ZipFile(io.BytesIO(stdout.buffer.getvalue())) as z:
+            self.assertIn('xl/worksheets/sheet2.xml', z.namelist())
@@ -0,0 +1,106 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from backends import parse_tables
+from columnar import ParquetSink, column_names, iter_columns, page_to_parquet, read_columns, to_arrow, to_pandas
+from exporters import export
+from test_backends import has_module
+from type_inference import DATE, FLOAT, INTEGER, TEXT
+
+PAGE = u'''<table id="sales"><caption>Sales</caption>
+<thead><tr><th>Region</th><th colspan="2">Q1</th><th></th><th>Region</th><th>Date</th></tr></thead>
+<tbody>
+<tr><td>North</td><td>$1,000.50</td><td>10%</td><td>3</td><td>1</td><td>2024-01-05</td></tr>
+<tr><td>South</td><td>$20</td><td></td><td>4</td><td>x</td><td>2024-02-10</td></tr>
+<tr><td colspan="2">Total</td><td>15%</td><td>7</td><td>2</td><td></td><td>extra</td></tr>
+</tbody>
+<tfoot><tr><td>ignored</td></tr></tfoot>
+</table>'''
+
+
+class TestColumnar(unittest.TestCase):
+    def columns(self, **kwargs):
+        return next(iter_columns(PAGE, **kwargs))
+
+    def test_columns(self):
+        columns = self.columns()
+        self.assertEqual(columns.names, ['Region', 'Q1', 'Q1_2', 'col_4', 'Region_2', 'Date', 'col_7'])
+        self.assertEqual(columns.n_rows, 3)
+        self.assertEqual(columns.caption, 'Sales')
+        self.assertEqual(columns.metadata(), {'caption': 'Sales', 'id': 'sales'})
+        self.assertEqual(columns.kinds[:3], [None, 'money', 'percent'])
+
+        self.assertEqual(columns.typed_column(0), (TEXT, ['North', 'South', 'Total']))
+        # The Total colspan leaves its second column empty
+        self.assertEqual(columns.typed_column(1), (FLOAT, [1000.5, 20.0, None]))
+        self.assertEqual(columns.typed_column(2), (FLOAT, [0.1, None, 0.15]))
+        self.assertEqual(columns.typed_column(3), (INTEGER, [3, 4, 7]))
+        self.assertEqual(columns.typed_column(4), (TEXT, ['1', 'x', '2']))
+        self.assertEqual(columns.typed_column(6), (TEXT, [None, None, 'extra']))
+
+        self.assertEqual(columns.typed_column(5),
+                         (DATE, [datetime.datetime(2024, 1, 5), datetime.datetime(2024, 2, 10), None]))
+        # Without type inference dates stay text
+        self.assertEqual(self.columns(infer_types=False).column_type(5), TEXT)
+
+    def test_mixed_columns(self):
+        html = (u'<table><thead><tr><th>Rate</th><th>Cost</th><th>Note</th></tr></thead><tbody>'
+                u'<tr><td>5%</td><td>$5.00</td><td>12.50%</td></tr><tr><td>0%</td><td>n/a</td><td>1,000</td></tr>'
+                u'<tr><td></td><td>$1</td><td>none</td></tr></tbody></table>')
+        for infer_types in (False, True):
+            columns = next(iter_columns(html, infer_types=infer_types))
+            # 0% is a number, and empty cells are nulls
+            self.assertEqual(columns.typed_column(0), (FLOAT, [0.05, 0.0, None]))
+            self.assertEqual(columns.column_kind(0, FLOAT), 'percent')
+            # A money column with text in it is text, with no kind
+            column_type, values = columns.typed_column(1)
+            # Its numbers keep the text of their cell
+            self.assertEqual((column_type, values), (TEXT, ['$5.00', 'n/a', '$1']))
+            self.assertIsNone(columns.column_kind(1, column_type))
+            self.assertEqual(columns.typed_column(2), (TEXT, ['12.50%', '1,000', 'none']))
+
+    def test_column_names(self):
+        self.assertEqual(column_names([]), [])
+        data = next(parse_tables(u'<table><tr><td>1</td><td>2</td></tr></table>'))
+        columns = read_columns(data)
+        self.assertEqual(columns.names, ['col_1', 'col_2'])
+        self.assertEqual(columns.typed_column(1), (INTEGER, [2]))
+
+    @unittest.skipUnless(has_module('pyarrow'), 'pyarrow is not installed')
+    def test_arrow(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = to_arrow(self.columns())
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field('Q1').type, pa.float64())
+        self.assertEqual(table.schema.field('Q1').metadata, {b'kind': b'money'})
+        self.assertEqual(table.schema.field('col_4').type, pa.int64())
+        self.assertIsNone(table.schema.field('Region').metadata)
+        self.assertEqual(table.schema.metadata[b'caption'], b'Sales')
+        self.assertEqual(table.column('Q1_2').to_pylist(), [0.1, None, 0.15])
+
+        directory = tempfile.mkdtemp()
+        try:
+            template = os.path.join(directory, '{id}.parquet')
+            paths = page_to_parquet(template, PAGE)
+            self.assertEqual(paths, [os.path.join(directory, 'sales.parquet')])
+            self.assertTrue(pq.read_table(paths[0]).equals(table))
+
+            sink = ParquetSink(os.path.join(directory, 'sink_{n}.parquet'))
+            export(PAGE, [sink], infer_types=True)
+            self.assertTrue(pq.read_table(sink.paths[0]).equals(table))
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipUnless(has_module('pandas'), 'pandas is not installed')
+    def test_pandas(self):
+        df = to_pandas(self.columns())
+        self.assertEqual(list(df.columns), ['Region', 'Q1', 'Q1_2', 'col_4', 'Region_2', 'Date', 'col_7'])
+        self.assertEqual([str(x) for x in df.dtypes],
+                         ['string', 'Float64', 'Float64', 'Int64', 'string', 'datetime64[ns]', 'string'])
+        self.assertEqual(df.attrs, {'caption': 'Sales', 'id': 'sales'})
+        self.assertEqual(df['col_4'].tolist(), [3, 4, 7])
@@ -0,0 +1,234 @@
+import io
+import os
+import re
+import unittest
+import zipfile
+from unittest import mock
+
+from convert_tables import (MAX_ROWS, PageToExcel, full_page_to_excel, parse_tables_from_table_list,
+                            table_list_to_buffer, table_list_to_excel)
+from formulas import locate_cells, make_formula
+
+
+class TestPageExcel(unittest.TestCase):
+    def test_make_formula(self):
+        formula = make_formula('SUM ROW A-C', 1, 2)
+        self.assertEqual(formula, '=SUM(A2:C2)')
+
+        formula = make_formula('SUM ROW A,C', 1, 2)
+        self.assertEqual(formula, '=SUM(A2+C2)')
+
+        formula = make_formula('SUM COL', 3, 2, first_data_row=1)
+        self.assertEqual(formula, '=SUM(C2:C3)')
+
+    def test_to_excel(self):
+        fp = open(os.path.join(settings.SITE_PATH, 'utils/table_to_csv_test_data.html'), 'rb')
+        self.html = fp.read()
+        fp.close()
+
+        full_page_to_excel(
+            'test_page_to_excel.xlsx',
+            self.html,
+            work_sheet_names=['Labor', 'Revenue'],
+            extra_headers=[['Header 1', 'Subheader 1'], ['Header 2']],
+            col_widths=[[('A:A', 20)], [['B:B', 30]]]
+        )
+
+    def test_formulas(self):
+        fp = open(os.path.join(settings.SITE_PATH, 'utils/simple_table_for_testing.html'), 'rb')
+        self.html = fp.read()
+        fp.close()
+
+        full_page_to_excel(
+            'test_page_to_excel.xlsx',
+            self.html,
+            work_sheet_names=['S1'],
+        )
+
+    def test_parsers(self):
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        html = fp.read()
+        fp.close()
+
+        path = 'test_page_to_excel_parser.xlsx'
+        for parser in ('html.parser', 'stream'):
+            full_page_to_excel(path, html, parser=parser, infer_types=parser == 'stream',
+                               work_sheet_names=['Labor', 'Revenue'])
+            self.assertTrue(os.path.exists(path))
+            os.remove(path)
+
+    def test_parse_tables_from_table_list(self):
+        tables = parse_tables_from_table_list([u'<table><tbody><tr><td>$1.00</td></tr></tbody></table>'] * 2)
+        self.assertEqual(len(tables), 2)
+        self.assertEqual(tables[1]['rows'], [[{'value': 1.0, 'attrs': {}, 'tag': 'td', 'is_money': True}]])
+
+    def test_buffer(self):
+        table_list = [u'<table><thead><tr><th>A</th></tr></thead><tbody><tr><td>$1.00</td></tr></tbody></table>']
+        buf = table_list_to_buffer(table_list, spool_size=100)
+        # Bigger than the spool size, so it was moved to a temp file
+        self.assertTrue(buf._rolled)
+        with zipfile.ZipFile(buf) as z:
+            self.assertIn('xl/worksheets/sheet1.xml', z.namelist())
+        buf.close()
+
+        buf = table_list_to_buffer(table_list, to_excel_kwargs={'constant_memory': True})
+        self.assertFalse(buf._rolled)
+        self.assertEqual(buf.read(2), b'PK')
+        buf.close()
+
+    def test_structured_tables(self):
+        table_list = [u'<table><tbody><tr><td class="bold">$1.00</td></tr></tbody></table>',
+                      {'attrs': {}, 'rows': [[['$1.00', 'bold']]]}]
+        tables = parse_tables_from_table_list(table_list)
+        self.assertEqual(tables[0]['rows'], tables[1]['rows'])
+
+    def test_observer(self):
+        from test_metrics import ListObserver
+
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        html = fp.read()
+        fp.close()
+
+        observer = ListObserver()
+        path = 'test_page_to_excel_observer.xlsx'
+        full_page_to_excel(path, html, parser='stream', observer=observer)
+        self.assertEqual(len(observer.reports), 1)
+        report = observer.reports[0]
+        self.assertEqual(sorted(report['phases']), ['close', 'parse', 'write'])
+        self.assertEqual(report['counts']['tables'], 2)
+        self.assertGreater(report['counts']['merges'], 0)
+        self.assertEqual(report['gauges']['bytes_written'], os.path.getsize(path))
+        os.remove(path)
+
+        table_list = [u'<table><tbody><tr><td>1</td><td data-excel="SUM ROW A-A">1</td></tr></tbody></table>']
+        table_list_to_excel(io.BytesIO(), table_list, observer=observer)
+        self.assertEqual(len(observer.reports), 2)
+        self.assertEqual(observer.reports[1]['counts']['cells'], 2)
+        self.assertEqual(observer.reports[1]['counts']['formulas'], 1)
+
+    def test_spill(self):
+        rows = u''.join(u'<tr><td>{}</td><td>{}</td></tr>'.format(i, i * 2) for i in range(1, 11))
+        html = (u'<table data-excel="FREEZE 2,1"><caption>Big</caption><thead><tr><th>A</th><th>B</th></tr></thead>'
+                u'<tbody>{}</tbody><tfoot><tr><td data-excel="SUM COL">x</td><td data-excel="SUM COL">x</td></tr>'
+                u'</tfoot></table>').format(rows)
+        buf = io.BytesIO()
+        # 2 header rows (caption, blank), the table header and 4 body rows on each worksheet
+        full_page_to_excel(buf, html, parser='stream', work_sheet_names=['Big'], spill_rows=7, constant_memory=True,
+                           precompute_formulas=True)
+        with zipfile.ZipFile(buf) as z:
+            workbook = z.read('xl/workbook.xml').decode('utf-8')
+            sheets = [z.read('xl/worksheets/sheet{}.xml'.format(i)).decode('utf-8') for i in (1, 2, 3)]
+
+        self.assertIn('name="Big"', workbook)
+        self.assertIn('name="Big (2)"', workbook)
+        self.assertIn('name="Big (3)"', workbook)
+        for sheet in sheets:
+            self.assertIn('<pane xSplit="1" ySplit="2"', sheet)
+            self.assertIn('<is><t>Big</t></is>', sheet)
+            self.assertIn('<c r="A3" s="2" t="inlineStr"><is><t>A</t></is></c>', sheet)
+        self.assertIn('<c r="A7"><v>4</v></c>', sheets[0])
+        self.assertNotIn('r="A8"', sheets[0])
+        self.assertIn('<c r="A4"><v>5</v></c>', sheets[1])
+        self.assertIn("<f>SUM('Big'!B4:B7,'Big (2)'!B4:B7,B4:B5)</f><v>110</v>", sheets[2])
+
+        with self.assertRaises(ValueError):
+            full_page_to_excel(io.BytesIO(), html, spill_rows=3)
+
+        # Spilling is on by default, at the worksheet row limit. Without it a full worksheet is an error, rows are
+        # never dropped.
+        self.assertEqual(PageToExcel(io.BytesIO(), []).spill_rows, MAX_ROWS)
+        with mock.patch('convert_tables.MAX_ROWS', 7):
+            with self.assertRaises(ValueError):
+                full_page_to_excel(io.BytesIO(), html, spill_rows=None)
+
+    def test_precompute_formulas(self):
+        table_list = [u'<table><thead><tr><th>A</th><th>B</th><th>C</th></tr></thead><tbody>'
+                      u'<tr><td>1</td><td>$2.00</td><td data-excel="SUM ROW A-B">x</td></tr>'
+                      u'<tr><td>3</td><td>4</td><td data-excel="SUM ROW A,B">x</td></tr>'
+                      u'<tr><td colspan="2" data-excel="FORMULA RELATIVE colp001rowm001 * 2">x</td>'
+                      u'<td data-excel="FORMULA RAW IF(A2 > 0, 1, 0)">x</td></tr>'
+                      u'</tbody><tfoot><tr><td data-excel="SUM COL">x</td><td data-excel="SUM COL">x</td>'
+                      u'<td data-excel="SUM COL">x</td></tr></tfoot></table>']
+        buf = io.BytesIO()
+        table_list_to_excel(buf, table_list, to_excel_kwargs={'precompute_formulas': True, 'constant_memory': True})
+        with zipfile.ZipFile(buf) as z:
+            sheet = z.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            workbook = z.read('xl/workbook.xml').decode('utf-8')
+
+        self.assertIn('<c r="C2"><f>SUM(A2:B2)</f><v>3.0</v></c>', sheet)
+        self.assertIn('<c r="C3"><f>SUM(A3+B3)</f><v>7</v></c>', sheet)
+        self.assertIn('<c r="A4"><f>B3 * 2</f><v>8.0</v></c>', sheet)
+        # Not arithmetic, so no result
+        self.assertIn('<c r="C4"><f>IF(A2 &gt; 0, 1, 0)</f><v>0</v></c>', sheet)
+        self.assertIn('<c r="A5"><f>SUM(A2:A4)</f><v>12.0</v></c>', sheet)
+        self.assertIn('<c r="B5"><f>SUM(B2:B4)</f><v>6.0</v></c>', sheet)
+        # C4 has no result, so neither does the total of column C
+        self.assertIn('<c r="C5"><f>SUM(C2:C4)</f><v>0</v></c>', sheet)
+        # The merged formula cell is written once
+        self.assertEqual(sheet.count('<c r="A4"'), 1)
+        # Formulas without a result need recalculation when the workbook is opened
+        self.assertIn('fullCalcOnLoad="1"', workbook)
+
+        def calc_pr(table, **kwargs):
+            buf = io.BytesIO()
+            table_list_to_excel(buf, [table], to_excel_kwargs=kwargs)
+            with zipfile.ZipFile(buf) as z:
+                return re.search(r'<calcPr[^>]*/>', z.read('xl/workbook.xml').decode('utf-8')).group(0)
+
+        evaluated = u'<table><tbody><tr><td>1</td><td>2</td><td data-excel="SUM ROW A-B">x</td></tr></tbody></table>'
+        self.assertNotIn('fullCalcOnLoad', calc_pr(evaluated, precompute_formulas=True))
+        self.assertIn('fullCalcOnLoad="1"', calc_pr(evaluated))
+
+    def test_bad_formulas(self):
+        table_list = [u'<table><tbody><tr><td>1</td><td data-excel="FORMULA RELATIVE colp000rowm001 + 1">2</td>'
+                      u'<td data-excel="SUM ROW">3</td><td data-excel="SUM ROW A-A">x</td></tr></tbody></table>']
+        buf = io.BytesIO()
+        with self.assertLogs('htmltables2excel', 'WARNING') as logs:
+            table_list_to_excel(buf, table_list)
+        with zipfile.ZipFile(buf) as z:
+            sheet = z.read('xl/worksheets/sheet1.xml').decode('utf-8')
+
+        # Each bad formula is written as the value of its cell, the rest of the table is not lost
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('cell B1', logs.output[0])
+        self.assertIn('<c r="B1"><v>2</v></c>', sheet)
+        self.assertIn('<c r="C1"><v>3</v></c>', sheet)
+        self.assertIn('<f>SUM(A1:A1)</f>', sheet)
+
+    def test_parallel_parse(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        table_list = [u'<table id="t{}"><tbody><tr><td>{}%</td><td class="a">x</td></tr></tbody></table>'.format(i, i)
+                      for i in range(1, 6)]
+        expected = parse_tables_from_table_list(table_list)
+        self.assertEqual([x['rows'][0][0]['value'] for x in expected], [0.01, 0.02, 0.03, 0.04, 0.05])
+
+        with ThreadPoolExecutor(2) as executor:
+            threaded = parse_tables_from_table_list(table_list, executor=executor)
+        in_processes = parse_tables_from_table_list(table_list, workers=2)
+        for tables in (threaded, in_processes):
+            self.assertEqual([x['table'].attrs for x in tables], [x['table'].attrs for x in expected])
+            self.assertEqual([x['rows'] for x in tables], [x['rows'] for x in expected])
+
+    def test_constant_memory(self):
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        html = fp.read()
+        fp.close()
+
+        path = 'test_page_to_excel_constant_memory.xlsx'
+        full_page_to_excel(path, html, parser='stream', constant_memory=True, extra_headers=[['Header 1'], []])
+        with zipfile.ZipFile(path) as z:
+            sheet = z.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        os.remove(path)
+
+        # Strings are written in-line and the footer, which has colspans, is not dropped
+        self.assertIn('inlineStr', sheet)
+        self.assertIn('<mergeCell ref="A183:E183"/>', sheet)
+        self.assertIn('NB = 0.27%', sheet)
+
+    def test_locate_cell(self):
+        current_row = 13
+        current_column = 5
+        # noinspection SpellCheckingInspection
+        x = locate_cells('colm001rowp000 + colm002rowp001', current_row, current_column)
+        self.assertEqual(x, 'E14 + D15')
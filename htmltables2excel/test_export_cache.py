@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from export_cache import ExportCache, make_key
+
+
+class TestExportCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.n_builds = 0
+
+    def tearDown(self):
+        for file_name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file_name))
+        os.rmdir(self.directory)
+
+    def build(self, path, size=10):
+        self.n_builds += 1
+        time.sleep(0.05)
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * size)
+
+    def test_key(self):
+        self.assertEqual(make_key(['<table>'], {'a': 1, 'b': 2}), make_key(['<table>'], {'b': 2, 'a': 1}))
+        self.assertNotEqual(make_key(['<table>'], {}), make_key(['<table> '], {}))
+
+    def test_hit(self):
+        cache = ExportCache(self.directory, '/media/cache/')
+        key = make_key(['<table>'], {})
+        path, url = cache.get_or_create('report', key, self.build)
+        self.assertEqual(cache.get_or_create('report', key, self.build), (path, url))
+        self.assertEqual(self.n_builds, 1)
+        self.assertTrue(url.startswith('/media/cache/report_'))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])
+
+    def test_single_flight(self):
+        cache = ExportCache(self.directory)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_create('r', 'k', self.build)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.n_builds, 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_evict(self):
+        cache = ExportCache(self.directory, max_bytes=25)
+        first = cache.get_or_create('r', '1', self.build)[0]
+        os.utime(first, (time.time() - 100, time.time() - 100))
+        second = cache.get_or_create('r', '2', self.build)[0]
+        cache.get_or_create('r', '3', self.build)
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+        cache.max_age = 10
+        os.utime(second, (time.time() - 100, time.time() - 100))
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get('r', '2'))
+        self.assertIsNotNone(cache.get('r', '3'))
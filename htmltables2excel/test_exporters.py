@@ -0,0 +1,50 @@
+import json
+import unittest
+
+from exporters import CsvSink, ExcelSink, JsonLinesSink, export
+
+
+class TestExporters(unittest.TestCase):
+    def setUp(self):
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        self.html = fp.read()
+        fp.close()
+
+    def test_export(self):
+        import io
+        import os
+        import zipfile
+        from convert_tables import full_page_to_excel
+        from page_to_csv import stream_csv
+
+        csv_out = io.StringIO()
+        jsonl_out = io.StringIO()
+        xlsx_out = io.BytesIO()
+        counts = export(self.html, [ExcelSink(xlsx_out, work_sheet_names=['Labor', 'Revenue']),
+                                    CsvSink(csv_out), JsonLinesSink(jsonl_out)], parser='stream')
+        self.assertEqual(counts['tables'], 2)
+
+        expected_csv = io.StringIO()
+        stream_csv(expected_csv, self.html)
+        self.assertEqual(csv_out.getvalue(), expected_csv.getvalue())
+
+        lines = [json.loads(x) for x in jsonl_out.getvalue().splitlines()]
+        self.assertEqual(len([x for x in lines if x.get('section') == 'rows']), counts['rows'])
+        self.assertEqual([x for x in lines if 'section' not in x][1]['table'], 1)
+
+        # The same workbook as PageToExcel writes from its own parse
+        path = 'test_exporters.xlsx'
+        full_page_to_excel(path, self.html, parser='stream', work_sheet_names=['Labor', 'Revenue'])
+        with zipfile.ZipFile(path) as expected, zipfile.ZipFile(xlsx_out) as z:
+            for name in ('xl/worksheets/sheet1.xml', 'xl/worksheets/sheet2.xml', 'xl/sharedStrings.xml'):
+                self.assertEqual(z.read(name), expected.read(name))
+        os.remove(path)
+
+    def test_infer_types(self):
+        import io
+
+        jsonl_out = io.StringIO()
+        export(u'<table><thead><tr><th>Date</th></tr></thead><tbody><tr><td>2020-01-02</td></tr></tbody></table>',
+               [JsonLinesSink(jsonl_out)], infer_types=True)
+        lines = [json.loads(x) for x in jsonl_out.getvalue().splitlines()]
+        self.assertEqual(lines[-1], {'table': 0, 'section': 'rows', 'values': ['2020-01-02T00:00:00']})
@@ -0,0 +1,87 @@
+import unittest
+
+from cells import parse_cell, style_to_dict
+from formats import FormatRegistry, css_color, css_to_props
+
+
+class TestFormatRegistry(unittest.TestCase):
+    def setUp(self):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook('test_formats.xlsx', {'in_memory': True})
+
+    def tearDown(self):
+        self.workbook.close()
+        import os
+        os.remove('test_formats.xlsx')
+
+    def test_lazy(self):
+        n_formats = len(self.workbook.formats)
+        registry = FormatRegistry(self.workbook, {'red': {'font_color': 'red'}})
+        self.assertEqual(len(self.workbook.formats), n_formats)
+        self.assertIsNotNone(registry['red'])
+        self.assertIsNone(registry['td'])
+        self.assertEqual(len(self.workbook.formats), n_formats + 1)
+
+    def test_compose(self):
+        registry = FormatRegistry(self.workbook)
+        cell = {'value': 1.0, 'attrs': {'class': ['bold', 'unknown']}, 'tag': 'td', 'is_money': True}
+        the_format = registry.cell_format(cell)
+        self.assertTrue(the_format.bold)
+        self.assertEqual(the_format.num_format, '$#,##0.00')
+
+        # Same classes in any order, or from the cache, give the same Format
+        cell['attrs']['class'] = ['unknown', 'bold']
+        self.assertIs(registry.cell_format(cell), the_format)
+        self.assertIs(registry.compose(['bold', 'money']), the_format)
+
+        # dollars comes after money, so its number format wins
+        cell['attrs']['class'] = ['dollars']
+        self.assertEqual(registry.cell_format(cell).num_format, '$#,##0')
+
+    def test_same_props_share_a_format(self):
+        registry = FormatRegistry(self.workbook)
+        self.assertIs(registry.compose(['bold']), registry.compose(['th']))
+        self.assertIs(registry.compose(['bold', 'th']), registry['bold'])
+        self.assertIsNone(registry.cell_format({'attrs': {}, 'tag': 'td'}))
+
+    def test_css(self):
+        def props(style):
+            return css_to_props(style_to_dict(style))
+
+        self.assertEqual(props(u'color: #f00; background: url(a.png) #ccc; font-weight: 700; font-size: 16px'),
+                         {'font_color': '#FF0000', 'bg_color': '#CCCCCC', 'bold': True, 'font_size': 12.0})
+        self.assertEqual(props(u'text-align: center; vertical-align: middle; font-style: italic; '
+                               u'text-decoration: underline; font-family: "Arial Narrow", sans-serif'),
+                         {'align': 'center', 'valign': 'vcenter', 'italic': True, 'underline': 1,
+                          'font_name': 'Arial Narrow'})
+        self.assertEqual(props(u'border: 1px solid black; border-bottom: 2px double rgb(255, 0, 0)'),
+                         {'border': 1, 'border_color': '#000000', 'bottom': 6, 'bottom_color': '#FF0000'})
+        self.assertEqual(props(u'mso-number-format:"\\#\\,\\#\\#0\\.00"'), {'num_format': '#,##0.00'})
+        self.assertEqual(props(u'mso-number-format:Percent'), {'num_format': '0.00%'})
+        self.assertEqual(props(u'mso-number-format:"0.00;[Red]-0.00"'), {'num_format': '0.00;[Red]-0.00'})
+        # Not shown in excel, or not understood
+        self.assertEqual(props(u'color: transparent; padding: 3px; border: 1px; width: 50%'), {})
+        self.assertEqual(css_color(u'rgba(0, 0, 0, 0)'), None)
+        self.assertEqual(css_color(u'rgb(100%, 0%, 50%)'), '#FF0080')
+
+    def test_inline_styles(self):
+        registry = FormatRegistry(self.workbook, {'red': {'font_color': 'red'}})
+        cell = parse_cell(u'$5', {'class': ['red', 'bold'], 'style': 'color: blue; mso-number-format: "0.0"'}, 'td')
+        the_format = registry.cell_format(cell, 'header')
+        # The style comes after the default, the kind and the classes
+        self.assertEqual(the_format.num_format, '0.0')
+        self.assertTrue(the_format.bold)
+        self.assertIs(registry.compose(['header', 'money', 'bold'], {'font_color': '#0000FF', 'num_format': '0.0'}),
+                      the_format)
+
+        # Each style is translated once, and the same props share a Format
+        other = parse_cell(u'$6', {'class': ['bold', 'red'], 'style': 'mso-number-format:"0.0";color:#00f'}, 'td')
+        self.assertIs(registry.cell_format(other, 'header'), the_format)
+        self.assertEqual(len(registry.style_props), 2)
+
+        # A style with nothing excel can show changes nothing
+        plain = parse_cell(u'x', {'style': 'padding: 3px'}, 'td')
+        self.assertIs(registry.cell_format(plain, 'th'), registry['th'])
+
+        registry = FormatRegistry(self.workbook, inline_styles=False)
+        self.assertIs(registry.cell_format(cell), registry.compose(['money', 'bold']))
@@ -0,0 +1,54 @@
+import unittest
+
+from formulas import FormulaError, compile_formula, evaluate, make_formula
+
+
+class TestFormulas(unittest.TestCase):
+    def test_relative(self):
+        formula = make_formula("FORMULA RELATIVE IF(colm001rowp000 > 0, colm001rowm001/colp002rowp000, '{x}')", 13, 5)
+        self.assertEqual(formula, "=IF(E14 > 0, E13/H14, '{x}')")
+
+    def test_raw(self):
+        self.assertEqual(make_formula('FORMULA RAW IF(F13 > 0, (F13-E13)/F13, "")', 0, 0),
+                         '=IF(F13 > 0, (F13-E13)/F13, "")')
+
+    def test_compiled_once(self):
+        template = compile_formula('SUM COL')
+        self.assertIs(compile_formula('SUM COL'), template)
+        self.assertEqual(template.render(9, 27, first_data_row=2), '=SUM(AB3:AB9)')
+        self.assertEqual(template.render(10, 0, first_data_row=2), '=SUM(A3:A10)')
+
+    def test_evaluate(self):
+        values = {(4, 0): 1.5, (4, 1): u'', (4, 2): 2, (3, 3): u'text', (3, 0): 10}
+
+        def lookup(row, col):
+            return values.get((row, col))
+
+        def evaluate_at(formula_str, row, col):
+            template = compile_formula(formula_str)
+            return evaluate(template, template.render(row, col, 0), row, col, lookup, lambda c: 7.0 if c == 3 else None)
+
+        self.assertEqual(evaluate_at('SUM ROW A-C', 4, 3), 3.5)
+        self.assertEqual(evaluate_at('SUM ROW A,C', 4, 3), 3.5)
+        self.assertIsNone(evaluate_at('SUM ROW A-E', 4, 3))
+        self.assertEqual(evaluate_at('SUM COL', 9, 3), 7.0)
+        self.assertIsNone(evaluate_at('SUM COL', 9, 2))
+        self.assertAlmostEqual(
+            evaluate_at('FORMULA RELATIVE (colm003rowm001 - colm001rowp000) / colm003rowp000', 4, 3), 8 / 1.5)
+        self.assertEqual(evaluate_at('FORMULA RAW -A5 * 2 + B5', 0, 0), -3.0)
+        self.assertIsNone(evaluate_at('FORMULA RAW A4 + D4', 0, 0))
+        self.assertIsNone(evaluate_at('FORMULA RAW IF(A5 > 0, 1, 0)', 0, 0))
+        self.assertIsNone(evaluate_at('FORMULA RAW A5 / B5', 0, 0))
+        self.assertIsNone(evaluate_at('FORMULA RAW (A5', 0, 0))
+
+    def test_errors(self):
+        for formula_str in ('SUM ROW A', 'SUM ROW a-c', 'SUM', 'FORMULA RAW', 'AVERAGE COL', 'SUM COL A',
+                            'FORMULA RELATIVE colm01rowp000', 'FORMULA RELATIVE col,001rowp000'):
+            with self.assertRaises(FormulaError):
+                compile_formula(formula_str)
+
+        with self.assertRaises(FormulaError):
+            make_formula('SUM COL', 3, 2)
+
+        with self.assertRaises(FormulaError):
+            make_formula('FORMULA RELATIVE colm002rowp000', 3, 1)
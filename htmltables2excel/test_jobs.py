@@ -0,0 +1,48 @@
+import threading
+import unittest
+
+from jobs import DONE, ExecutorJobQueue, FAILED, LocalJobQueue, PENDING, UNKNOWN
+
+
+def fail():
+    raise ValueError('bad table')
+
+
+class TestJobQueues(unittest.TestCase):
+    def check_queue(self, queue):
+        job_id = queue.submit(sum, ([1, 2, 3],), meta={'file_url': '/media/x.xlsx'})
+        if isinstance(queue, ExecutorJobQueue):
+            queue.jobs[job_id][0].result()
+
+        status = queue.status(job_id)
+        self.assertEqual(status['state'], DONE)
+        self.assertEqual(status['result'], 6)
+        self.assertEqual(status['meta'], {'file_url': '/media/x.xlsx'})
+
+        job_id = queue.submit(fail)
+        if isinstance(queue, ExecutorJobQueue):
+            queue.jobs[job_id][0].result()
+        status = queue.status(job_id)
+        self.assertEqual(status['state'], FAILED)
+        self.assertIn('bad table', status['error'])
+
+        self.assertEqual(queue.status('nope')['state'], UNKNOWN)
+
+    def test_local(self):
+        self.check_queue(LocalJobQueue())
+
+    def test_executor(self):
+        queue = ExecutorJobQueue()
+        self.check_queue(queue)
+        queue.executor.shutdown()
+
+    def test_pending_and_forgotten(self):
+        event = threading.Event()
+        queue = ExecutorJobQueue(max_jobs=2)
+        first = queue.submit(event.wait)
+        self.assertEqual(queue.status(first)['state'], PENDING)
+        queue.submit(sum, ([],))
+        queue.submit(sum, ([],))
+        self.assertEqual(queue.status(first)['state'], UNKNOWN)
+        event.set()
+        queue.executor.shutdown()
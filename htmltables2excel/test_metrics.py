@@ -0,0 +1,61 @@
+import unittest
+
+from metrics import LoggingObserver, Observer, PrometheusCollector, as_metrics
+
+
+class ListObserver(Observer):
+    def __init__(self):
+        self.reports = []
+
+    def observe(self, metrics):
+        self.reports.append(metrics)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_nested(self):
+        observer = ListObserver()
+        metrics = as_metrics(observer)
+        self.assertIs(as_metrics(metrics), metrics)
+        self.assertIsNone(as_metrics(None))
+
+        with metrics.export():
+            with metrics.export():
+                with metrics.timed('parse'):
+                    pass
+                metrics.add('rows', 3)
+            self.assertEqual(observer.reports, [])
+            metrics.add('rows')
+        self.assertEqual(len(observer.reports), 1)
+        self.assertEqual(observer.reports[0]['counts'], {'rows': 4})
+        self.assertIn('parse', observer.reports[0]['phases'])
+        self.assertIn('process_peak_memory_bytes', observer.reports[0]['gauges'])
+        self.assertNotIn('peak_memory_bytes', observer.reports[0]['gauges'])
+
+    def test_trace_memory(self):
+        observer = ListObserver()
+        observer.trace_memory = True
+        metrics = as_metrics(observer)
+        for n in (10 ** 6, 10 ** 4):
+            with metrics.export():
+                data = bytearray(n)
+                del data
+        peaks = [x['gauges']['peak_memory_bytes'] for x in observer.reports]
+        # Each export has its own peak, the second is not the first again
+        self.assertGreaterEqual(peaks[0], 10 ** 6)
+        self.assertLess(peaks[1], 10 ** 6)
+
+    def test_prometheus(self):
+        collector = PrometheusCollector()
+        for _ in range(2):
+            collector.observe({'phases': {'write': 0.5}, 'counts': {'rows': 10}, 'gauges': {'bytes_written': 7}})
+        text = collector.exposition()
+        self.assertIn('htmltables2excel_exports_total 2\n', text)
+        self.assertIn('htmltables2excel_phase_seconds_sum{phase="write"} 1.0\n', text)
+        self.assertIn('htmltables2excel_rows_total 20\n', text)
+        self.assertIn('htmltables2excel_last_bytes_written 7\n', text)
+
+    def test_logging(self):
+        with self.assertLogs('htmltables2excel') as logs:
+            LoggingObserver().observe({'phases': {'close': 0.25}, 'counts': {'tables': 1},
+                                       'gauges': {'process_peak_memory_bytes': None}})
+        self.assertEqual(logs.output, ['INFO:htmltables2excel:Excel export: close=0.250s tables=1'])
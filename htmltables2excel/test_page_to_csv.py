@@ -0,0 +1,47 @@
+import csv
+import os
+import unittest
+
+from backends import iter_raw_tables
+from page_to_csv import page_to_csv, parse_raw_table
+
+
+class TestPageToCSV(unittest.TestCase):
+    def setUp(self):
+        fp = open(os.path.join('data_for_tests/table_to_csv_test_data.html'), 'rb')
+        self.html = fp.read()
+        fp.close()
+
+    def test_1(self):
+        path = 'page_to_csv.csv'
+        counts = page_to_csv(path, self.html)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(counts, {'tables': 2, 'rows': 291})
+
+        with open(path, newline='', encoding='utf-8') as fp:
+            rows = list(csv.reader(fp))
+        self.assertEqual(len(rows), 291)
+        self.assertEqual(rows[-2], ['', '', 'Total', '28,852.00'])
+        self.assertEqual(rows[180], [u'', u'', u'', u'', 'Total', '1,282.00', '3.50', '57,190.99', u'', 'NB = 0.27%'])
+        self.assertEqual(rows[179][9], '1121927')
+
+    def test_iter_rows(self):
+        path = 'page_to_csv.csv'
+        rows = list(page_to_csv(path, self.html, extra_headers=[['Report']], parser='stream', iter_rows=True,
+                                buffer_rows=7))
+        with open(path, newline='', encoding='utf-8') as fp:
+            self.assertEqual(list(csv.reader(fp)), rows)
+        self.assertEqual(len(rows), 292)
+        self.assertEqual(rows[0], ['Report'])
+        os.remove(path)
+
+    def test_raw_table(self):
+        for parser in ('html.parser', 'stream'):
+            rows = []
+            for table in iter_raw_tables(self.html, parser=parser):
+                rows += parse_raw_table(table)
+            self.assertEqual(len(rows), 291)
+            self.assertEqual(rows[-2], ['', '', 'Total', '28,852.00'])
+            self.assertEqual(rows[180], [u'', u'', u'', u'', 'Total', '1,282.00', '3.50', '57,190.99', u'',
+                                         'NB = 0.27%'])
+            self.assertEqual(rows[-1], [])
@@ -0,0 +1,83 @@
+import io
+import mmap
+import os
+import pathlib
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from backends import iter_raw_tables
+from page_to_csv import page_to_csv
+from sources import iter_file_chunks, open_page, read_page
+from stream_parser import iter_chunks
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.path = 'data_for_tests/table_to_csv_test_data.html'
+        with open(self.path, 'rb') as fp:
+            self.html = fp.read()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_tables(self, source, **kwargs):
+        return [(x.attrs, x.caption, x.headers, list(x.rows()), x.footers) for x in iter_raw_tables(source, **kwargs)]
+
+    def test_sources(self):
+        for parser in ('html.parser', 'stream'):
+            for kwargs in ({}, {'include_tables': [1]}, {'excluded_tables': ['.nope']}):
+                expected = self.read_tables(self.html, parser=parser, **kwargs)
+                self.assertEqual(self.read_tables(pathlib.Path(self.path), parser=parser, **kwargs), expected)
+                self.assertEqual(self.read_tables(io.BytesIO(self.html), parser=parser, **kwargs), expected)
+                with open(self.path, 'rb') as fp:
+                    self.assertEqual(self.read_tables(fp, parser=parser, **kwargs), expected)
+                with open(self.path, 'rb') as fp:
+                    page = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.assertEqual(self.read_tables(page, parser=parser, **kwargs), expected)
+                    page.close()
+
+    def test_chunks(self):
+        chunks = list(iter_file_chunks(io.BytesIO(self.html), 1000))
+        self.assertEqual(b''.join(chunks), self.html)
+        self.assertEqual(max(len(x) for x in chunks), 1000)
+
+        # A multi-byte character split between two chunks
+        text = u'<p>€</p>' * 1000
+        self.assertEqual(u''.join(iter_chunks(io.BytesIO(text.encode('utf-8')), 7)), text)
+
+        with open_page(pathlib.Path(self.path)) as page:
+            self.assertIsInstance(page, mmap.mmap)
+            self.assertEqual(page[:100], self.html[:100])
+        with open_page(io.BytesIO(self.html)) as page:
+            self.assertEqual(page, self.html)
+        self.assertEqual(read_page(pathlib.Path(self.path)), self.html)
+
+    def test_page_to_csv(self):
+        expected = os.path.join(self.directory, 'expected.csv')
+        path = os.path.join(self.directory, 'path.csv')
+        page_to_csv(expected, self.html, parser='stream')
+        page_to_csv(path, pathlib.Path(self.path), parser='stream')
+        with open(expected, 'rb') as fp1, open(path, 'rb') as fp2:
+            self.assertEqual(fp1.read(), fp2.read())
+
+    def test_memory(self):
+        from benchmarks import make_page
+
+        def peak_memory(rows):
+            source = os.path.join(self.directory, 'big.html')
+            with open(source, 'w', encoding='utf-8') as fp:
+                fp.write(make_page({'rows': rows, 'tables': 1}))
+            tracemalloc.start()
+            try:
+                page_to_csv(os.path.join(self.directory, 'big.csv'), pathlib.Path(source), parser='stream',
+                            buffer_rows=50)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        # Does not grow with the size of the file
+        peak_memory(100)
+        self.assertLess(peak_memory(3000), peak_memory(500) * 1.5)
@@ -0,0 +1,47 @@
+import unittest
+
+from cells import read_table
+from stream_parser import iter_raw_tables, iter_tables
+
+
+class TestStreamParser(unittest.TestCase):
+    def setUp(self):
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        self.html = fp.read()
+        fp.close()
+
+    def test_matches_beautiful_soup(self):
+        from backends import parse_tables
+
+        expected = [read_table(x) for x in parse_tables(self.html, parser='html.parser')]
+        n_tables = 0
+        for a, b in zip(iter_tables(self.html, chunk_size=1000), expected):
+            n_tables += 1
+            self.assertEqual(a['table'].attrs, b['table'].attrs)
+            self.assertEqual(a.get('caption'), b.get('caption'))
+            for section in ('headers', 'rows', 'footers'):
+                self.assertEqual(list(a[section]), b[section])
+        self.assertEqual(n_tables, len(expected))
+
+    def test_encoding(self):
+        import io
+        from test_backends import CP1252_PAGE, CP1252_TABLES
+
+        # The declared encoding is used when the whole page is streamed, however it is cut into chunks
+        pieces = [CP1252_PAGE[i:i + 10] for i in range(0, len(CP1252_PAGE), 10)]
+        for source in (CP1252_PAGE, io.BytesIO(CP1252_PAGE), pieces):
+            tables = [(x.attrs, x.caption, x.headers, list(x.rows()), x.footers)
+                      for x in iter_raw_tables(source, chunk_size=7)]
+            self.assertEqual(tables, CP1252_TABLES)
+
+    def test_excluded_tables(self):
+        tables = list(iter_raw_tables(self.html, ['wildcat_report_table']))
+        self.assertEqual(len(tables), 1)
+        self.assertEqual(tables[0].caption, 'Labor Costs')
+
+    def test_rows_are_streamed(self):
+        html = [u'<table><thead><tr><th>A</th></tr></thead><tbody>', u'<tr><td>$1,000.50</td></tr>']
+        events = iter(html)
+        table = next(iter_raw_tables(events))
+        self.assertEqual(table.headers, [[('th', {}, u'A')]])
+        self.assertEqual(next(table.rows()), [('td', {}, u'$1,000.50')])
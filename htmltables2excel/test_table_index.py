@@ -0,0 +1,82 @@
+import unittest
+
+import backends
+import test_backends
+from table_index import TableSelector, index_tables, page_encoding, select_tables
+
+PAGE = u'''<html><body>
+<!-- <table id="commented"></table> -->
+<script>var s = "<table id='scripted'>";</script>
+<TABLE id="labor" class="report summary" data-excel="FREEZE 2,0">
+<thead><tr><th>A</th></tr></thead><tbody><tr><td>1<table id="nested"><tr><td>x</td></tr></table></td></tr></tbody>
+</TABLE>
+<table id='revenue' class="report"><thead><tr><th>B</th></tr></thead><tbody><tr><td>2</td></tr></tbody></table>
+<table><thead><tr><th>C</th></tr></thead><tbody><tr><td>3</td></tr></tbody>
+</body></html>'''
+
+
+class TestTableIndex(unittest.TestCase):
+    def test_index(self):
+        entries = index_tables(PAGE)
+        self.assertEqual([x.attrs.get('id') for x in entries], ['labor', 'revenue', None])
+        self.assertEqual(entries[0].attrs['class'], ['report', 'summary'])
+        self.assertTrue(PAGE[entries[0].start:entries[0].end].endswith(u'</table></td></tr></tbody>\n</TABLE>'))
+        self.assertTrue(PAGE[entries[1].start:entries[1].end].startswith(u"<table id='revenue'"))
+        # Not closed
+        self.assertEqual(entries[2].end, len(PAGE))
+
+        data = PAGE.encode('utf-8')
+        self.assertEqual([(x.start, x.end) for x in index_tables(data)], [(x.start, x.end) for x in entries])
+
+    def test_select(self):
+        def ids(include=None, exclude=None):
+            return [x.attrs.get('id') for x in select_tables(PAGE, include, exclude)]
+
+        self.assertEqual(ids(), ['labor', 'revenue', None])
+        self.assertEqual(ids(['#revenue', 2]), ['revenue', None])
+        self.assertEqual(ids(['.report'], ['labor']), ['revenue'])
+        self.assertEqual(ids(exclude=['.summary', 2]), ['revenue'])
+        self.assertTrue(TableSelector().selects_all)
+        with self.assertRaises(ValueError):
+            TableSelector([1.5])
+
+    def test_only_selected_tables_are_parsed(self):
+        fragments = []
+
+        def recording_backend(html):
+            fragments.append(html)
+            return backends.BACKENDS['stream'](html)
+
+        backends.register_backend('recording', recording_backend)
+        try:
+            tables = list(backends.parse_tables(PAGE, ['labor'], parser='recording'))
+        finally:
+            del backends.BACKENDS['recording']
+
+        self.assertEqual([x['table'].attrs.get('id') for x in tables], ['revenue', None])
+        self.assertEqual(len(fragments), 2)
+        self.assertNotIn(u'labor', u''.join(fragments))
+
+    def test_same_tables(self):
+        for parser in ('html.parser', 'stream'):
+            expected = [(x.attrs, x.caption, x.headers, list(x.rows()), x.footers)
+                        for x in backends.iter_raw_tables(PAGE, parser=parser)][1:]
+            tables = [(x.attrs, x.caption, x.headers, list(x.rows()), x.footers)
+                      for x in backends.iter_raw_tables(PAGE, parser=parser, include_tables=[1, 2])]
+            self.assertEqual(tables, expected)
+
+    def test_encoding(self):
+        page = (u'<html><head><meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1"></head><body>'
+                u'<table id="a"><tr><td>Caf\xe9</td></tr></table>'
+                u'<table id="b"><tr><td>Cr\xe8me br\xfbl\xe9e</td><td>\xa31.00</td></tr></table></body></html>')
+        data = page.encode('latin-1')
+        self.assertEqual(page_encoding(data), 'iso8859-1')
+        self.assertEqual(page_encoding(b'<meta charset="utf-8"><table></table>'), 'utf-8')
+        self.assertIsNone(page_encoding(b'<meta charset="nope"><table></table>'))
+        self.assertIsNone(page_encoding(page))
+
+        for parser in sorted(backends.BACKENDS):
+            if parser in ('lxml', 'selectolax') and not test_backends.has_module(parser):
+                continue
+            tables = [list(x.rows()) for x in backends.iter_raw_tables(data, parser=parser, include_tables=['b'])]
+            self.assertEqual(tables, [[[('td', {}, u'Cr\xe8me br\xfbl\xe9e'), ('td', {}, u'\xa31.00')]]], parser)
@@ -0,0 +1,46 @@
+import unittest
+
+from table_json import decompress, parse_table_json, raw_cell
+
+
+class TestTableJson(unittest.TestCase):
+    def test_parse(self):
+        from cells import read_table
+        from backends import parse_tables
+
+        html = (u'<table id="t1"><caption>Labor</caption><thead><tr><th class="right_header">Cost</th></tr></thead>'
+                u'<tbody><tr><td>$1,200.50</td><td class="money bold" colspan="2">3%</td></tr></tbody>'
+                u'<tfoot><tr><th data-excel="SUM COL">4</th>'
+                u'<td style="color: red; mso-number-format:\'0.0;[Red]0.0\'">5</td></tr></tfoot></table>')
+        table = {'attrs': {'id': 't1'}, 'caption': 'Labor', 'headers': [[['Cost', 'right_header']]],
+                 'rows': [['$1,200.50', ['3%', 'money bold', 2]]],
+                 'footers': [[['4', None, None, 'SUM COL', 'th'],
+                              ['5', None, None, None, None, "color: red; mso-number-format:'0.0;[Red]0.0'"]]]}
+
+        expected = read_table(next(parse_tables(html)))
+        data = read_table(parse_table_json(table))
+        self.assertEqual(data['table'].attrs, expected['table'].attrs)
+        self.assertEqual(data['caption'], expected['caption'])
+        for section in ('headers', 'rows', 'footers'):
+            self.assertEqual(data[section], expected[section])
+        self.assertEqual(data['footers'][0][1]['attrs']['style'],
+                         {'color': 'red', 'mso-number-format': "'0.0;[Red]0.0'"})
+
+    def test_bad_cell(self):
+        with self.assertRaises(ValueError):
+            raw_cell({'text': 'x'}, 'td')
+
+    def test_decompress(self):
+        import gzip
+        import io
+
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+            fp.write(b'[]' * 1000)
+        self.assertEqual(decompress(buf.getvalue()), b'[]' * 1000)
+        with self.assertRaises(ValueError):
+            decompress(buf.getvalue(), max_size=100)
+        with self.assertRaises(ValueError):
+            decompress(b'not gzip')
+        with self.assertRaises(ValueError):
+            decompress(buf.getvalue()[:-10])
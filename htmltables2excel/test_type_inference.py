@@ -0,0 +1,45 @@
+import datetime
+import unittest
+
+from cells import parse_cell
+from type_inference import (CONVERTERS, DATE, FLOAT, INTEGER, MONEY, PERCENT, TEXT, classify, make_row_parser,
+                            parse_raw_table_typed)
+
+
+class TestTypeInference(unittest.TestCase):
+    def test_classify(self):
+        self.assertEqual(classify(u'$1,000.50'), MONEY)
+        self.assertEqual(classify(u'12.5%'), PERCENT)
+        self.assertEqual(classify(u'0301'), INTEGER)
+        self.assertEqual(classify(u'-1,282.00'), FLOAT)
+        self.assertEqual(classify(u'2015-09-01'), DATE)
+        self.assertEqual(classify(u'NB = 0.27%'), TEXT)
+        self.assertEqual(classify(u''), None)
+
+    def test_same_as_parse_cell(self):
+        values = [u'$1,000.50', u'$abc', u'12.5%', u'0%', u'0301', u'-5', u'1,282.00', u'1.', u'Total',
+                  u'', u'2015-13-45', u'NB = 0.27%', u'Infinity', u'.5']
+        for column_type in CONVERTERS:
+            parse_row = make_row_parser([column_type])
+            for value in values:
+                expected = parse_cell(value, {'class': ['a', '']}, 'td')
+                self.assertEqual(parse_row([('td', {'class': ['a', '']}, value)]), [expected])
+
+    def test_table(self):
+        from backends import iter_raw_tables
+
+        fp = open('data_for_tests/table_to_csv_test_data.html', 'rb')
+        html = fp.read()
+        fp.close()
+
+        table = next(iter_raw_tables(html))
+        data = parse_raw_table_typed(table)
+        self.assertEqual(data['column_types'],
+                         [INTEGER, TEXT, INTEGER, TEXT, DATE, FLOAT, FLOAT, MONEY, TEXT, INTEGER, TEXT])
+
+        rows = list(data['rows'])
+        self.assertEqual(len(rows), 178)
+        self.assertEqual(rows[0][4]['value'], datetime.datetime(2015, 9, 1))
+        self.assertEqual(rows[0][7], {'value': 260.5, 'attrs': {'style': {'text-align': 'right'}}, 'tag': 'td',
+                                      'is_money': True})
+        self.assertEqual(list(data['footers'])[0][3]['value'], 57190.99)
@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from uploads import UploadError, UploadStore, upload_to_excel
+
+
+class TestUploads(unittest.TestCase):
+    def setUp(self):
+        self.store = UploadStore(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.store.directory)
+
+    def upload(self, chunks):
+        upload_id = self.store.start()
+        # Out of order and repeated, as after a retry
+        for seq in reversed(range(len(chunks))):
+            self.store.append(upload_id, seq, json.dumps(chunks[seq]))
+        self.store.append(upload_id, 0, json.dumps(chunks[0]))
+        return upload_id
+
+    def test_tables(self):
+        from cells import read_table
+        from table_json import parse_table_json
+
+        chunks = [
+            {'table': 0, 'attrs': {'id': 't1'}, 'caption': 'Labor', 'headers': [['Name', 'Cost']],
+             'rows': [['a', '$1.00'], ['b', '$2.00']]},
+            {'table': 0, 'rows': [['c', '$3.00']],
+             'footers': [['Total', ['$6.00', 'bold', None, 'SUM COL', None, 'color: red']]]},
+            {'table': 1, 'rows': [['x', '5%']]},
+        ]
+        upload_id = self.upload(chunks)
+        tables = [read_table(x) for x in self.store.iter_tables(upload_id, len(chunks))]
+
+        expected = read_table(parse_table_json({
+            'attrs': {'id': 't1'}, 'caption': 'Labor', 'headers': [['Name', 'Cost']],
+            'rows': [['a', '$1.00'], ['b', '$2.00'], ['c', '$3.00']],
+            'footers': [['Total', ['$6.00', 'bold', None, 'SUM COL', None, 'color: red']]]}))
+        self.assertEqual(len(tables), 2)
+        for key in ('caption', 'headers', 'rows', 'footers'):
+            self.assertEqual(tables[0][key], expected[key])
+        self.assertEqual(tables[0]['footers'][0][1]['attrs']['style'], {'color': 'red'})
+        self.assertEqual(tables[1]['rows'][0][1]['value'], 0.05)
+
+        # Unread rows of a table are skipped
+        tables = list(self.store.iter_tables(upload_id, len(chunks)))
+        self.assertEqual(len(tables), 2)
+
+    def test_to_excel(self):
+        import zipfile
+
+        upload_id = self.upload([{'table': 0, 'headers': [['A']], 'rows': [['1']]}, {'table': 0, 'rows': [['2']]}])
+        digest = self.store.digest(upload_id, 2)
+        self.assertEqual(digest, self.store.digest(upload_id, 2))
+
+        path = os.path.join(self.store.directory, 'upload.xlsx')
+        upload_to_excel(path, self.store, upload_id, 2, {'constant_memory': True})
+        with zipfile.ZipFile(path) as z:
+            self.assertIn('xl/worksheets/sheet1.xml', z.namelist())
+        self.assertFalse(os.path.exists(self.store.path(upload_id)))
+
+    def test_errors(self):
+        upload_id = self.store.start()
+        with self.assertRaises(UploadError):
+            self.store.append('../' + upload_id, 0, '{"table": 0}')
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 0, '{"rows": []}')
+        with self.assertRaises(UploadError):
+            self.store.iter_tables(upload_id, 1).send(None)
+
+        self.store.max_bytes = 10
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 0, '{"table": 0, "rows": [["a"]]}')
+
+        # Resending a chunk of an upload at the limit replaces it, it does not count twice
+        upload_id = self.store.start()
+        self.store.max_bytes = len('{"table":0,"rows":[["a"]]}')
+        self.store.append(upload_id, 0, '{"table": 0, "rows": [["a"]]}')
+        self.store.append(upload_id, 0, '{"table": 0, "rows": [["a"]]}')
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 1, '{"table": 0}')
+
+        self.store.max_age = -1
+        self.store.expire()
+        with self.assertRaises(UploadError):
+            self.store.append(upload_id, 0, '{"table": 0}')
@@ -0,0 +1,235 @@
+"""
+Column-level type inference. cells.parse_cell() tries every conversion on every cell, and the exceptions it raises on
+text cells dominate the time spent parsing text-heavy tables. Instead, each column is profiled from a sample of the body
+rows (and the header when the sample is empty) and gets a converter for its type. A converter only has to match a
+precompiled regex for the common case and hands anything else, the outliers, to parse_cell(), so the parsed cells are
+the same as parse_cell() would give.
+
+The one exception is dates, which parse_cell() leaves as text. In a date column, ISO (2015-09-01) and US (09/01/2015)
+dates are converted to datetimes and flagged with 'is_date'.
+"""
+import datetime
+import re
+from collections import deque
+
+import six
+
+from cells import make_cell, parse_cell, parse_raw_row, TableInfo
+
+SAMPLE_SIZE = 100
+
+MONEY = 'money'
+PERCENT = 'percent'
+INTEGER = 'integer'
+FLOAT = 'float'
+DATE = 'date'
+TEXT = 'text'
+
+MONEY_RE = re.compile(r'^\$[+-]?(\d[\d,]*)?\.?\d+$')
+PERCENT_RE = re.compile(r'^[+-]?\d*\.?\d+%$')
+INTEGER_RE = re.compile(r'^\d+$')
+FLOAT_RE = re.compile(r'^[+-]?(\d[\d,]*)?\.?\d+$')
+ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+US_DATE_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+
+# Text starting with one of these might be a number to parse_cell(), e.g. "-5", ".5", "nan" or "Infinity"
+NUMBER_START = frozenset(u'0123456789$+-.iInN')
+
+
+def classify(s):
+    """
+    :param s: the cleaned text of a cell
+    :return: the type of the text or None when it is empty
+    """
+    if not s:
+        return None
+    if MONEY_RE.match(s):
+        return MONEY
+    if PERCENT_RE.match(s):
+        return PERCENT
+    if INTEGER_RE.match(s):
+        return INTEGER
+    if FLOAT_RE.match(s):
+        return FLOAT
+    if ISO_DATE_RE.match(s) or US_DATE_RE.match(s):
+        return DATE
+    return TEXT
+
+
+def header_hint(s):
+    """Guesses the type of an empty column from its header text."""
+    s = s.lower()
+    if '$' in s:
+        return MONEY
+    if '%' in s:
+        return PERCENT
+    if 'date' in s:
+        return DATE
+    return TEXT
+
+
+def column_type(counts):
+    """
+    :param counts: a dict of type -> number of sampled cells
+    :return: the type of the column
+    """
+    if not counts:
+        return None
+
+    if set(counts) <= {INTEGER, FLOAT}:
+        # Any float in an otherwise integer column makes it a float column
+        return FLOAT if FLOAT in counts else INTEGER
+
+    return max(sorted(counts), key=lambda x: counts[x])
+
+
+def iter_cols(row):
+    """
+    :param row: a raw row
+    :return: a generator of (col, tag, attrs, text). col allows for colspans.
+    """
+    col = 0
+    for tag, attrs, text in row:
+        yield col, tag, attrs, text
+        try:
+            col += max(1, int(attrs.get('colspan', 1)))
+        except ValueError:
+            col += 1
+
+
+def infer_column_types(headers, rows):
+    """
+    :param headers: raw header rows
+    :param rows: a sample of raw body rows
+    :return: a list with the type of each column
+    """
+    counts = {}
+    for row in rows:
+        for col, tag, attrs, text in iter_cols(row):
+            kind = classify(text)
+            if kind:
+                column_counts = counts.setdefault(col, {})
+                column_counts[kind] = column_counts.get(kind, 0) + 1
+
+    hints = {}
+    if headers:
+        for col, tag, attrs, text in iter_cols(headers[-1]):
+            hints[col] = header_hint(text)
+
+    n_cols = max([0] + [x + 1 for x in counts] + [x + 1 for x in hints])
+    return [column_type(counts.get(col)) or hints.get(col, TEXT) for col in range(n_cols)]
+
+
+# Converters -------------------------------------------------------------------------------------------------------
+def convert_money(s, attrs, tag):
+    if MONEY_RE.match(s):
+        return make_cell(float(s[1:].replace(u',', u'')), attrs, tag, MONEY, s)
+    return parse_cell(s, attrs, tag)
+
+
+def convert_percent(s, attrs, tag):
+    if PERCENT_RE.match(s):
+        return make_cell(float(s[0: -1]) / 100.0, attrs, tag, PERCENT, s)
+    return parse_cell(s, attrs, tag)
+
+
+def convert_number(s, attrs, tag):
+    if INTEGER_RE.match(s):
+        return make_cell(int(s), attrs, tag, text=s)
+    if FLOAT_RE.match(s):
+        return make_cell(float(s.replace(u',', u'')), attrs, tag, text=s)
+    return parse_cell(s, attrs, tag)
+
+
+def convert_date(s, attrs, tag):
+    match = ISO_DATE_RE.match(s)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = US_DATE_RE.match(s)
+        if match:
+            month, day, year = match.groups()
+
+    if match:
+        try:
+            value = datetime.datetime(int(year), int(month), int(day))
+        except ValueError:
+            pass
+        else:
+            return make_cell(value, attrs, tag, DATE, s)
+    return parse_cell(s, attrs, tag)
+
+
+def convert_text(s, attrs, tag):
+    if s and s[0] not in NUMBER_START and s[-1] != u'%':
+        return make_cell(s, attrs, tag)
+    return parse_cell(s, attrs, tag)
+
+
+CONVERTERS = {
+    MONEY: convert_money,
+    PERCENT: convert_percent,
+    INTEGER: convert_number,
+    FLOAT: convert_number,
+    DATE: convert_date,
+    TEXT: convert_text,
+}
+
+
+def make_row_parser(column_types):
+    """
+    :param column_types: a list of column types
+    :return: func(raw_row) -> a list of parsed cells
+    """
+    converters = [CONVERTERS[x] for x in column_types]
+    n_cols = len(converters)
+
+    def parse_row(row):
+        result = []
+        for col, tag, attrs, text in iter_cols(row):
+            if col < n_cols:
+                result.append(converters[col](six.text_type(text), attrs, tag))
+            else:
+                result.append(parse_cell(text, attrs, tag))
+        return result
+
+    return parse_row
+
+
+def _typed_rows(sample, rows, parse_row):
+    for row in sample:
+        yield parse_row(row)
+    for row in rows:
+        yield parse_row(row)
+
+
+def _typed_footers(table):
+    table.drain()
+    for row in table.footers:
+        yield parse_raw_row(row)
+
+
+def parse_raw_table_typed(table, sample_size=SAMPLE_SIZE):
+    """
+    The same as cells.parse_raw_table(), but the body rows are parsed by column type. The inferred types are listed
+    in data['column_types'].
+
+    :param table: a raw table
+    :param sample_size: the number of body rows read up front to infer the column types
+    :return: a table dict
+    """
+    rows = table.rows()
+    sample = deque()
+    for row in rows:
+        sample.append(row)
+        if len(sample) >= sample_size:
+            break
+
+    column_types = infer_column_types(table.headers, sample)
+    data = {'table': TableInfo(dict(table.attrs)), 'column_types': column_types}
+    if table.caption is not None:
+        data['caption'] = table.caption
+    data['headers'] = [parse_raw_row(row) for row in table.headers]
+    data['rows'] = _typed_rows(sample, rows, make_row_parser(column_types))
+    data['footers'] = _typed_footers(table)
+    return data
@@ -0,0 +1,260 @@
+"""
+Chunked uploads of the structured table payload (see table_json.py), for tables too big to post in one request.
+
+page_to_excel.js starts an upload, posts the rows of each table in chunks and then asks for the export with the
+upload id. Each chunk is kept in its own file, so resending a chunk after a failed request is harmless and any process
+that shares the directory can take the next chunk. The tables are read back one chunk at a time as raw tables (see
+cells.py), so the whole payload is never in memory.
+
+A chunk is a JSON object:
+
+    {"table": 0, "attrs": {...}, "caption": "...", "headers": [row, ...], "rows": [row, ...], "footers": [row, ...]}
+
+Chunks are numbered from 0 and the chunks of a table are consecutive. attrs, caption and headers are read from the
+first chunk of a table, the other keys can be left out.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import six
+
+from cells import parse_raw_table
+from convert_tables import PageToExcel
+from table_json import raw_cell, raw_rows
+
+# An upload is removed this many seconds after its last chunk
+MAX_AGE = 3600
+# The most bytes of chunks an upload may have
+MAX_UPLOAD = 512 * 2 ** 20
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+CHUNK_NAME = '{:08d}.json'
+
+
+class UploadError(ValueError):
+    pass
+
+
+class _ChunkReader(object):
+    """Reads the chunks of an upload in order, one ahead."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._next = None
+        self._read()
+
+    def _read(self):
+        try:
+            self._next = next(self._chunks)
+        except StopIteration:
+            self._next = None
+
+    def pop(self, table=None):
+        """
+        :param table: None or only return the next chunk if it is for this table
+        :return: the next chunk or None
+        """
+        chunk = self._next
+        if chunk is None or (table is not None and chunk['table'] != table):
+            return None
+        self._read()
+        return chunk
+
+
+class UploadedTable(object):
+    """
+    A raw table read from the chunks of an upload. Body rows are read one chunk at a time by rows() and footer rows
+    are complete once the body has been read.
+    """
+
+    def __init__(self, first, reader):
+        self.attrs = dict(first.get('attrs') or {})
+        self.caption = first.get('caption')
+        self.headers = raw_rows(first.get('headers'), 'th')
+        self.footers = []
+        self._table = first['table']
+        self._chunk = first
+        self._reader = reader
+
+    def rows(self):
+        while self._chunk is not None:
+            chunk = self._chunk
+            self.footers += raw_rows(chunk.get('footers'), 'td')
+            for row in chunk.get('rows') or []:
+                yield [raw_cell(cell, 'td') for cell in row]
+            self._chunk = self._reader.pop(self._table)
+
+    def drain(self):
+        for _ in self.rows():
+            pass
+
+
+class UploadStore(object):
+    def __init__(self, directory=None, max_age=MAX_AGE, max_bytes=MAX_UPLOAD):
+        """
+        :param directory: where the uploads are kept, defaults to a directory in the system temp dir
+        :param max_age: seconds after its last chunk that an unfinished upload is removed
+        :param max_bytes: the most bytes of chunks an upload may have
+        """
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'htmltables2excel_uploads')
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def path(self, upload_id):
+        if not isinstance(upload_id, six.string_types) or not UPLOAD_ID_RE.match(upload_id):
+            raise UploadError('Bad upload id: {!r}'.format(upload_id))
+        return os.path.join(self.directory, upload_id)
+
+    def start(self):
+        """
+        :return: the id of a new upload
+        """
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        os.mkdir(self.path(upload_id))
+        return upload_id
+
+    def append(self, upload_id, seq, chunk):
+        """
+        Stores a chunk. Storing the same chunk again replaces it.
+
+        :param upload_id: from start()
+        :param seq: the number of the chunk, from 0
+        :param chunk: the chunk as JSON text
+        """
+        path = self.path(upload_id)
+        if not os.path.isdir(path):
+            raise UploadError('Unknown upload: {}'.format(upload_id))
+
+        seq = int(seq)
+        data = json.loads(chunk)
+        if seq < 0 or not isinstance(data, dict) or not isinstance(data.get('table'), int):
+            raise UploadError('Bad chunk {} of upload {}'.format(seq, upload_id))
+
+        text = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        file_name = os.path.join(path, CHUNK_NAME.format(seq))
+        # A resent chunk replaces the one stored, so that one does not count
+        replaced = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+        if self.size(upload_id) - replaced + len(text) > self.max_bytes:
+            raise UploadError('Upload {} is bigger than {} bytes'.format(upload_id, self.max_bytes))
+
+        # Written under a temp name, so a chunk is never read half written
+        temp_name = '{}.{}.tmp'.format(file_name, uuid.uuid4().hex)
+        with open(temp_name, 'wb') as fp:
+            fp.write(text)
+        os.rename(temp_name, file_name)
+
+    def size(self, upload_id):
+        path = self.path(upload_id)
+        return sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+
+    def chunk_names(self, upload_id, n_chunks):
+        """
+        :param n_chunks: how many chunks were sent
+        :return: the chunk file names in order. Raises an UploadError if any are missing.
+        """
+        path = self.path(upload_id)
+        if not os.path.isdir(path):
+            raise UploadError('Unknown upload: {}'.format(upload_id))
+
+        names = [CHUNK_NAME.format(i) for i in range(int(n_chunks))]
+        missing = [i for i, name in enumerate(names) if not os.path.exists(os.path.join(path, name))]
+        if missing:
+            raise UploadError('Upload {} is missing chunks {}'.format(upload_id, missing[:10]))
+        return names
+
+    def digest(self, upload_id, n_chunks):
+        """
+        :return: a hash of the chunks, e.g. for export_cache.make_key()
+        """
+        path = self.path(upload_id)
+        h = hashlib.sha256()
+        for name in self.chunk_names(upload_id, n_chunks):
+            with open(os.path.join(path, name), 'rb') as fp:
+                h.update(fp.read())
+            h.update(b'\n')
+        return h.hexdigest()
+
+    def iter_chunks(self, upload_id, n_chunks):
+        path = self.path(upload_id)
+        for name in self.chunk_names(upload_id, n_chunks):
+            with open(os.path.join(path, name), 'rb') as fp:
+                yield json.loads(fp.read().decode('utf-8'))
+
+    def iter_raw_tables(self, upload_id, n_chunks):
+        """
+        :return: a generator of raw tables, see cells.py
+        """
+        reader = _ChunkReader(self.iter_chunks(upload_id, n_chunks))
+        while True:
+            first = reader.pop()
+            if first is None:
+                break
+            table = UploadedTable(first, reader)
+            yield table
+            table.drain()
+
+    def iter_tables(self, upload_id, n_chunks):
+        """
+        :return: a generator of table dicts ready for PageToExcel, see cells.parse_raw_table()
+        """
+        for table in self.iter_raw_tables(upload_id, n_chunks):
+            yield parse_raw_table(table)
+
+    def discard(self, upload_id):
+        shutil.rmtree(self.path(upload_id), ignore_errors=True)
+
+    def expire(self):
+        """Removes uploads with no new chunk for max_age seconds."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if UPLOAD_ID_RE.match(name) and now - os.path.getmtime(path) > self.max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+
+def upload_to_excel(file_full_path, store, upload_id, n_chunks, to_excel_kwargs=None, observer=None):
+    """
+    Writes an upload to excel, then removes the upload. Used like convert_tables.table_list_to_excel().
+
+    :param file_full_path: a path or a file-like object
+    :param store: the UploadStore
+    :param upload_id: from UploadStore.start()
+    :param n_chunks: how many chunks were sent
+    :param to_excel_kwargs: params for PageToExcel
+    :param observer: None or a metrics.Observer
+    :return: file_full_path
+    """
+    try:
+        PageToExcel(file_full_path, store.iter_tables(upload_id, n_chunks), observer=observer,
+                    **(to_excel_kwargs or {}))
+    finally:
+        store.discard(upload_id)
+    return file_full_path
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_store():
+    """
+    :return: the UploadStore in the system temp dir shared by the process
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = UploadStore()
+        return _default_store